@@ -3,19 +3,2273 @@ ADVANCED OSI TROUBLESHOOTING TRAINER - CLEAN VERSION
 Always 3 issues, simplified prompts
 """
 
+import argparse
+import math
 import random
 import subprocess
 import time
 import sys
 import os
+import re
 import json
+import queue
+import socket
+import http.client
 import textwrap
+import threading
+import uuid
+import asyncio
+import shlex
+import functools
+import contextvars
+import io
+import contextlib
+import tempfile
+import shutil
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+try:
+    import tomllib
+except ImportError:
+    tomllib = None
 from datetime import datetime
 from pathlib import Path
-from collections import defaultdict
+from collections import OrderedDict, defaultdict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+FanOutResult = namedtuple("FanOutResult", ["item", "value", "error"])
+BatchStep = namedtuple("BatchStep", ["command", "success", "code", "stdout", "stderr"])
+DiagnosticResult = namedtuple("DiagnosticResult", ["layer", "test", "container", "status", "latency"])
+TrainerEvent = namedtuple("TrainerEvent", ["kind", "container", "detail", "time"])
+CompiledCommand = namedtuple("CompiledCommand", ["text", "argv", "needs_shell"])
+
+SHELL_BUILTINS = {"cd", "export", "source", ".", "exit", "set", "unset", "eval", "exec", "wait",
+                  "for", "if", "while", "until", "case", "!", "{", "[["}
+
+EXEC_CALLER = contextvars.ContextVar("exec_caller", default="other")
+
+
+@contextlib.contextmanager
+def exec_caller(name):
+    """Label execs made inside the block, or decorated method, as coming from caller name"""
+    token = EXEC_CALLER.set(name)
+    try:
+        yield
+    finally:
+        EXEC_CALLER.reset(token)
+
+
+def fan_out(func, items, limit=4):
+    """Run func(item) for every item concurrently, at most limit at a time.
+    
+    Results come back in the order of items; an exception raised for one
+    item is reported in its FanOutResult instead of aborting the others.
+    """
+    items = list(items)
+    
+    def call(item):
+        try:
+            return FanOutResult(item, func(item), None)
+        except Exception as e:
+            return FanOutResult(item, None, str(e) or type(e).__name__)
+    
+    if len(items) <= 1 or limit <= 1:
+        return [call(item) for item in items]
+    contexts = [contextvars.copy_context() for _ in items]
+    with ThreadPoolExecutor(max_workers=min(limit, len(items))) as pool:
+        return list(pool.map(lambda item, context: context.run(call, item), items, contexts))
+
+
+def frame_command(command, token, err_file):
+    """Wrap command so its exit code and stderr follow its stdout between sentinels.
+    
+    The subshell drops OSI_EXEC, so daemons a step starts do not carry the
+    marker of the exec that framed it (see kill_orphans).
+    """
+    return (f"( unset OSI_EXEC; {command}\n) </dev/null 2>{err_file}; "
+            f"printf '\\n{token} %d\\n' $?; cat {err_file} 2>/dev/null; printf '\\n{token}\\n'\n")
+
+
+def frame_script(commands, token):
+    """Frame every command with token into one script that cleans up after itself"""
+    err_file = f"/tmp/.osi_batch_{token[:12]}.err"
+    return "".join(frame_command(cmd, token, err_file) for cmd in commands) + f"rm -f {err_file}\n"
+
+
+def has_unquoted(command, chars):
+    """Whether any of chars appears in command outside quotes and backslash escapes"""
+    quote = None
+    escaped = False
+    for ch in command:
+        if escaped:
+            escaped = False
+        elif quote:
+            if ch == quote:
+                quote = None
+            elif ch == "\\" and quote == '"':
+                escaped = True
+        elif ch == "\\":
+            escaped = True
+        elif ch in "'\"":
+            quote = ch
+        elif ch in chars:
+            return True
+    return False
+
+
+@functools.lru_cache(maxsize=1024)
+def compile_command(command):
+    """Tokenize command into a CompiledCommand.
+    
+    needs_shell is set when argv alone cannot reproduce the command: shell
+    operators or redirections, expansions (including unquoted globs, ~ and
+    braces), builtins or variable assignments. The executor compiles every
+    command after rendering it for the lab, so a repeated command costs one
+    lru_cache lookup; the catalog compiles inject templates only to decide
+    whether an issue needs a shell.
+    """
+    try:
+        argv = tuple(shlex.split(command))
+        operators = [tok for tok in shlex.shlex(command, posix=True, punctuation_chars=True)
+                     if tok and all(ch in "();<>|&" for ch in tok)]
+    except ValueError:
+        return CompiledCommand(command, (), True)
+    needs_shell = (not argv or bool(operators) or argv[0] in SHELL_BUILTINS or "=" in argv[0]
+                   or "$" in command or "`" in command or has_unquoted(command, "*?[~{"))
+    return CompiledCommand(command, argv, needs_shell)
+
+
+def parse_frames(output, token):
+    """Parse the output of framed commands into a list of (code, stdout, stderr)"""
+    frames = []
+    out, err, code = [], [], None
+    for line in output.splitlines():
+        if code is None:
+            if line.startswith(token + " "):
+                code = int(line.split()[1])
+            else:
+                out.append(line)
+        elif line == token:
+            frames.append((code, "\n".join(out).strip(), "\n".join(err).strip()))
+            out, err, code = [], [], None
+        else:
+            err.append(line)
+    return frames
+
+
+class ExecMetrics:
+    """Latency histograms and outcome counts of container execs.
+    
+    Series are labeled by container, command family and caller (see
+    exec_caller). Outcomes are "ok", "failed" (non-zero exit or exec error)
+    and "timeout". If trace_path is set, every exec is also appended to it
+    as one JSON line. With a limiter, its queue depth and waits are included.
+    """
+
+    BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+
+    def __init__(self, trace_path=None, limiter=None):
+        self.trace_path = trace_path
+        self.limiter = limiter
+        self.series = {}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def command_family(command):
+        """Short name for what a command does: its program, or "batch" for framed scripts"""
+        if command.startswith("( "):
+            return "batch"
+        words = command.replace("'", " ").replace('"', " ").split()
+        while words and words[0] in ("sh", "-c", "!", "("):
+            words = words[1:]
+        return os.path.basename(words[0]) if words else "empty"
+
+    def observe(self, container, command, seconds, result):
+        """Record one exec and its (success, stdout, stderr) result"""
+        success, _, err = result
+        outcome = "ok" if success else ("timeout" if "timed out" in err else "failed")
+        labels = (container, self.command_family(command), EXEC_CALLER.get())
+        with self.lock:
+            series = self.series.get(labels)
+            if series is None:
+                series = self.series[labels] = {"buckets": [0] * len(self.BUCKETS), "sum": 0.0, "count": 0,
+                                                "outcomes": {"ok": 0, "failed": 0, "timeout": 0}}
+            for i, bound in enumerate(self.BUCKETS):
+                if seconds <= bound:
+                    series["buckets"][i] += 1
+            series["sum"] += seconds
+            series["count"] += 1
+            series["outcomes"][outcome] += 1
+            if self.trace_path:
+                try:
+                    with open(self.trace_path, 'a') as f:
+                        f.write(json.dumps({"time": time.time(), "container": labels[0], "family": labels[1],
+                                            "caller": labels[2], "seconds": round(seconds, 6),
+                                            "outcome": outcome, "command": command[:200]}) + "\n")
+                except OSError:
+                    pass
+
+    def snapshot(self):
+        """Metrics as a JSON-serializable dict"""
+        with self.lock:
+            snapshot = {"buckets": self.BUCKETS, "execs": [
+                {"container": c, "family": f, "caller": caller, "count": s["count"],
+                 "sum": round(s["sum"], 6), "buckets": list(s["buckets"]), "outcomes": dict(s["outcomes"])}
+                for (c, f, caller), s in sorted(self.series.items())]}
+        if self.limiter is not None:
+            snapshot["limiter"] = self.limiter.snapshot()
+        return snapshot
+
+    def prometheus(self):
+        """Metrics in the Prometheus text exposition format"""
+        lines = ["# HELP osi_trainer_exec_seconds Latency of container execs.",
+                 "# TYPE osi_trainer_exec_seconds histogram"]
+        totals = ["# HELP osi_trainer_execs_total Container execs by outcome.",
+                  "# TYPE osi_trainer_execs_total counter"]
+        snapshot = self.snapshot()
+        for entry in snapshot["execs"]:
+            labels = f'container="{entry["container"]}",family="{entry["family"]}",caller="{entry["caller"]}"'
+            for bound, count in zip(self.BUCKETS, entry["buckets"]):
+                lines.append(f'osi_trainer_exec_seconds_bucket{{{labels},le="{bound}"}} {count}')
+            lines.append(f'osi_trainer_exec_seconds_bucket{{{labels},le="+Inf"}} {entry["count"]}')
+            lines.append(f"osi_trainer_exec_seconds_sum{{{labels}}} {entry['sum']}")
+            lines.append(f"osi_trainer_exec_seconds_count{{{labels}}} {entry['count']}")
+            for outcome, count in entry["outcomes"].items():
+                totals.append(f'osi_trainer_execs_total{{{labels},outcome="{outcome}"}} {count}')
+        limiter = snapshot.get("limiter")
+        if limiter is not None:
+            totals += ["# HELP osi_trainer_exec_queue_depth Execs waiting for a limiter slot.",
+                       "# TYPE osi_trainer_exec_queue_depth gauge",
+                       f"osi_trainer_exec_queue_depth {limiter['queue_depth']}",
+                       "# HELP osi_trainer_exec_queue_peak Most execs ever waiting at once.",
+                       "# TYPE osi_trainer_exec_queue_peak gauge",
+                       f"osi_trainer_exec_queue_peak {limiter['queue_peak']}",
+                       "# HELP osi_trainer_exec_queue_wait_seconds_total Time execs spent waiting for a slot.",
+                       "# TYPE osi_trainer_exec_queue_wait_seconds_total counter",
+                       f"osi_trainer_exec_queue_wait_seconds_total {limiter['wait_seconds']}",
+                       "# HELP osi_trainer_exec_queued_total Execs that had to wait for a slot.",
+                       "# TYPE osi_trainer_exec_queued_total counter",
+                       f"osi_trainer_exec_queued_total {limiter['queued']}"]
+        return "\n".join(lines + totals) + "\n"
+
+    def export(self, path):
+        """Write Prometheus text if path ends in .prom, otherwise a JSON snapshot"""
+        text = self.prometheus() if str(path).endswith(".prom") else json.dumps(self.snapshot(), indent=2) + "\n"
+        tmp = f"{path}.tmp"
+        with open(tmp, 'w') as f:
+            f.write(text)
+        os.replace(tmp, path)
+
+
+class ExecCache:
+    """Per-container cache of read-only command results, with TTL and LRU eviction.
+    
+    classify() sorts commands into "read" (safe to cache), "probe" (reaches
+    out to other hosts but changes nothing here; never cached) and "write".
+    A write against a container drops all of its cached results. Values are
+    always (success, stdout, stderr); exec_batch rebuilds BatchSteps on a hit.
+    """
+
+    READERS = {"cat", "grep", "which", "head", "tail", "wc", "ps", "netstat", "ss", "iptables-save",
+               "hostname", "uname", "true", "echo", "ls", "test", "[", "sort"}
+    PROBES = {"ping", "curl", "wget", "nc", "nslookup", "dig"}
+    IP_READ_VERBS = {"show", "list", "ls", "lst", "get"}
+    IPTABLES_READ_FLAGS = {"-L", "-S", "-C", "--list", "--list-rules", "--check"}
+
+    def __init__(self, ttl=5.0, max_entries=256):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def classify(cls, command):
+        """"read", "probe" or "write" for a shell command"""
+        if command.startswith("mkdir -p /tmp/.osi_diag_"):
+            return "probe"
+        if re.search(r"\d*>>?\s*(?!/dev/null|&)[^\s&]", command):
+            return "write"
+        kinds = set()
+        for segment in re.split(r"\|\|?|&&|;|\n", command):
+            words = segment.replace("(", " ").replace(")", " ").split()
+            while words and words[0] in ("!", "sh", "-c"):
+                words = words[1:]
+            words = [w.strip("'\"") for w in words]
+            if not words:
+                continue
+            program = os.path.basename(words[0])
+            if program in cls.PROBES:
+                kinds.add("probe")
+            elif program == "ip":
+                args = [w for w in words[1:] if not w.startswith("-")]
+                kinds.add("read" if len(args) < 2 or args[1] in cls.IP_READ_VERBS else "write")
+            elif program == "iptables":
+                flags = [w for w in words[1:] if w.startswith("--") or (w[:1] == "-" and w[1:2].isupper())]
+                kinds.add("read" if flags and all(f in cls.IPTABLES_READ_FLAGS for f in flags) else "write")
+            elif program in cls.READERS:
+                kinds.add("read")
+            else:
+                kinds.add("write")
+        if "write" in kinds:
+            return "write"
+        return "probe" if "probe" in kinds else "read"
+
+    def get(self, container, command):
+        """Cached result for command in container, or None"""
+        if self.ttl <= 0:
+            return None
+        with self.lock:
+            entry = self.entries.get((container, command))
+            if entry is None or entry[0] < time.monotonic():
+                self.misses += 1
+                return None
+            self.entries.move_to_end((container, command))
+            self.hits += 1
+            return entry[1]
+
+    def put(self, container, command, value):
+        """Remember the result of a read-only command"""
+        if self.ttl <= 0:
+            return
+        with self.lock:
+            self.entries[(container, command)] = (time.monotonic() + self.ttl, value)
+            self.entries.move_to_end((container, command))
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, container=None):
+        """Forget the cached results of one container, or of all"""
+        with self.lock:
+            for key in [key for key in self.entries if container is None or key[0] == container]:
+                del self.entries[key]
+
+
+class ExecBudgets:
+    """Per-command-class exec deadlines that adapt to observed latency.
+    
+    Like a TCP retransmission timer, a class's deadline is its smoothed
+    latency plus four mean deviations, kept within the class's floor and
+    ceiling; the default applies until the class has samples. A timeout
+    doubles the class's deadline, up to the ceiling, until the next exec of
+    that class completes.
+    """
+
+    CLASSES = {"liveness": (1, 2, 10), "read": (2, 5, 30), "probe": (5, 8, 30),
+               "write": (2, 5, 30), "install": (30, 120, 600)}
+    INSTALLERS = {"apk", "apt-get", "apt", "pip", "pip3", "yum", "dnf"}
+    LIVENESS = {"echo", "true", "which", "hostname"}
+    IDEMPOTENT = {"liveness", "read"}
+    RETRIES = 1
+    STEP_GUESS = 1.0
 
-class AdvancedOsiTrainer:
     def __init__(self):
+        self.estimates = {}
+        self.backoff = {}
+        self.lock = threading.Lock()
+
+    @classmethod
+    def classify(cls, command):
+        """Deadline class of a command: "install", "liveness", or its ExecCache class"""
+        kind = ExecCache.classify(command)
+        family = ExecMetrics.command_family(command)
+        if family in cls.INSTALLERS:
+            return "install"
+        if kind == "write":
+            return kind
+        if family in cls.LIVENESS and not re.search(r"[|;&]", command):
+            return "liveness"
+        return kind
+
+    def observe(self, kind, seconds, timed_out=False):
+        """Fold one exec of class kind into its estimate"""
+        with self.lock:
+            if timed_out:
+                self.backoff[kind] = min(self.backoff.get(kind, 1) * 2, 64)
+                return
+            self.backoff.pop(kind, None)
+            srtt, rttvar = self.estimates.get(kind, (None, None))
+            if srtt is None:
+                srtt, rttvar = seconds, seconds / 2
+            else:
+                rttvar = 0.75 * rttvar + 0.25 * abs(srtt - seconds)
+                srtt = 0.875 * srtt + 0.125 * seconds
+            self.estimates[kind] = (srtt, rttvar)
+
+    def expected(self, kind):
+        """Learned latency bound of a class without its floor, or STEP_GUESS before any sample"""
+        with self.lock:
+            srtt, rttvar = self.estimates.get(kind, (None, None))
+        return self.STEP_GUESS if srtt is None else srtt + 4 * rttvar
+
+    def deadline(self, kind):
+        """Seconds to allow one exec of class kind"""
+        floor, default, ceiling = self.CLASSES.get(kind, self.CLASSES["write"])
+        with self.lock:
+            srtt, rttvar = self.estimates.get(kind, (None, None))
+            backoff = self.backoff.get(kind, 1)
+        base = default if srtt is None else min(max(srtt + 4 * rttvar, floor), ceiling)
+        return min(base * backoff, ceiling)
+
+    def batch_deadline(self, commands):
+        """Seconds to allow a framed script: the largest step floor plus every step's expected latency"""
+        kinds = [self.classify(cmd) for cmd in commands]
+        floor = max((self.CLASSES.get(kind, self.CLASSES["write"])[0] for kind in kinds), default=1)
+        return floor + sum(self.expected(kind) for kind in kinds)
+
+    def snapshot(self):
+        """Current deadline per class"""
+        return {kind: round(self.deadline(kind), 3) for kind in self.CLASSES}
+
+
+class ExecLimiter:
+    """Process-wide limit on execs in flight against the Docker daemon.
+    
+    A semaphore caps concurrent execs and an optional token bucket caps how
+    many start per second, so a wide fan-out queues here instead of piling
+    onto dockerd. Commands on persistent session shells hold a slot as well.
+Waiting callers are counted to report the queue depth.
+    """
+
+    def __init__(self, max_concurrent=16, rate=0.0, burst=None):
+        self.max_concurrent = max(1, max_concurrent)
+        self.rate = rate
+        self.burst = burst or self.max_concurrent
+        self.slots = threading.BoundedSemaphore(self.max_concurrent)
+        self.tokens = float(self.burst)
+        self.refilled = time.monotonic()
+        self.lock = threading.Lock()
+        self.waiting = 0
+        self.in_flight = 0
+        self.peak_waiting = 0
+        self.queued = 0
+        self.wait_seconds = 0.0
+
+    def _take_token(self):
+        """Take a start token; returns 0, or the seconds until one is available"""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.refilled) * self.rate)
+            self.refilled = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0
+            return (1 - self.tokens) / self.rate
+
+    @contextlib.contextmanager
+    def slot(self):
+        """Hold one exec slot for the duration of the block"""
+        started = time.monotonic()
+        with self.lock:
+            self.waiting += 1
+            self.peak_waiting = max(self.peak_waiting, self.waiting)
+        try:
+            if self.rate > 0:
+                delay = self._take_token()
+                while delay:
+                    time.sleep(delay)
+                    delay = self._take_token()
+            self.slots.acquire()
+        finally:
+            with self.lock:
+                self.waiting -= 1
+        waited = time.monotonic() - started
+        with self.lock:
+            self.in_flight += 1
+            self.wait_seconds += waited
+            if waited > 0.001:
+                self.queued += 1
+        try:
+            yield waited
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+            self.slots.release()
+
+    def snapshot(self):
+        """Limits, current queue depth and cumulative queueing"""
+        with self.lock:
+            return {"max_concurrent": self.max_concurrent, "rate": self.rate, "in_flight": self.in_flight,
+                    "queue_depth": self.waiting, "queue_peak": self.peak_waiting, "queued": self.queued,
+                    "wait_seconds": round(self.wait_seconds, 6)}
+
+
+class PerfProbe:
+    """Python 3 latency and throughput probe run between lab containers.
+    
+    The target runs a short-lived sink that streams data for downloads and
+    counts received bytes for uploads. The source times HTTP requests to the
+    target's web server and one transfer in each direction, then prints its
+    raw measurements as JSON.
+    """
+
+    SINK_PORT = 5201
+
+    SINK = textwrap.dedent("""\
+        import socket, sys, time
+        port, life = int(sys.argv[1]), float(sys.argv[2])
+        s = socket.socket()
+        s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        s.bind(("", port))
+        s.listen(8)
+        end = time.time() + life
+        chunk = b"x" * 65536
+        while time.time() < end:
+            s.settimeout(max(0.1, end - time.time()))
+            try:
+                c, _ = s.accept()
+            except OSError:
+                continue
+            c.settimeout(15)
+            try:
+                line = b""
+                while not line.endswith(b"\\n"):
+                    line += c.recv(1) or b"\\n"
+                if line.startswith(b"d"):
+                    stop = time.time() + float(line[1:])
+                    while time.time() < stop:
+                        c.sendall(chunk)
+                else:
+                    total = 0
+                    while True:
+                        data = c.recv(65536)
+                        if not data:
+                            break
+                        total += len(data)
+                    c.sendall(str(total).encode())
+            except OSError:
+                pass
+            c.close()
+        """)
+
+    PROBE = textwrap.dedent("""\
+        import json, socket, sys, time
+        host, port, sink = sys.argv[1], int(sys.argv[2]), int(sys.argv[3])
+        count, seconds = int(sys.argv[4]), float(sys.argv[5])
+        rtts, errors = [], 0
+        for _ in range(count):
+            start = time.time()
+            try:
+                c = socket.create_connection((host, port), timeout=3)
+                c.sendall(b"HEAD / HTTP/1.0\\r\\n\\r\\n")
+                if not c.recv(1):
+                    raise OSError("no response")
+                rtts.append((time.time() - start) * 1000)
+                c.close()
+            except OSError:
+                errors += 1
+        def transfer(mode):
+            try:
+                c = socket.create_connection((host, sink), timeout=15)
+                start, total = time.time(), 0
+                if mode == "d":
+                    c.sendall(b"d%f\\n" % seconds)
+                    while True:
+                        data = c.recv(65536)
+                        if not data:
+                            break
+                        total += len(data)
+                else:
+                    c.sendall(b"u\\n")
+                    chunk = b"x" * 65536
+                    while time.time() - start < seconds:
+                        c.sendall(chunk)
+                    c.shutdown(socket.SHUT_WR)
+                    total = int(c.recv(64) or 0)
+                return total / max(time.time() - start, 1e-6)
+            except (OSError, ValueError):
+                return None
+        print(json.dumps({"rtt_ms": rtts, "errors": errors,
+                          "download_bps": transfer("d"), "upload_bps": transfer("u")}))
+        """)
+
+    @classmethod
+    def sink_command(cls, life):
+        """Shell command starting the sink in the background for life seconds"""
+        return f"python3 -c {shlex.quote(cls.SINK)} {cls.SINK_PORT} {life} >/dev/null 2>&1 &"
+
+    @classmethod
+    def probe_command(cls, host, port, count, seconds):
+        """Command running the probe against host"""
+        return f"python3 -c {shlex.quote(cls.PROBE)} {host} {port} {cls.SINK_PORT} {count} {seconds}"
+
+    @staticmethod
+    def summarize(output):
+        """p50/p99 RTT, throughput and error count from the probe output, or None"""
+        try:
+            raw = json.loads(output.strip().splitlines()[-1])
+        except (IndexError, ValueError):
+            return None
+        rtts = raw.get("rtt_ms") or []
+        return {
+            "rtt_p50_ms": round(percentile(rtts, 50), 2) if rtts else None,
+            "rtt_p99_ms": round(percentile(rtts, 99), 2) if rtts else None,
+            "download_bps": raw.get("download_bps"),
+            "upload_bps": raw.get("upload_bps"),
+            "errors": raw.get("errors", 0),
+        }
+
+    @staticmethod
+    def degraded(before, after, factor=1.5):
+        """Whether after is clearly worse than before: slower, lossier or lower throughput"""
+        if before is None or after is None:
+            return after is None and before is not None
+        if after["errors"] > before["errors"]:
+            return True
+        if before["rtt_p50_ms"] and (after["rtt_p50_ms"] or 0) > before["rtt_p50_ms"] * factor:
+            return True
+        for key in ("download_bps", "upload_bps"):
+            if before[key] and (after[key] or 0) < before[key] / factor:
+                return True
+        return False
+
+
+class ShellSession:
+    """Long-lived `docker exec -i <container> sh -s` shared by many commands.
+
+    Each command runs in a subshell and is framed by a random sentinel line
+    that carries its exit code, followed by its stderr and a closing sentinel.
+    A command run with a marker executes under OSI_EXEC=<marker>, so what
+    it leaves running after a timeout can be found and killed.
+    """
+
+    def __init__(self, container, shell="sh"):
+        self.container = container
+        self.shell = shell
+        self.proc = None
+        self.lines = None
+        self.err_file = f"/tmp/.osi_session_{uuid.uuid4().hex[:12]}.err"
+        self.lock = threading.Lock()
+
+    def alive(self):
+        """Check if the shell process is still running"""
+        return self.proc is not None and self.proc.poll() is None
+
+    def start(self):
+        """Spawn the shell and its reader thread"""
+        self.proc = subprocess.Popen(
+            ["docker", "exec", "-i", self.container, self.shell, "-s"],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+            text=True, bufsize=1)
+        self.lines = queue.Queue()
+        reader = threading.Thread(target=self._pump, args=(self.proc.stdout, self.lines), daemon=True)
+        reader.start()
+
+    @staticmethod
+    def _pump(stream, sink):
+        for line in iter(stream.readline, ""):
+            sink.put(line)
+        sink.put(None)
+
+    def close(self):
+        """Terminate the shell"""
+        if self.proc is None:
+            return
+        try:
+            self.proc.stdin.write(f"rm -f {self.err_file}\n")
+            self.proc.stdin.close()
+            self.proc.wait(timeout=1)
+        except (OSError, subprocess.TimeoutExpired):
+            pass
+        if self.proc.poll() is None:
+            self.proc.kill()
+        self.proc.wait()
+        self.proc = None
+
+    def run(self, command, timeout=5, marker=None):
+        """Run command, returning (success, stdout, stderr) like exec_container"""
+        if marker is not None:
+            command = f"env OSI_EXEC={marker} {self.shell} -c {shlex.quote(command)}"
+        with self.lock:
+            for attempt in range(2):
+                if not self.alive():
+                    try:
+                        self.start()
+                    except OSError as e:
+                        return False, "", str(e)
+                try:
+                    return self._roundtrip(command, timeout)
+                except BrokenPipeError:
+                    self.close()
+            return False, "", f"Shell session to {self.container} could not be established"
+
+    def _roundtrip(self, command, timeout):
+        token = uuid.uuid4().hex
+        self.proc.stdin.write(frame_command(command, token, self.err_file))
+        self.proc.stdin.flush()
+
+        deadline = time.monotonic() + timeout
+        out, err, code = [], [], None
+        while True:
+            try:
+                line = self.lines.get(timeout=max(deadline - time.monotonic(), 0))
+            except queue.Empty:
+                self.close()
+                return False, "", f"Command '{command}' timed out after {timeout} seconds"
+            if line is None:
+                self.close()
+                return False, "".join(out).strip(), "Shell session closed unexpectedly"
+            if code is None:
+                if line.startswith(token + " "):
+                    code = int(line.split()[1])
+                else:
+                    out.append(line)
+            elif line.rstrip("\n") == token:
+                return code == 0, "".join(out).strip(), "".join(err).strip()
+            else:
+                err.append(line)
+
+
+class DockerAPIError(Exception):
+    """Error response from the Docker Engine API"""
+
+    def __init__(self, status, message):
+        super().__init__(f"Docker API error {status}: {message}")
+        self.status = status
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """HTTP connection over a unix domain socket"""
+
+    def __init__(self, socket_path, timeout=5):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(self.socket_path)
+        self.sock = sock
+
+
+class DockerAPIClient:
+    """Minimal Docker Engine API client with keep-alive connection pooling"""
+
+    def __init__(self, socket_path="/var/run/docker.sock", pool_size=4, timeout=5):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self.pool = queue.LifoQueue(maxsize=pool_size)
+
+    def _acquire(self, timeout):
+        try:
+            conn = self.pool.get_nowait()
+            conn.timeout = timeout
+            if conn.sock is not None:
+                conn.sock.settimeout(timeout)
+            return conn, True
+        except queue.Empty:
+            return UnixHTTPConnection(self.socket_path, timeout=timeout), False
+
+    def _release(self, conn, response):
+        if response.will_close:
+            conn.close()
+            return
+        try:
+            self.pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def request(self, method, path, body=None, timeout=None):
+        """Send a request and return (status, headers, raw body)"""
+        payload = json.dumps(body).encode() if body is not None else None
+        headers = {"Content-Type": "application/json"} if payload is not None else {}
+        timeout = timeout or self.timeout
+        
+        while True:
+            conn, reused = self._acquire(timeout)
+            try:
+                conn.request(method, path, body=payload, headers=headers)
+                response = conn.getresponse()
+                data = response.read()
+            except (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError):
+                conn.close()
+                if reused:
+                    continue
+                raise
+            except Exception:
+                conn.close()
+                raise
+            self._release(conn, response)
+            if response.status >= 400:
+                try:
+                    message = json.loads(data).get("message", "")
+                except ValueError:
+                    message = data.decode(errors="replace")
+                raise DockerAPIError(response.status, message)
+            return response.status, response.headers, data
+
+    def close(self):
+        """Close all pooled connections"""
+        while True:
+            try:
+                self.pool.get_nowait().close()
+            except queue.Empty:
+                return
+
+    def ping(self):
+        """Check that the daemon answers"""
+        return self.request("GET", "/_ping")[2] == b"OK"
+
+    def list_containers(self):
+        """List running containers"""
+        return json.loads(self.request("GET", "/containers/json")[2])
+
+    def exec_create(self, container, cmd, env=None):
+        """Create an exec instance and return its ID"""
+        _, _, data = self.request("POST", f"/containers/{container}/exec", {
+            "AttachStdout": True,
+            "AttachStderr": True,
+            "Cmd": cmd,
+            "Env": env or []
+        })
+        return json.loads(data)["Id"]
+
+    def exec_start(self, exec_id, timeout=None):
+        """Start an exec instance and return its demultiplexed (stdout, stderr)"""
+        _, _, data = self.request("POST", f"/exec/{exec_id}/start",
+                                  {"Detach": False, "Tty": False}, timeout=timeout)
+        return self.demux(data)
+
+    def exec_inspect(self, exec_id):
+        """Inspect an exec instance"""
+        return json.loads(self.request("GET", f"/exec/{exec_id}/json")[2])
+
+    @staticmethod
+    def demux(data):
+        """Split a multiplexed attach stream into (stdout, stderr) bytes"""
+        streams = {1: bytearray(), 2: bytearray()}
+        pos = 0
+        while pos + 8 <= len(data):
+            stream_type = data[pos]
+            size = int.from_bytes(data[pos + 4:pos + 8], "big")
+            chunk = data[pos + 8:pos + 8 + size]
+            streams.get(stream_type, streams[1]).extend(chunk)
+            pos += 8 + size
+        return bytes(streams[1]), bytes(streams[2])
+
+    def inspect_container(self, container):
+        """Inspect a container"""
+        return json.loads(self.request("GET", f"/containers/{container}/json")[2])
+
+    def exec_run(self, container, cmd, timeout=None, env=None):
+        """Run cmd in container and return (success, stdout, stderr)"""
+        exec_id = self.exec_create(container, cmd, env)
+        out, err = self.exec_start(exec_id, timeout=timeout)
+        code = self.exec_inspect(exec_id).get("ExitCode")
+        return code == 0, out.decode(errors="replace").strip(), err.decode(errors="replace").strip()
+
+
+class FakeDocker:
+    """In-process stand-in for DockerAPIClient, used by the bench command.
+    
+    Every exec sleeps for latency plus up to jitter seconds and fails with
+    probability failure_rate. Framed batch scripts are answered step by
+    step with the canned output of a clean container, so the trainer's own
+    overhead and exec count can be measured without Docker. The only state
+    kept is which fault pack faults are active per container: a fault's
+    inject command activates it, its fix clears it, and its verify
+    predicate fails while it is active.
+    """
+
+    CLEAN = [
+        ("iptables-save", "*filter\n:INPUT ACCEPT [0:0]\n:FORWARD ACCEPT [0:0]\n:OUTPUT ACCEPT [0:0]\nCOMMIT"),
+        ("ip -j addr", '[{{"ifname": "eth0", "addr_info": [{{"family": "inet", "local": "{ip}", '
+                       '"prefixlen": 16, "scope": "global"}}]}}]'),
+        ("ip -j route", "[]"),
+        ("ip -j link", '[{{"ifname": "eth0", "flags": ["BROADCAST", "MULTICAST", "UP", "LOWER_UP"], '
+                       '"mtu": 1500, "address": "02:42:ac:13:00:02"}}]'),
+        ("cat /etc/resolv.conf", "nameserver 127.0.0.11"),
+        ("cat /etc/profile", "export PATH=/usr/local/sbin:/usr/local/bin:/usr/sbin:/usr/bin:/sbin:/bin"),
+        ("for k in", "net/ipv4/ip_forward=0\nnet/ipv4/tcp_keepalive_time=7200\nnet/ipv4/icmp_echo_ignore_all=0"),
+        ("ip link show", "2: eth0: <BROADCAST,MULTICAST,UP,LOWER_UP> mtu 1500\n    link/ether 02:42:ac:13:00:02"),
+        ("ip -4 addr show", "inet {ip}/16 scope global eth0"),
+        ("ping", "64 bytes from {ip}: seq=0 ttl=64 time=0.081 ms"),
+        ("curl", "0.002"),
+        ("echo test", "test"),
+    ]
+
+    def __init__(self, containers, latency=0.02, jitter=0.01, failure_rate=0.0, seed=None, fault_dirs=None):
+        self.containers = dict(containers)
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.execs = 0
+        self.fault_dirs = fault_dirs
+        self.fault_map = {}
+        self.active = defaultdict(set)
+
+    def close(self):
+        """Nothing to release"""
+
+    def reset(self):
+        """Forget all active faults, as if the containers had been recreated"""
+        with self.lock:
+            self.active.clear()
+
+    def inspect_container(self, container):
+        """Fixed identity, so the probe cache stays valid between runs"""
+        return {"Id": f"fake-{container}", "Image": "sha256:fake", "State": {"StartedAt": "fake"}}
+
+    def fault_commands(self, container):
+        """Map every fault's inject, fix and verify command, as run in container, to (fault id, role)"""
+        with self.lock:
+            if container not in self.fault_map:
+                packs = FaultPacks(self.fault_dirs if self.fault_dirs is not None else default_fault_dirs())
+                ip = self.containers.get(container, "127.0.0.1")
+                commands = {}
+                for layer in packs.layers():
+                    for fault in packs.load(layer):
+                        for role, key in (("inject", "cmd"), ("fix", "fix"), ("verify", "verify")):
+                            commands[fault[key].replace("{ip}", ip)] = (fault["id"], role)
+                self.fault_map[container] = commands
+            return self.fault_map[container]
+
+    def respond(self, container, command):
+        """Canned (exit code, stdout) for one command"""
+        fault = self.fault_commands(container).get(command)
+        if fault is not None:
+            fault_id, role = fault
+            with self.lock:
+                if role == "verify":
+                    return (1 if fault_id in self.active[container] else 0), ""
+                if role == "inject":
+                    self.active[container].add(fault_id)
+                else:
+                    self.active[container].discard(fault_id)
+            return 0, ""
+        for prefix, output in self.CLEAN:
+            if command.startswith(prefix):
+                return 0, output.format(ip=self.containers.get(container, "127.0.0.1"))
+        return 0, ""
+
+    def exec_run(self, container, cmd, timeout=None, env=None):
+        """Pretend to run cmd in container and return (success, stdout, stderr)"""
+        with self.lock:
+            self.execs += 1
+            delay = self.latency + self.rng.random() * self.jitter
+            failed = self.rng.random() < self.failure_rate
+        if timeout is not None and delay > timeout:
+            time.sleep(timeout)
+            raise socket.timeout("timed out")
+        time.sleep(delay)
+        if failed:
+            return False, "", "fake docker: injected failure"
+        
+        script = cmd[-1] if cmd[1:2] == ["-c"] else " ".join(cmd)
+        match = re.search(r"printf '\\n(\w+) %d\\n'", script)
+        if match is None:
+            code, out = self.respond(container, script.strip())
+            return code == 0, out, ""
+        
+        token = match.group(1)
+        output = []
+        for command in re.findall(r"^\( unset OSI_EXEC; (.*?)\n\) </dev/null 2>", script, re.M | re.S):
+            code, out = self.respond(container, command.strip())
+            output.append(f"{out}\n{token} {code}\n{token}")
+        return True, "\n".join(output), ""
+
+
+class ProbeCache:
+    """On-disk cache of container probe results.
+    
+    Entries are keyed by container name and only trusted while the container
+    identity (ID, image and start time) is unchanged, so recreating or
+    restarting a container invalidates them automatically.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        self.lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        """Load cached probes from file"""
+        try:
+            if self.path.exists():
+                with open(self.path, 'r') as f:
+                    self.entries = json.load(f)
+        except (OSError, ValueError):
+            self.entries = {}
+
+    def save(self):
+        """Save cached probes to file"""
+        with self.lock:
+            data = json.dumps(self.entries)
+        try:
+            tmp = self.path.with_name(self.path.name + ".tmp")
+            with open(tmp, 'w') as f:
+                f.write(data)
+            os.replace(tmp, self.path)
+        except OSError:
+            pass
+
+    def get(self, container, identity, field):
+        """Cached value of field, or None if missing or stale"""
+        if identity is None:
+            return None
+        with self.lock:
+            entry = self.entries.get(container)
+            if entry is None or entry.get("identity") != identity:
+                return None
+            return entry.get(field)
+
+    def put(self, container, identity, field, value):
+        """Store a probe result for the current container identity"""
+        if identity is None:
+            return
+        with self.lock:
+            entry = self.entries.get(container)
+            if entry is None or entry.get("identity") != identity:
+                entry = self.entries[container] = {"identity": identity}
+            entry[field] = value
+
+    def invalidate(self, container, field=None):
+        """Forget one field, or everything, cached for a container"""
+        with self.lock:
+            if field is None:
+                self.entries.pop(container, None)
+            elif container in self.entries:
+                self.entries[container].pop(field, None)
+
+
+class CatalogError(Exception):
+    """No valid issue selection exists for a scenario request"""
+
+
+class FaultPackError(CatalogError):
+    """A fault pack file is missing, unreadable or malformed"""
+
+
+def default_fault_dirs():
+    """The bundled faults directory followed by any in OSI_TRAINER_FAULTS"""
+    extra = os.environ.get("OSI_TRAINER_FAULTS", "")
+    return [Path(__file__).resolve().parent / "faults"] + [Path(d) for d in extra.split(os.pathsep) if d]
+
+
+class FaultPacks:
+    """Directories of fault pack files, read lazily one layer at a time.
+    
+    A pack is a JSON or TOML file named layer<N>*.json / layer<N>*.toml
+    holding {"layer": N, "faults": [...]}. Every fault has a stable "id", a
+    "name", and "inject", "fix" and "verify" commands, plus optional
+    "difficulty" and "requires". In fix and verify, {ip} stands for the
+    container's own address. Only file names are read up front. A pack is
+    parsed and validated the first time its layer is needed, and the result
+    is shared by every FaultPacks in the process until the file changes.
+    """
+
+    PATTERN = re.compile(r"layer(\d+)[^/]*\.(json|toml)$")
+    REQUIRED = ("id", "name", "inject", "fix", "verify")
+    parsed = {}
+    parsed_lock = threading.Lock()
+
+    def __init__(self, directories):
+        self.files = defaultdict(list)
+        for directory in directories:
+            try:
+                names = sorted(os.listdir(directory))
+            except OSError:
+                continue
+            for name in names:
+                match = self.PATTERN.match(name)
+                if match:
+                    self.files[int(match.group(1))].append(Path(directory) / name)
+
+    def layers(self):
+        """Layers that have at least one pack"""
+        return sorted(self.files)
+
+    def load(self, layer):
+        """Validated faults of one layer, in pack order"""
+        faults = []
+        for path in self.files.get(layer, []):
+            faults.extend(self.read(path, layer))
+        return faults
+
+    @classmethod
+    def read(cls, path, layer):
+        """Parse and validate one pack, reusing the result while the file is unchanged"""
+        try:
+            stat = path.stat()
+            key = (str(path), stat.st_mtime_ns, stat.st_size)
+        except OSError as e:
+            raise FaultPackError(f"{path}: {e}")
+        with cls.parsed_lock:
+            if key in cls.parsed:
+                return cls.parsed[key]
+        
+        try:
+            if path.suffix == ".toml":
+                if tomllib is None:
+                    raise FaultPackError(f"{path}: TOML packs need Python 3.11 or newer")
+                with open(path, 'rb') as f:
+                    pack = tomllib.load(f)
+            else:
+                with open(path, 'r') as f:
+                    pack = json.load(f)
+        except (OSError, ValueError) as e:
+            raise FaultPackError(f"{path}: {e}")
+        
+        if pack.get("layer") != layer or not isinstance(pack.get("faults"), list):
+            raise FaultPackError(f"{path}: expected {{\"layer\": {layer}, \"faults\": [...]}}")
+        faults = []
+        for i, fault in enumerate(pack["faults"]):
+            missing = [field for field in cls.REQUIRED if not isinstance(fault.get(field), str) or not fault[field]]
+            if missing:
+                raise FaultPackError(f"{path}: fault {fault.get('id', i)} lacks {', '.join(missing)}")
+            if not isinstance(fault.get("difficulty", 1), int) or not all(
+                    isinstance(fault.get(field, []), list) for field in ("requires", "needs", "provides", "breaks", "tags")):
+                raise FaultPackError(f"{path}: fault {fault['id']} has a malformed difficulty or fact list")
+            faults.append({
+                "id": fault["id"],
+                "name": fault["name"],
+                "cmd": fault["inject"],
+                "fix": fault["fix"],
+                "verify": fault["verify"],
+                "difficulty": fault.get("difficulty", 1),
+                "requires": list(fault.get("requires", [])),
+                "needs": list(fault.get("needs", [])),
+                "provides": list(fault.get("provides", [])),
+                "breaks": list(fault.get("breaks", [])),
+                "tags": list(fault.get("tags", [])),
+                "compiled": compile_command(fault["inject"]),
+            })
+        with cls.parsed_lock:
+            cls.parsed[key] = faults
+        return faults
+
+
+class FaultScheduler:
+    """Orders faults so that each injection succeeds and no fault undoes another.
+    
+    Faults describe their interaction with named facts about a container
+    (such as "link-up" or "own-address"): "needs" must hold when the fault is
+    injected, "provides" are facts the fault creates and that must survive,
+    and "breaks" are facts it destroys. Facts no fault provides hold on a
+    clean container. A consumer must be injected before anything that breaks
+    what it needs, and a breaker before any fault whose effect it would
+    destroy. Combinations that admit no such order are conflicting.
+    """
+
+    @staticmethod
+    def order(faults, applied=()):
+        """faults in a valid injection order after the already applied ones, or None on conflict"""
+        faults = list(faults)
+        provided = {fact for fault in list(applied) + faults for fact in fault.get("provides", [])}
+        for fault in faults:
+            for a in applied:
+                if set(fault.get("breaks", [])) & set(a.get("provides", [])):
+                    return None
+                if set(fault.get("needs", [])) & set(a.get("breaks", [])) - provided:
+                    return None
+        
+        after = defaultdict(set)
+        for i, fault in enumerate(faults):
+            for j, other in enumerate(faults):
+                if i == j:
+                    continue
+                if set(fault.get("needs", [])) & set(other.get("breaks", [])):
+                    after[i].add(j)
+                if set(fault.get("needs", [])) & set(other.get("provides", [])):
+                    after[j].add(i)
+                if set(fault.get("provides", [])) & set(other.get("breaks", [])):
+                    after[j].add(i)
+        
+        incoming = defaultdict(int)
+        for i in after:
+            for j in after[i]:
+                incoming[j] += 1
+        ready = [i for i in range(len(faults)) if not incoming[i]]
+        order = []
+        while ready:
+            i = ready.pop(0)
+            order.append(faults[i])
+            for j in sorted(after[i]):
+                incoming[j] -= 1
+                if not incoming[j]:
+                    ready.append(j)
+            ready.sort()
+        return order if len(order) == len(faults) else None
+
+
+class IssueCatalog:
+    """Index of the fault packs by layer, stable ID and container compatibility.
+    
+    Layers are loaded from the packs on first use. An issue lists what it
+    needs in "requires": tool names or NET_ADMIN from the capability probes,
+    or "web_server" for containers whose baseline has a running http.server.
+    An issue whose command needs a shell (or runs sh itself) also requires
+    "shell". Unknown traits count as satisfied.
+    """
+
+    def __init__(self, packs):
+        self.packs = packs
+        self.by_layer = {}
+        self.by_id = {}
+        self.compat = {}
+        self.lock = threading.Lock()
+
+    def layer(self, layer):
+        """Issues of one layer, loading its packs if needed"""
+        with self.lock:
+            if layer not in self.by_layer:
+                issues = self.packs.load(layer)
+                for issue in issues:
+                    if issue["id"] in self.by_id:
+                        raise FaultPackError(f"duplicate fault id {issue['id']}")
+                    self.by_id[issue["id"]] = (layer, issue)
+                self.by_layer[layer] = issues
+            return self.by_layer[layer]
+
+    def get(self, issue_id):
+        """(layer, issue) for a stable issue ID, or None"""
+        if issue_id not in self.by_id:
+            for layer in self.packs.layers():
+                self.layer(layer)
+        return self.by_id.get(issue_id)
+
+    @staticmethod
+    def missing_requirements(issue, traits):
+        """Requirements of issue that traits rule out"""
+        requires = list(issue.get("requires", []))
+        compiled = issue.get("compiled")
+        if compiled is not None and (compiled.needs_shell or compiled.argv[:1] == ("sh",)):
+            requires.append("shell")
+        return [req for req in requires if traits.get(req) is False]
+
+    def compatible(self, container, traits, layer):
+        """Issues of a layer that can be injected into container, computed once per traits"""
+        key = (container, tuple(sorted(traits.items())), layer)
+        if key not in self.compat:
+            self.compat[key] = [issue for issue in self.layer(layer)
+                                if not self.missing_requirements(issue, traits)]
+        return self.compat[key]
+
+    def candidates(self, layers, container, traits, max_difficulty=None, tag=None):
+        """Weighted (layer, issue, weight) candidates; each layer gets an equal share"""
+        per_layer = []
+        for layer in sorted(set(layers)):
+            issues = [issue for issue in self.compatible(container, traits, layer)
+                      if (max_difficulty is None or issue.get("difficulty", 1) <= max_difficulty)
+                      and (tag is None or tag in issue.get("tags", []))]
+            if issues:
+                per_layer.append((layer, issues))
+        
+        if not per_layer:
+            raise CatalogError(self.explain(layers, container, traits))
+        
+        result = []
+        for layer, issues in per_layer:
+            for issue in issues:
+                result.append((layer, issue, 1.0 / len(per_layer) / len(issues)))
+        return result
+
+    def explain(self, layers, container, traits):
+        """Why no issue from layers fits container"""
+        reasons = []
+        for layer in sorted(set(layers)):
+            issues = self.layer(layer)
+            if not issues:
+                reasons.append(f"layer {layer} has no issues")
+                continue
+            needs = sorted({req for issue in issues for req in self.missing_requirements(issue, traits)})
+            reasons.append(f"layer {layer} needs {', '.join(needs) or 'a lower difficulty'}")
+        return f"no issue can be injected into {container}: " + "; ".join(reasons)
+
+    def sample(self, layers, container, count, traits, rng=random, exclude=(), max_difficulty=None, applied=(),
+               tag=None):
+        """Pick up to count distinct (layer, issue) pairs by weight, skipping excluded IDs.
+        
+        Issues that would conflict with earlier picks or with the applied
+        issues are passed over, and the picks come back in the injection
+        order chosen by FaultScheduler.
+        """
+        pool = [c for c in self.candidates(layers, container, traits, max_difficulty, tag)
+                if c[1]["id"] not in exclude]
+        picks = []
+        layer_of = {}
+        while pool and len(picks) < count:
+            r = rng.random() * sum(weight for _, _, weight in pool)
+            for i, (_, _, weight) in enumerate(pool):
+                r -= weight
+                if r < 0:
+                    break
+            layer, issue, _ = pool.pop(i)
+            if FaultScheduler.order(picks + [issue], applied) is not None:
+                picks.append(issue)
+                layer_of[issue["id"]] = layer
+        return [(layer_of[issue["id"]], issue) for issue in FaultScheduler.order(picks, applied)]
+
+
+class RecordingError(Exception):
+    """A scenario recording cannot be read"""
+
+
+class ScenarioRecording:
+    """A scenario captured for exact replay.
+    
+    Holds the seed, the layers and, per container, the ordered faults with
+    their inject, fix and verify commands as written in the fault packs.
+    Commands keep the default lab's addresses and the {ip} placeholder, so
+    one recording can be re-staged on any lab. compile() turns it into one
+    framed script per container once; every replay reuses those scripts.
+    """
+    
+    VERSION = 1
+    FIELDS = ("id", "layer", "name", "inject", "fix", "verify")
+    KEEP = 50
+    
+    def __init__(self, seed, layers, containers, created=None):
+        self.seed = seed
+        self.layers = sorted(set(layers))
+        self.containers = containers
+        self.created = created or datetime.now().isoformat()
+        self.scripts = None
+    
+    @classmethod
+    def capture(cls, catalog, seed, layers, issues):
+        """Record issue records from build_scenario in the order they were injected"""
+        containers = {}
+        for record in issues:
+            layer, issue = catalog.get(record["id"])
+            containers.setdefault(record["container"], []).append({
+                "id": issue["id"], "layer": layer, "name": issue["name"],
+                "inject": issue["cmd"], "fix": issue["fix"], "verify": issue.get("verify", "")
+            })
+        return cls(seed, layers, containers)
+    
+    def to_dict(self):
+        return {"version": self.VERSION, "created": self.created, "seed": self.seed,
+                "layers": self.layers, "containers": self.containers}
+    
+    @classmethod
+    def from_dict(cls, data):
+        if not isinstance(data, dict) or data.get("version") != cls.VERSION:
+            raise RecordingError(f"Not a version {cls.VERSION} scenario recording")
+        containers = data.get("containers")
+        if not isinstance(containers, dict):
+            raise RecordingError("Recording has no containers")
+        for container, faults in containers.items():
+            if not isinstance(faults, list):
+                raise RecordingError(f"{container}: faults must be a list")
+            for fault in faults:
+                missing = [f for f in cls.FIELDS if not isinstance(fault, dict) or f not in fault]
+                if missing:
+                    raise RecordingError(f"{container}: fault is missing {', '.join(missing)}")
+        return cls(data.get("seed"), data.get("layers", []), containers, data.get("created"))
+    
+    @classmethod
+    def load(cls, path):
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            raise RecordingError(f"{path}: {e}")
+        return cls.from_dict(data)
+    
+    def save(self, path):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(".tmp")
+        with open(tmp, "w") as f:
+            json.dump(self.to_dict(), f, indent=2)
+        os.replace(tmp, path)
+        return path
+    
+    def compile(self):
+        """Map container to (inject commands, framed script, token), built on first use"""
+        if self.scripts is None:
+            token = uuid.uuid4().hex
+            self.scripts = {}
+            for container, faults in self.containers.items():
+                commands = [fault["inject"] for fault in faults]
+                self.scripts[container] = (commands, frame_script(commands, token), token)
+        return self.scripts
+
+
+class HistoryAnalytics:
+    """Streaming aggregates over training events, kept inside the stats snapshot.
+    
+    Every issue event updates a fixed set of counters for its layer, issue,
+    container and "overall": lifetime created/fixed counts, a time-to-fix
+    histogram with fixed buckets, and a window over the last WINDOW
+    scenarios of that key with running sums. Updates and summaries cost the
+    same however long the history is. Trend is the window's success rate
+    minus the lifetime rate, in percentage points.
+    """
+
+    TTF_BUCKETS = [5, 10, 20, 30, 45, 60, 90, 120, 180, 300, 600, 900, 1200, 1800, 3600, 7200, 14400, 86400]
+    WINDOW = 20
+    GROUPS = ("layers", "issues", "containers")
+
+    @classmethod
+    def empty(cls):
+        return {"overall": cls.new_aggregate(), "layers": {}, "issues": {}, "containers": {}}
+
+    @classmethod
+    def new_aggregate(cls):
+        return {"created": 0, "fixed": 0, "ttf": [0] * (len(cls.TTF_BUCKETS) + 1),
+                "window": {}, "window_created": 0, "window_fixed": 0}
+
+    @classmethod
+    def aggregates(cls, data, event):
+        """The aggregates an event updates, created on first use"""
+        keys = [("layers", event.get("layer")), ("issues", event.get("issue")),
+                ("containers", event.get("container"))]
+        found = [data["overall"]]
+        for group, key in keys:
+            if key is not None:
+                found.append(data[group].setdefault(str(key), cls.new_aggregate()))
+        return found
+
+    @classmethod
+    def apply(cls, data, event):
+        """Fold an issue_created or issue_fixed event into data"""
+        kind = event.get("type")
+        if kind not in ("issue_created", "issue_fixed"):
+            return
+        scenario = event.get("scenario")
+        for agg in cls.aggregates(data, event):
+            window = agg["window"]
+            if kind == "issue_created":
+                agg["created"] += 1
+                if scenario is None:
+                    continue
+                if scenario not in window:
+                    window[scenario] = [0, 0]
+                    if len(window) > cls.WINDOW:
+                        oldest = next(iter(window))
+                        evicted = window.pop(oldest)
+                        agg["window_created"] -= evicted[0]
+                        agg["window_fixed"] -= evicted[1]
+                window[scenario][0] += 1
+                agg["window_created"] += 1
+            else:
+                agg["fixed"] += 1
+                seconds = event.get("seconds")
+                if seconds is not None:
+                    bucket = next((i for i, bound in enumerate(cls.TTF_BUCKETS) if seconds <= bound),
+                                  len(cls.TTF_BUCKETS))
+                    agg["ttf"][bucket] += 1
+                if scenario in window:
+                    window[scenario][1] += 1
+                    agg["window_fixed"] += 1
+
+    @classmethod
+    def quantile(cls, counts, q):
+        """Approximate q-quantile in seconds from histogram counts, or None if empty"""
+        total = sum(counts)
+        if not total:
+            return None
+        target = q * total
+        seen = 0
+        for i, count in enumerate(counts):
+            if count and seen + count >= target:
+                if i == len(cls.TTF_BUCKETS):
+                    return float(cls.TTF_BUCKETS[-1])
+                lower = cls.TTF_BUCKETS[i - 1] if i else 0
+                return lower + (cls.TTF_BUCKETS[i] - lower) * (target - seen) / count
+            seen += count
+        return None
+
+    @classmethod
+    def describe(cls, agg):
+        """Summary of one aggregate"""
+        rate = agg["fixed"] / agg["created"] * 100 if agg["created"] else None
+        window_rate = agg["window_fixed"] / agg["window_created"] * 100 if agg["window_created"] else None
+        return {
+            "created": agg["created"],
+            "fixed": agg["fixed"],
+            "success_rate": None if rate is None else round(rate, 1),
+            "median_ttf": cls.rounded(cls.quantile(agg["ttf"], 0.5)),
+            "p90_ttf": cls.rounded(cls.quantile(agg["ttf"], 0.9)),
+            "recent_scenarios": len(agg["window"]),
+            "recent_success_rate": None if window_rate is None else round(window_rate, 1),
+            "trend": None if rate is None or window_rate is None else round(window_rate - rate, 1),
+        }
+
+    @staticmethod
+    def rounded(value):
+        return None if value is None else round(value, 1)
+
+    @classmethod
+    def summary(cls, data):
+        """Summary of every aggregate, keyed like data"""
+        result = {"overall": cls.describe(data["overall"])}
+        for group in cls.GROUPS:
+            result[group] = {key: cls.describe(agg) for key, agg in sorted(data.get(group, {}).items())}
+        return result
+
+
+class StatsStore:
+    """Statistics kept as a compacted JSON snapshot plus an append-only JSONL journal.
+    
+    Every change is one appended journal line applied incrementally to the
+    in-memory aggregates. The journal is folded into the snapshot every
+    COMPACT_EVERY events. All file access happens under an exclusive lock,
+    so several trainer processes can record at the same time.
+    """
+
+    COMPACT_EVERY = 500
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.journal_path = self.path.with_suffix(".jsonl")
+        self.lock_path = self.path.with_suffix(".lock")
+        self.stats = self.empty_stats()
+        self.generation = 0
+        self.offset = 0
+        self.journal_lines = 0
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def empty_stats():
+        return {
+            "scenarios_created": 0,
+            "issues_fixed": 0,
+            "by_layer": {i: {"created": 0, "fixed": 0} for i in range(1, 8)},
+            "history": [],
+            "analytics": HistoryAnalytics.empty()
+        }
+
+    def _file_lock(self):
+        lock_file = open(self.lock_path, 'a')
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        return lock_file
+
+    def apply(self, event):
+        """Fold one journal event into the in-memory aggregates"""
+        kind = event.get("type")
+        if kind == "scenario_created":
+            self.stats["scenarios_created"] += 1
+        elif kind == "issue_created":
+            self.stats["by_layer"][event["layer"]]["created"] += 1
+        elif kind == "issue_fixed":
+            self.stats["issues_fixed"] += 1
+            self.stats["by_layer"][event["layer"]]["fixed"] += 1
+        elif kind == "history":
+            self.stats["history"].append(event["entry"])
+        HistoryAnalytics.apply(self.stats["analytics"], event)
+
+    def _load_snapshot(self):
+        stats = self.empty_stats()
+        generation = 0
+        try:
+            with open(self.path, 'r') as f:
+                loaded = json.load(f)
+            generation = loaded.pop("generation", 0)
+            by_layer = loaded.pop("by_layer", {})
+            stats.update(loaded)
+            for layer, counts in by_layer.items():
+                stats["by_layer"][int(layer)] = dict(counts)
+        except (OSError, ValueError):
+            pass
+        self.stats.clear()
+        self.stats.update(stats)
+        self.generation = generation
+        self.offset = 0
+        self.journal_lines = 0
+
+    def _catch_up(self):
+        """Apply journal lines written since the last read, by any process"""
+        try:
+            with open(self.journal_path, 'rb') as f:
+                f.seek(self.offset)
+                for raw in f:
+                    if not raw.endswith(b"\n"):
+                        break
+                    self.offset += len(raw)
+                    try:
+                        event = json.loads(raw)
+                    except ValueError:
+                        continue
+                    if event.get("gen", 0) < self.generation:
+                        continue
+                    if event.get("gen", 0) > self.generation:
+                        self._load_snapshot()
+                        return self._catch_up()
+                    self.journal_lines += 1
+                    self.apply(event)
+        except OSError:
+            pass
+
+    def _journal_size(self):
+        try:
+            return self.journal_path.stat().st_size
+        except OSError:
+            return 0
+
+    def refresh(self):
+        """Bring the in-memory stats up to date with the files"""
+        with self.lock:
+            lock_file = self._file_lock()
+            try:
+                if self._journal_size() < self.offset or self.offset == 0:
+                    self._load_snapshot()
+                self._catch_up()
+            finally:
+                lock_file.close()
+
+    def summary(self):
+        """Windowed analytics from HistoryAnalytics, without scanning the history"""
+        with self.lock:
+            return HistoryAnalytics.summary(self.stats["analytics"])
+
+    def record(self, kind, **fields):
+        """Append one event to the journal and apply it"""
+        with self.lock:
+            lock_file = self._file_lock()
+            try:
+                if self._journal_size() < self.offset:
+                    self._load_snapshot()
+                self._catch_up()
+                event = dict(fields, type=kind, gen=self.generation)
+                line = (json.dumps(event) + "\n").encode()
+                size = self._journal_size()
+                if size > self.offset:
+                    # Torn tail left by a crashed writer: terminate it so it is skipped
+                    line = b"\n" + line
+                with open(self.journal_path, 'ab') as f:
+                    f.write(line)
+                    f.flush()
+                    os.fsync(f.fileno())
+                self.offset = size + len(line)
+                self.journal_lines += 1
+                self.apply(event)
+                if self.journal_lines >= self.COMPACT_EVERY:
+                    self._compact()
+            finally:
+                lock_file.close()
+
+    def compact(self):
+        """Fold the journal into the snapshot"""
+        with self.lock:
+            lock_file = self._file_lock()
+            try:
+                self._catch_up()
+                self._compact()
+            finally:
+                lock_file.close()
+
+    def _compact(self):
+        snapshot = dict(self.stats, generation=self.generation + 1)
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp, 'w') as f:
+            json.dump(snapshot, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+        self.generation += 1
+        with open(self.journal_path, 'w'):
+            pass
+        self.offset = 0
+        self.journal_lines = 0
+
+
+class NetworkSnapshot:
+    """Point-in-time network state of one container, and the diff to restore it"""
+
+    SYSCTLS = [
+        "net/ipv4/ip_forward",
+        "net/ipv4/tcp_keepalive_time",
+        "net/ipv4/icmp_echo_ignore_all",
+    ]
+
+    CAPTURE = [
+        ("iptables", "iptables-save 2>/dev/null"),
+        ("addr", "ip -j addr"),
+        ("route", "ip -j route"),
+        ("link", "ip -j link"),
+        ("resolv", "cat /etc/resolv.conf"),
+        ("profile", "cat /etc/profile"),
+        ("sysctl", "for k in " + " ".join(SYSCTLS) + "; do echo \"$k=$(cat /proc/sys/$k 2>/dev/null)\"; done"),
+        ("services", "ps -eo args | grep '[h]ttp.server' || true"),
+        ("qdisc", "tc qdisc show dev eth0"),
+    ]
+
+    def __init__(self, state):
+        self.state = state
+
+    @classmethod
+    def capture_commands(cls):
+        """Read-only commands that collect a snapshot, in order"""
+        return [cmd for _, cmd in cls.CAPTURE]
+
+    @classmethod
+    def from_steps(cls, steps):
+        """Build a snapshot from the BatchSteps of capture_commands()"""
+        state = {}
+        for (key, _), step in zip(cls.CAPTURE, steps):
+            if not step.success:
+                state[key] = None
+            elif key in ("addr", "route", "link"):
+                try:
+                    state[key] = json.loads(step.stdout or "[]")
+                except ValueError:
+                    state[key] = None
+            elif key == "iptables":
+                state[key] = cls.normalize_iptables(step.stdout) if step.stdout else None
+            elif key == "sysctl":
+                state[key] = dict(line.split("=", 1) for line in step.stdout.splitlines() if "=" in line)
+            elif key == "services":
+                state[key] = sorted(line for line in step.stdout.splitlines() if line)
+            else:
+                state[key] = step.stdout
+        return cls(state)
+
+    @staticmethod
+    def normalize_iptables(dump):
+        """Drop comments and packet counters so dumps compare by rules only"""
+        lines = []
+        for line in dump.splitlines():
+            if line.startswith("#"):
+                continue
+            lines.append(re.sub(r"\[\d+:\d+\]", "[0:0]", line))
+        return "\n".join(lines)
+
+    @staticmethod
+    def _links(state):
+        return {link["ifname"]: link for link in state.get("link") or []}
+
+    @staticmethod
+    def _addrs(state):
+        addrs = set()
+        for iface in state.get("addr") or []:
+            for info in iface.get("addr_info", []):
+                if info.get("scope") == "link":
+                    continue
+                addrs.add((iface["ifname"], info["local"], info["prefixlen"]))
+        return addrs
+
+    @staticmethod
+    def _routes(state):
+        routes = {}
+        for route in state.get("route") or []:
+            if route.get("protocol") == "kernel":
+                continue
+            key = (route["dst"], route.get("gateway", ""), route.get("dev", ""))
+            routes[key] = route
+        return routes
+
+    @staticmethod
+    def _route_spec(key):
+        dst, gateway, dev = key
+        spec = dst
+        if gateway:
+            spec += f" via {gateway}"
+        if dev:
+            spec += f" dev {dev}"
+        return spec
+
+    def ip_batch(self, live):
+        """`ip -batch` lines that turn live links, addresses and routes into this snapshot"""
+        lines = []
+        base_links, live_links = self._links(self.state), self._links(live.state)
+        
+        for name in live_links:
+            if name not in base_links and name != "lo":
+                lines.append(f"link delete dev {name}")
+        for name, base in base_links.items():
+            cur = live_links.get(name)
+            if cur is None:
+                continue
+            if base.get("address") and cur.get("address") != base["address"] and base.get("link_type") == "ether":
+                lines.append(f"link set dev {name} address {base['address']}")
+            if cur.get("mtu") != base.get("mtu"):
+                lines.append(f"link set dev {name} mtu {base['mtu']}")
+            for flag, on, off in (("PROMISC", "promisc on", "promisc off"), ("UP", "up", "down")):
+                want = flag in base.get("flags", [])
+                if want != (flag in cur.get("flags", [])):
+                    lines.append(f"link set dev {name} {on if want else off}")
+        
+        base_addrs, live_addrs = self._addrs(self.state), self._addrs(live.state)
+        for dev, local, prefix in sorted(live_addrs - base_addrs):
+            lines.append(f"addr del {local}/{prefix} dev {dev}")
+        for dev, local, prefix in sorted(base_addrs - live_addrs):
+            lines.append(f"addr add {local}/{prefix} dev {dev}")
+        
+        base_routes, live_routes = self._routes(self.state), self._routes(live.state)
+        for key in live_routes:
+            if key not in base_routes:
+                lines.append(f"route del {self._route_spec(key)}")
+        for key in base_routes:
+            if key not in live_routes:
+                lines.append(f"route add {self._route_spec(key)}")
+        return lines
+
+    def restore_commands(self, live):
+        """Minimal list of atomic commands that restore this snapshot over live"""
+        commands = []
+        
+        base_rules, live_rules = self.state.get("iptables"), live.state.get("iptables")
+        if base_rules and live_rules is not None and base_rules != live_rules:
+            commands.append(f"iptables-restore <<'OSI_EOF'\n{base_rules}\nOSI_EOF")
+        
+        if self.state.get("link") is not None and live.state.get("link") is not None:
+            lines = self.ip_batch(live)
+            if lines:
+                commands.append("ip -force -batch - <<'OSI_EOF'\n" + "\n".join(lines) + "\nOSI_EOF")
+        
+        base_qdisc, live_qdisc = self.state.get("qdisc"), live.state.get("qdisc")
+        if base_qdisc is not None and live_qdisc is not None and base_qdisc != live_qdisc:
+            commands.append("tc qdisc del dev eth0 root")
+        
+        for key, path in (("resolv", "/etc/resolv.conf"), ("profile", "/etc/profile")):
+            if self.state.get(key) is not None and self.state[key] != live.state.get(key):
+                commands.append(f"cat > {path} <<'OSI_EOF'\n{self.state[key]}\nOSI_EOF")
+        
+        base_sysctl, live_sysctl = self.state.get("sysctl") or {}, live.state.get("sysctl") or {}
+        for key, value in base_sysctl.items():
+            if value and live_sysctl.get(key) != value:
+                commands.append(f"echo {value} > /proc/sys/{key}")
+        
+        live_services = live.state.get("services") or []
+        for args in self.state.get("services") or []:
+            if args not in live_services:
+                commands.append(f"cd /tmp && {args} >/dev/null 2>&1 &")
+        
+        return commands
+
+
+class Lab:
+    """One copy of the lab topology: container names, networks and subnets.
+    
+    Lab 0 is the original lab built by setup.sh (no name prefix, 172.19/16
+    and 172.18/16). Lab n uses the prefix "lab<n>-" and 10.<2n>/16 and
+    10.<2n+1>/16, so copies never overlap.
+    """
+
+    # role: (network, host octet, extra network attachments, docker run options, packages, start command)
+    TOPOLOGY = {
+        "server": ("main", 2, [], ["--cap-add=NET_ADMIN"],
+                   "python3 curl iptables iproute2 procps", "python3 -m http.server 80"),
+        "client": ("main", 3, [("osi", 3)], ["--cap-add=NET_ADMIN"],
+                   "curl iptables iproute2 iputils python3 procps", None),
+        "router": ("main", 4, [("osi", 5)], ["--cap-add=NET_ADMIN", "--privileged"],
+                   "iptables iproute2 curl python3 procps", "echo 1 > /proc/sys/net/ipv4/ip_forward"),
+        "attacker": ("main", 5, [], ["--cap-add=NET_ADMIN"],
+                     "nmap curl iptables iproute2 python3 procps", None),
+        "osi-server": ("osi", 4, [], ["--cap-add=NET_ADMIN"],
+                       "python3 curl iptables iproute2 procps", "python3 -m http.server 8080"),
+    }
+
+    DEFAULT_PREFIXES = {"main": "172.19.", "osi": "172.18."}
+
+    def __init__(self, index=0, state="unknown", created=None):
+        self.index = index
+        self.state = state
+        self.created = created
+
+    @property
+    def name(self):
+        return f"lab{self.index}" if self.index else "default"
+
+    @property
+    def prefix(self):
+        return f"lab{self.index}-" if self.index else ""
+
+    def subnet_prefix(self, network):
+        """First two octets of a network, e.g. "172.19." """
+        if self.index == 0:
+            return self.DEFAULT_PREFIXES[network]
+        return f"10.{2 * self.index + (network == 'osi')}."
+
+    def subnet(self, network):
+        return self.subnet_prefix(network) + "0.0/16"
+
+    def network_name(self, network):
+        return f"{self.prefix}{network}-network"
+
+    def docker_name(self, role):
+        return self.prefix + role
+
+    def address(self, network, octet):
+        return f"{self.subnet_prefix(network)}0.{octet}"
+
+    @property
+    def containers(self):
+        """Role to primary IP address, like AdvancedOsiTrainer.containers"""
+        return {role: self.address(net, octet) for role, (net, octet, *_) in self.TOPOLOGY.items()}
+
+    def translate(self, command):
+        """Rewrite addresses of the default lab into this lab's subnets"""
+        if self.index == 0:
+            return command
+        for network, default in self.DEFAULT_PREFIXES.items():
+            command = re.sub(r"\b" + re.escape(default), self.subnet_prefix(network), command)
+        return command
+
+    def to_dict(self):
+        return {"index": self.index, "state": self.state, "created": self.created}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["index"], data.get("state", "unknown"), data.get("created"))
+
+
+class LabManager:
+    """Provision, track and tear down numbered copies of the lab on this host"""
+
+    MAX_LABS = 127
+
+    def __init__(self, registry_path=None, max_parallel=4, ready_timeout=180):
+        self.registry_path = Path(registry_path or Path.home() / ".osi_trainer_labs.json")
+        self.max_parallel = max(1, max_parallel)
+        self.ready_timeout = ready_timeout
+        self.lock = threading.Lock()
+        self.labs = {}
+        self.load()
+
+    def load(self):
+        """Load the lab registry"""
+        try:
+            with open(self.registry_path, 'r') as f:
+                self.labs = {name: Lab.from_dict(data) for name, data in json.load(f).items()}
+        except (OSError, ValueError):
+            self.labs = {}
+
+    def save(self):
+        """Write the lab registry atomically"""
+        with self.lock:
+            data = json.dumps({name: lab.to_dict() for name, lab in self.labs.items()}, indent=2)
+            tmp = self.registry_path.with_name(self.registry_path.name + ".tmp")
+            with open(tmp, 'w') as f:
+                f.write(data)
+            os.replace(tmp, self.registry_path)
+
+    def get(self, name):
+        """Lab by name; "default" is always the setup.sh lab"""
+        if name in (None, "", "default"):
+            return Lab(0, "ready")
+        if name not in self.labs:
+            raise KeyError(f"Unknown lab: {name}")
+        return self.labs[name]
+
+    def set_state(self, lab, state):
+        with self.lock:
+            lab.state = state
+            self.labs[lab.name] = lab
+        self.save()
+
+    @staticmethod
+    def docker(*args, timeout=120):
+        """Run a docker CLI command, raising RuntimeError on failure"""
+        result = subprocess.run(["docker"] + list(args), capture_output=True, text=True, timeout=timeout)
+        if result.returncode != 0:
+            raise RuntimeError(result.stderr.strip() or f"docker {args[0]} failed")
+        return result.stdout.strip()
+
+    def allocate(self, count):
+        """Reserve count unused lab indices"""
+        with self.lock:
+            used = {lab.index for lab in self.labs.values()}
+            free = [i for i in range(1, self.MAX_LABS + 1) if i not in used][:count]
+            if len(free) < count:
+                raise RuntimeError(f"Only {len(free)} lab slots left")
+            labs = [Lab(i, "allocated", datetime.now().isoformat()) for i in free]
+            for lab in labs:
+                self.labs[lab.name] = lab
+        self.save()
+        return labs
+
+    def create(self, count):
+        """Allocate and provision count new labs in parallel"""
+        return fan_out(self.provision, self.allocate(count), self.max_parallel)
+
+    def provision(self, lab):
+        """Create networks and containers for one lab and wait until it is ready"""
+        self.set_state(lab, "provisioning")
+        try:
+            for network in ("main", "osi"):
+                self.docker("network", "create", f"--subnet={lab.subnet(network)}", lab.network_name(network))
+            
+            def run(role):
+                network, octet, _, options, packages, start = Lab.TOPOLOGY[role]
+                script = f"apk add {packages} --no-cache"
+                if start:
+                    script += f" && {start}"
+                script += " & tail -f /dev/null"
+                self.docker("run", "-d", "--name", lab.docker_name(role),
+                            f"--network={lab.network_name(network)}", f"--ip={lab.address(network, octet)}",
+                            *options, "alpine", "sh", "-c", script)
+            
+            self._raise_errors(fan_out(run, Lab.TOPOLOGY, len(Lab.TOPOLOGY)))
+            
+            for role, (_, _, extra, *_) in Lab.TOPOLOGY.items():
+                for network, octet in extra:
+                    self.docker("network", "connect", "--ip", lab.address(network, octet),
+                                lab.network_name(network), lab.docker_name(role))
+            
+            self._raise_errors(fan_out(lambda role: self.wait_ready(lab, role), Lab.TOPOLOGY, len(Lab.TOPOLOGY)))
+            
+            self.docker("exec", lab.docker_name("client"), "ip", "route", "replace", lab.subnet("osi"),
+                        "via", lab.address("main", 4))
+            
+            def compat(role):
+                self.docker("exec", lab.docker_name(role), "sh", "-c",
+                            "echo 'alias arp=\"ip neigh\"' >> /etc/profile; "
+                            "echo 7200 > /proc/sys/net/ipv4/tcp_keepalive_time 2>/dev/null || true")
+            
+            self._raise_errors(fan_out(compat, Lab.TOPOLOGY, len(Lab.TOPOLOGY)))
+        except Exception:
+            self.set_state(lab, "failed")
+            raise
+        self.set_state(lab, "ready")
+        return lab
+
+    @staticmethod
+    def _raise_errors(results):
+        errors = [f"{res.item}: {res.error}" for res in results if res.error]
+        if errors:
+            raise RuntimeError("; ".join(errors))
+
+    def wait_ready(self, lab, role):
+        """Poll a container until its packages are installed and its service is up"""
+        _, _, _, _, packages, start = Lab.TOPOLOGY[role]
+        check = "command -v ip >/dev/null && command -v iptables >/dev/null"
+        if start and "http.server" in start:
+            check += " && ps -eo args | grep -q '[h]ttp.server'"
+        
+        deadline = time.monotonic() + self.ready_timeout
+        delay = 0.25
+        while True:
+            result = subprocess.run(["docker", "exec", lab.docker_name(role), "sh", "-c", check],
+                                    capture_output=True, text=True, timeout=10)
+            if result.returncode == 0:
+                return True
+            if time.monotonic() + delay > deadline:
+                raise RuntimeError(f"{lab.docker_name(role)} not ready after {self.ready_timeout}s")
+            time.sleep(delay)
+            delay = min(delay * 2, 2)
+
+    def destroy(self, names):
+        """Tear down labs in parallel and drop them from the registry"""
+        labs = [self.get(name) for name in names]
+        
+        def teardown(lab):
+            if lab.index == 0:
+                raise RuntimeError("the default lab is managed by setup.sh")
+            self.set_state(lab, "removing")
+            names = [lab.docker_name(role) for role in Lab.TOPOLOGY]
+            subprocess.run(["docker", "rm", "-f"] + names, capture_output=True, text=True, timeout=120)
+            for network in ("main", "osi"):
+                subprocess.run(["docker", "network", "rm", lab.network_name(network)],
+                               capture_output=True, text=True, timeout=60)
+            with self.lock:
+                self.labs.pop(lab.name, None)
+            self.save()
+            lab.state = "removed"
+            return lab
+        
+        return fan_out(teardown, labs, self.max_parallel)
+
+
+class FixWatcher:
+    """Background thread that notices issues fixed by hand.
+    
+    Each tick runs the verify predicates of all open issues with one batched
+    exec per container. The interval starts at min_interval, grows while
+    nothing changes and snaps back when an issue is fixed or a scenario is
+    created. With no open issues the thread just waits. wake(container)
+    requests an immediate check of just that container, which is how
+    EventMonitor pushes changes in.
+    """
+
+    def __init__(self, trainer, min_interval=1.0, max_interval=15.0, on_fixed=None):
+        self.trainer = trainer
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.interval = min_interval
+        self.on_fixed = on_fixed
+        self.pending = set()
+        self.pending_lock = threading.Lock()
+        self.wake_event = threading.Event()
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def start(self):
+        """Start watching in a daemon thread"""
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run, daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        """Stop the watcher thread"""
+        self.stop_event.set()
+        self.wake_event.set()
+        if self.thread is not None:
+            self.thread.join(timeout=5)
+            self.thread = None
+
+    def wake(self, container=None):
+        """Check again now: one container, or everything at the fastest interval"""
+        if container is None:
+            self.interval = self.min_interval
+        else:
+            with self.pending_lock:
+                self.pending.add(container)
+        self.wake_event.set()
+
+    def _take_pending(self):
+        with self.pending_lock:
+            pending, self.pending = self.pending, set()
+        return pending
+
+    def _run(self):
+        while not self.stop_event.is_set():
+            if not self.trainer.open_issues():
+                self._take_pending()
+                self.wake_event.wait()
+                self.wake_event.clear()
+                continue
+            pending = self._take_pending()
+            try:
+                fixed = self.trainer.check_fixes(pending or None)
+            except Exception:
+                fixed = []
+            for issue in fixed:
+                if self.on_fixed:
+                    self.on_fixed(issue)
+            if fixed:
+                self.interval = self.min_interval
+            elif not pending:
+                self.interval = min(self.interval * 1.5, self.max_interval)
+            self.wake_event.wait(self.interval)
+            self.wake_event.clear()
+
+
+class EventMonitor:
+    """Push-based change feed for the lab containers.
+    
+    One `docker events` stream reports container start/die and exec
+    start/die, and one `ip monitor label link addr route` stream per
+    container reports netlink changes. Both are turned into TrainerEvents
+    and handed to on_event from a single dispatcher thread. Execs of the
+    trainer itself are ignored; only interactive shells (a bare sh/ash/bash)
+    count as trainee activity.
+    """
+
+    SHELLS = ("sh", "ash", "bash", "zsh")
+
+    def __init__(self, names, on_event):
+        self.names = dict(names)
+        self.roles = {name: role for role, name in self.names.items()}
+        self.on_event = on_event
+        self.events = queue.Queue()
+        self.procs = {}
+        self.procs_lock = threading.Lock()
+        self.shell_execs = set()
+        self.running = False
+
+    def start(self):
+        """Start the docker events stream, netlink monitors and dispatcher"""
+        self.running = True
+        threading.Thread(target=self._dispatch, daemon=True).start()
+        self._spawn("docker-events", self._docker_events_cmd(), self._parse_docker_event)
+        for role in self.names:
+            self.start_netlink(role)
+
+    def stop(self):
+        """Kill all monitor processes"""
+        self.running = False
+        with self.procs_lock:
+            procs, self.procs = list(self.procs.values()), {}
+        for proc in procs:
+            if proc.poll() is None:
+                proc.kill()
+            proc.wait()
+        self.events.put(None)
+
+    def _docker_events_cmd(self):
+        cmd = ["docker", "events", "--format", "{{json .}}", "--filter", "type=container"]
+        for action in ("start", "die", "exec_start", "exec_die"):
+            cmd += ["--filter", f"event={action}"]
+        for name in self.names.values():
+            cmd += ["--filter", f"container={name}"]
+        return cmd
+
+    def start_netlink(self, role):
+        """(Re)start the netlink monitor inside one container"""
+        self._spawn(role, ["docker", "exec", self.names[role], "ip", "monitor", "label", "link", "addr", "route"],
+                    lambda line: self._parse_netlink(role, line))
+
+    def _spawn(self, key, cmd, parse):
+        try:
+            proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+        except OSError:
+            return
+        with self.procs_lock:
+            old = self.procs.get(key)
+            self.procs[key] = proc
+        if old is not None and old.poll() is None:
+            old.kill()
+        
+        def read():
+            for line in iter(proc.stdout.readline, ""):
+                event = parse(line.strip())
+                if event is not None:
+                    self.events.put(event)
+        
+        threading.Thread(target=read, daemon=True).start()
+
+    def _parse_docker_event(self, line):
+        try:
+            data = json.loads(line)
+        except ValueError:
+            return None
+        action = data.get("Action", data.get("status", ""))
+        attributes = data.get("Actor", {}).get("Attributes", {})
+        role = self.roles.get(attributes.get("name"))
+        if role is None:
+            return None
+        
+        if action in ("start", "die"):
+            if action == "start" and self.running:
+                self.start_netlink(role)
+            return TrainerEvent(f"container_{action}", role, "", time.time())
+        
+        exec_id = attributes.get("execID")
+        if action.startswith("exec_start"):
+            argv = action.split(":", 1)[1].split() if ":" in action else []
+            if len(argv) == 1 and os.path.basename(argv[0]) in self.SHELLS:
+                self.shell_execs.add(exec_id)
+                return TrainerEvent("shell_start", role, argv[0], time.time())
+        elif action.startswith("exec_die") and exec_id in self.shell_execs:
+            self.shell_execs.discard(exec_id)
+            return TrainerEvent("shell_exit", role, "", time.time())
+        return None
+
+    @staticmethod
+    def _parse_netlink(role, line):
+        if not line.startswith("["):
+            return None
+        label, _, detail = line.partition("]")
+        kind = label.strip("[").lower()
+        if kind not in ("link", "addr", "route"):
+            return None
+        return TrainerEvent(kind, role, detail.strip(), time.time())
+
+    def _dispatch(self):
+        while True:
+            event = self.events.get()
+            if event is None:
+                return
+            try:
+                self.on_event(event)
+            except Exception:
+                pass
+
+
+class AdvancedOsiTrainer:
+    def __init__(self, session_mode=False, max_parallel=4, backend="cli", lab=None,
+                 docker_api=None, metrics=None, demo=False, cache_ttl=5.0, fault_dirs=None, limiter=None):
         self.containers = {
             "attacker": "172.19.0.5",
             "router": "172.19.0.4", 
@@ -24,85 +2278,301 @@ class AdvancedOsiTrainer:
             "osi-server": "172.18.0.4"
         }
         
-        self.stats = {
-            "scenarios_created": 0,
-            "issues_fixed": 0,
-            "by_layer": {i: {"created": 0, "fixed": 0} for i in range(1, 8)},
-            "history": []
-        }
+        self.lab = lab if lab is not None and lab.index else None
+        if self.lab is not None:
+            self.containers = {role: lab.containers[role] for role in self.containers}
         
         self.current_issues = []
+        self.issues_lock = threading.Lock()
+        self.watcher = None
+        self.events = None
         self.container_shells = {}
         
+        self.session_mode = session_mode
+        self.demo = demo
+        self.sessions = {}
+        self.sessions_lock = threading.Lock()
+        self.max_parallel = max(1, max_parallel)
+        self.backend = backend
+        self.metrics = metrics if metrics is not None else ExecMetrics()
+        self.exec_cache = ExecCache(ttl=cache_ttl)
+        self.budgets = ExecBudgets()
+        self.limiter = limiter or self.metrics.limiter or ExecLimiter()
+        self.docker_api = docker_api
+        if docker_api is None and backend == "api":
+            self.docker_api = DockerAPIClient(pool_size=self.max_parallel)
+        
         self.stats_file = Path.home() / ".osi_trainer_stats.json"
+        self.stats_store = StatsStore(self.stats_file)
+        self.stats = self.stats_store.stats
         self.load_stats()
         
+        self.baselines = {}
+        self.baseline_identities = {}
+        suffix = f".{self.lab.name}" if self.lab is not None else ""
+        self.baseline_file = Path.home() / f".osi_trainer_baselines{suffix}.json"
+        self.load_baselines()
+        
+        self.probe_cache = ProbeCache(Path.home() / ".osi_trainer_probes.json")
+        self.recordings_dir = Path.home() / ".osi_trainer_recordings"
+        self.identities = {}
+        self.fault_dirs = fault_dirs if fault_dirs is not None else default_fault_dirs()
+        
         self.detect_shells()
         self.initialize_issues()
+        self.capture_missing_baselines()
     
-    def detect_shells(self):
-        """Detect available shells"""
-        self.container_shells = {}
-        for container in self.containers:
-            success, _, _ = self.exec_container(container, "echo test", shell="sh")
+    def fan_out(self, func, items=None, limit=None):
+        """Run func(item) for every container (or item) concurrently, bounded by max_parallel"""
+        items = list(self.containers) if items is None else items
+        return fan_out(func, items, limit or self.max_parallel)
+    
+    def docker_name(self, container):
+        """Docker container name for a role in the current lab"""
+        return self.lab.docker_name(container) if self.lab is not None else container
+    
+    def render_command(self, command):
+        """Command as it runs in the current lab"""
+        return self.lab.translate(command) if self.lab is not None else command
+    
+    def container_identities(self):
+        """Map container name to "<id>:<image>:<started at>" with one inspect call"""
+        identities = {}
+        if self.docker_api is not None:
+            for res in self.fan_out(lambda c: self.docker_api.inspect_container(self.docker_name(c))):
+                if res.error is None:
+                    info = res.value
+                    identities[res.item] = f"{info['Id']}:{info['Image']}:{info['State']['StartedAt']}"
+            return identities
+        
+        roles = {self.docker_name(c): c for c in self.containers}
+        try:
+            result = subprocess.run(
+                ["docker", "inspect", "--format", "{{.Name}} {{.Id}}:{{.Image}}:{{.State.StartedAt}}"]
+                + list(roles), capture_output=True, text=True, timeout=10)
+        except (OSError, subprocess.TimeoutExpired):
+            return identities
+        for line in result.stdout.splitlines():
+            parts = line.split()
+            if len(parts) == 2 and parts[0].lstrip("/") in roles:
+                identities[roles[parts[0].lstrip("/")]] = parts[1]
+        return identities
+    
+    @exec_caller("probe")
+    def detect_shells(self, refresh=False):
+        """Detect available shells.
+        
+        A container is only cached as shell-less ("direct") when docker reports
+        that sh does not exist (exit 126/127); failed probes count as "sh".
+        """
+        self.identities = self.container_identities()
+        
+        def probe(container):
+            identity = self.identities.get(container)
+            cached = None if refresh else self.probe_cache.get(self.docker_name(container), identity, "shell")
+            if cached:
+                return cached
+            success, out, err = self.exec_container(container, "echo test", shell="sh")
             if success:
-                self.container_shells[container] = "sh"
+                shell = "sh"
+            elif re.search(r"executable file not found|no such file or directory", out + err, re.I):
+                shell = "direct"
             else:
-                self.container_shells[container] = "direct"
+                # Timeouts and daemon errors say nothing about the image; probe again next start
+                return "sh"
+            self.probe_cache.put(self.docker_name(container), identity, "shell", shell)
+            return shell
+        
+        self.container_shells = {}
+        for res in self.fan_out(probe):
+            self.container_shells[res.item] = res.value or "sh"
+        self.probe_cache.save()
     
     def initialize_issues(self):
-        """Initialize all possible issues"""
-        self.all_issues = {
-            1: [
-                {"name": "Interface Down", "cmd": "ip link set eth0 down", "difficulty": 1},
-                {"name": "Wrong MTU (500)", "cmd": "ip link set eth0 mtu 500", "difficulty": 1},
-                {"name": "Interface Promiscuous", "cmd": "ip link set eth0 promisc on", "difficulty": 1},
-            ],
-            2: [
-                {"name": "MAC Address Changed", "cmd": "ip link set eth0 address 00:11:22:33:44:55", "difficulty": 2},
-                {"name": "VLAN Created", "cmd": "ip link add link eth0 name eth0.10 type vlan id 10", "difficulty": 2},
-            ],
-            3: [
-                {"name": "Wrong Route", "cmd": "ip route add 10.0.0.0/24 via 172.19.0.99", "difficulty": 2},
-                {"name": "IP Conflict", "cmd": "ip addr add 172.19.0.2/24 dev eth0", "difficulty": 3},
-                {"name": "Route Loop", "cmd": "ip route add 172.19.0.0/24 via 172.19.0.3", "difficulty": 3},
-                {"name": "Subnet Flushed", "cmd": "ip addr flush dev eth0", "difficulty": 3},
-            ],
-            4: [
-                {"name": "HTTP Port Blocked", "cmd": "iptables -A INPUT -p tcp --dport 80 -j REJECT", "difficulty": 3},
-                {"name": "ICMP Blocked", "cmd": "iptables -A INPUT -p icmp -j DROP", "difficulty": 2},
-                {"name": "SYN Flood Protection", "cmd": "iptables -A INPUT -p tcp --syn -m limit --limit 1/s -j ACCEPT", "difficulty": 4},
-            ],
-            5: [
-                {"name": "TCP Keepalive Disabled", "cmd": "sh -c 'echo 999999 > /proc/sys/net/ipv4/tcp_keepalive_time 2>/dev/null || true'", "difficulty": 3},
-            ],
-            6: [
-                {"name": "Bad Certs Folder", "cmd": "mkdir -p /tmp/badcerts", "difficulty": 1},
-                {"name": "Wrong Encoding", "cmd": "sh -c \"echo 'export LANG=C' >> /etc/profile\"", "difficulty": 2},
-            ],
-            7: [
-                {"name": "Web Server Killed", "cmd": "pkill -f 'python.*http' || killall python3", "difficulty": 2},
-                {"name": "DNS Broken", "cmd": "sh -c \"echo 'nameserver 127.0.0.1' > /etc/resolv.conf\"", "difficulty": 3},
-                {"name": "App Firewall", "cmd": "iptables -A INPUT -p tcp --dport 80 -m string --string 'GET /malicious' --algo bm -j DROP", "difficulty": 4},
-            ]
-        }
+        """Index the fault packs; layers are loaded when first used"""
+        self.catalog = IssueCatalog(FaultPacks(self.fault_dirs))
     
-    def exec_container(self, container, command, shell=None):
-        """Execute command in container"""
-        shell_to_use = shell or self.container_shells.get(container, "sh")
+    def exec_container(self, container, command, shell=None, timeout=None, cache=True):
+        """Execute command in container.
         
+        With cache, successful read-only commands are served from the exec
+        cache and any mutating command invalidates the container's entries;
+        cache=False always runs the command and leaves the cache alone.
+        Without a timeout the command's class sets an adaptive deadline, and
+        liveness checks and reads that time out are retried once.
+        """
+        kind = ExecCache.classify(command) if cache else None
+        if kind == "read":
+            cached = self.exec_cache.get(container, command)
+            if cached is not None:
+                return cached
+        elif kind == "write":
+            self.exec_cache.invalidate(container)
+        
+        budget = ExecBudgets.classify(command) if timeout is None else None
+        attempts = 1 + (ExecBudgets.RETRIES if budget in ExecBudgets.IDEMPOTENT else 0)
+        for _ in range(attempts):
+            deadline = timeout or self.budgets.deadline(budget)
+            with self.limiter.slot():
+                started = time.monotonic()
+                result = self._exec(container, command, shell, deadline)
+                elapsed = time.monotonic() - started
+            self.metrics.observe(container, command, elapsed, result)
+            timed_out = not result[0] and "timed out" in result[2]
+            if budget is not None:
+                self.budgets.observe(budget, elapsed, timed_out)
+            if not timed_out:
+                break
+        if kind == "read" and result[0]:
+            self.exec_cache.put(container, command, result)
+        return result
+    
+    def kill_orphans(self, name, marker, shell):
+        """Kill what a timed-out exec left running in the container.
+        
+        Targets are the processes carrying its OSI_EXEC marker and all their
+        descendants. Daemons started by earlier framed steps lost the marker
+        and were reparented when their step finished, so they survive.
+        """
+        if shell == "direct":
+            return
+        script = textwrap.dedent(f"""\
+            k=" "
+            for p in /proc/[0-9]*; do
+              tr '\\0' '\\n' < $p/environ 2>/dev/null | grep -qx OSI_EXEC={marker} && k="$k${{p#/proc/}} "
+            done
+            n=
+            while [ "$n" != "$k" ]; do
+              n=$k
+              for p in /proc/[0-9]*; do
+                i=${{p#/proc/}}
+                case "$k" in *" $i "*) continue;; esac
+                q=$(sed -n 's/^PPid:[[:space:]]*//p' $p/status 2>/dev/null)
+                case "$k" in *" $q "*) k="$k$i ";; esac
+              done
+            done
+            [ "$k" = " " ] || kill -9 $k
+            """)
+        deadline = self.budgets.deadline("liveness")
         try:
-            if shell_to_use == "direct":
-                cmd = ["docker", "exec", container] + command.split()
-                result = subprocess.run(cmd, capture_output=True, text=True, timeout=5)
+            if self.docker_api is not None:
+                self.docker_api.exec_run(name, [shell, "-c", script], timeout=deadline)
             else:
-                cmd = ["docker", "exec", container, shell_to_use, "-c", command]
-                result = subprocess.run(cmd, capture_output=True, text=True, timeout=5)
-            
+                subprocess.run(["docker", "exec", name, shell, "-c", script],
+                               capture_output=True, text=True, timeout=deadline)
+        except Exception:
+            pass
+    
+    def _exec(self, container, command, shell, timeout):
+        shell_to_use = shell or self.container_shells.get(container, "sh")
+        command = self.render_command(command)
+        name = self.docker_name(container)
+        
+        if self.session_mode and shell_to_use != "direct":
+            marker = uuid.uuid4().hex
+            result = self.get_session(name, shell_to_use).run(command, timeout=timeout, marker=marker)
+            if not result[0] and "timed out" in result[2]:
+                self.kill_orphans(name, marker, shell_to_use)
+            return result
+        
+        # Without an explicit shell, commands that need none run as plain argv;
+        # compile_command is memoized, so repeats are not tokenized again
+        compiled = compile_command(command)
+        if shell is None and not compiled.needs_shell:
+            argv = list(compiled.argv)
+        elif shell_to_use != "direct":
+            argv = [shell_to_use, "-c", command]
+        else:
+            return False, "", f"{container} has no shell for: {command[:60]}"
+        
+        marker = uuid.uuid4().hex
+        if self.docker_api is not None:
+            try:
+                return self.docker_api.exec_run(name, argv, timeout=timeout, env=[f"OSI_EXEC={marker}"])
+            except socket.timeout:
+                self.kill_orphans(name, marker, shell_to_use)
+                return False, "", f"Command '{command[:60]}' timed out after {timeout:g} seconds"
+            except Exception as e:
+                return False, "", str(e)
+        
+        try:
+            result = subprocess.run(["docker", "exec", "-e", f"OSI_EXEC={marker}", name] + argv,
+                                    capture_output=True, text=True, timeout=timeout)
             return result.returncode == 0, result.stdout.strip(), result.stderr.strip()
+        except subprocess.TimeoutExpired as e:
+            self.kill_orphans(name, marker, shell_to_use)
+            return False, "", str(e)
         except Exception as e:
             return False, "", str(e)
     
+    def exec_batch(self, container, commands, timeout=None, cache=True):
+        """Run an ordered list of commands in one exec and return a BatchStep per command.
+        
+        Every step runs even if an earlier one fails, exactly as if each had
+        been passed to exec_container separately.
+        """
+        commands = list(commands)
+        if not commands:
+            return []
+        if self.container_shells.get(container, "sh") == "direct":
+            return [BatchStep(cmd, *self._step_result(self.exec_container(container, cmd, cache=cache)))
+                    for cmd in commands]
+        
+        kinds = [ExecCache.classify(cmd) if cache else None for cmd in commands]
+        if kinds and all(kind == "read" for kind in kinds):
+            cached = [self.exec_cache.get(container, cmd) for cmd in commands]
+            if all(result is not None for result in cached):
+                return [BatchStep(cmd, *self._step_result(result)) for cmd, result in zip(commands, cached)]
+        if "write" in kinds:
+            self.exec_cache.invalidate(container)
+        
+        token = uuid.uuid4().hex
+        steps = self.run_script(container, commands, frame_script(commands, token), token, timeout)
+        
+        for kind, step in zip(kinds, steps):
+            if kind == "write":
+                self.exec_cache.invalidate(container)
+            elif kind == "read" and step.success:
+                self.exec_cache.put(container, step.command, (True, step.stdout, step.stderr))
+        return steps
+    
+    def run_script(self, container, commands, script, token, timeout=None):
+        """Run a script from frame_script in one exec and split it into a BatchStep per command"""
+        timeout = timeout or self.budgets.batch_deadline(commands)
+        _, out, err = self.exec_container(container, script, timeout=timeout, cache=False)
+        frames = parse_frames(out, token)
+        
+        steps = []
+        for i, cmd in enumerate(commands):
+            if i < len(frames):
+                code, step_out, step_err = frames[i]
+                steps.append(BatchStep(cmd, code == 0, code, step_out, step_err))
+            else:
+                steps.append(BatchStep(cmd, False, None, "", err or "Batch aborted before this step"))
+        return steps
+    
+    @staticmethod
+    def _step_result(result):
+        success, out, err = result
+        return success, (0 if success else 1), out, err
+    
+    def get_session(self, container, shell="sh"):
+        """Get (or create) the persistent shell session for a container"""
+        with self.sessions_lock:
+            key = (container, shell)
+            if key not in self.sessions:
+                self.sessions[key] = ShellSession(container, shell)
+            return self.sessions[key]
+    
+    def close_sessions(self):
+        """Terminate all persistent shell sessions"""
+        with self.sessions_lock:
+            for session in self.sessions.values():
+                session.close()
+            self.sessions = {}
+        if self.docker_api is not None:
+            self.docker_api.close()
+    
     def check_container_access(self, container):
         """Check if container is accessible"""
         return self.exec_container(container, "echo test")[0]
@@ -175,48 +2645,221 @@ class AdvancedOsiTrainer:
             pass
         return random.choice(containers)
     
-    def create_scenario(self, layers, container, scenario_name, num_issues=3):
+    def container_traits(self, container, probe=False):
+        """Known capabilities of a container, from the probe cache and its baseline.
+        
+        With probe, capabilities missing from the cache are probed (and cached) first.
+        """
+        if probe:
+            res, = self.container_capabilities(containers=[container])
+            caps = res.value
+        else:
+            caps = self.probe_cache.get(self.docker_name(container), self.identities.get(container), "capabilities")
+        traits = dict(caps or {})
+        baseline = self.baselines.get(container)
+        if baseline is not None and baseline.state.get("services") is not None:
+            traits["web_server"] = bool(baseline.state["services"])
+        if container in self.container_shells:
+            traits["shell"] = self.container_shells[container] != "direct"
+        return traits
+    
+    def create_scenario(self, layers, container, scenario_name, num_issues=3, seed=None, max_rounds=3, tag=None):
         """Create a scenario with a specific number of issues"""
         print(f"\nCreating {scenario_name} on {container}...")
         print("="*70)
         
-        self.current_issues = []
-        issues_created = 0
-
-        while issues_created < num_issues:
-            layer = random.choice(layers)
-            if layer not in self.all_issues or not self.all_issues[layer]:
-                continue
-            
-            issue = random.choice(self.all_issues[layer])
-            
+        def report(layer, issue, step, created):
             print(f"\nLayer {layer}: {issue['name']}")
-            print(f"Command: {issue['cmd']}")
-            
-            success, out, err = self.exec_container(container, issue['cmd'])
-            
-            if success or "File exists" in err or "already exists" in err:
+            print(f"Command: {self.render_command(issue['cmd'])}")
+            if created:
                 print("  Issue created.")
-                self.current_issues.append({
-                    "layer": layer,
-                    "container": container,
-                    "issue": issue['name'],
-                    "command": issue['cmd'],
-                    "time": datetime.now().isoformat()
-                })
-                self.stats["by_layer"][layer]["created"] += 1
-                issues_created += 1
             else:
-                print(f"  Skipped: {err[:80]}")
+                print(f"  Skipped: {step.stderr[:80]}")
+        
+        if seed is None:
+            seed = random.randrange(2**31)
+        self.current_issues = []
+        result = self.build_scenario(layers, container, num_issues, seed, max_rounds, report=report, tag=tag)
+        if result["error"]:
+            print(f"\nCannot create scenario: {result['error']}.")
+            return
+        
+        self.current_issues = result["issues"]
+        self.issues_changed()
+        
+        if 0 < len(self.current_issues) < num_issues:
+            print(f"\nOnly {len(self.current_issues)} of {num_issues} issues could be created on {container}.")
         
         if self.current_issues:
-            self.stats["scenarios_created"] += 1
-            self.save_stats()
+            self.record_stat("scenario_created")
             print(f"\nCreated {len(self.current_issues)} issues.")
             self.save_scenario()
+            path = self.save_recording(
+                ScenarioRecording.capture(self.catalog, seed, layers, self.current_issues))
+            if path:
+                print(f"Recording saved to {path}")
         else:
             print("\nNo issues were created.")
     
+    @exec_caller("inject")
+    def build_scenario(self, layers, container, num_issues=3, seed=None, max_rounds=3, report=None, tag=None):
+        """Inject up to num_issues distinct issues into container.
+        
+        Returns {"container", "issues", "skipped", "error"}; report, if given,
+        is called as report(layer, issue, step, created) for every attempt.
+        tag limits the draw to faults carrying that tag. An issue only counts
+        as created if its verify predicate fails after the injections; the
+        others are skipped and replaced in the next round.
+        """
+        rng = random.Random(seed) if seed is not None else random
+        traits = self.container_traits(container, probe=True)
+        result = {"container": container, "issues": [], "skipped": [], "error": None}
+        
+        try:
+            picks = self.catalog.sample(layers, container, num_issues, traits, rng, tag=tag)
+        except CatalogError as e:
+            result["error"] = str(e)
+            return result
+        
+        tried = set()
+        applied = []
+        scenario = uuid.uuid4().hex[:12]
+        for _ in range(max_rounds):
+            # Each fault's verify runs after all injections in the same exec; a passing predicate means no effect
+            verifies = [(issue.get("verify") or "false").replace("{ip}", self.containers[container])
+                        for _, issue in picks]
+            steps = self.exec_batch(container, [issue['cmd'] for _, issue in picks] + verifies)
+            
+            for (layer, issue), step, check in zip(picks, steps, steps[len(picks):]):
+                tried.add(issue['id'])
+                created = step.success or "File exists" in step.stderr or "already exists" in step.stderr
+                if created and check.success:
+                    created = False
+                    step = step._replace(success=False, stderr=step.stderr or "injection had no effect")
+                if created:
+                    applied.append(issue)
+                    result["issues"].append(self.issue_record(container, layer, issue['id'], issue['name'],
+                                                              issue['cmd'], issue.get("verify", ""),
+                                                              scenario=scenario))
+                    self.record_stat("issue_created", layer=layer, issue=issue['name'], container=container,
+                                     scenario=scenario)
+                else:
+                    result["skipped"].append({"layer": layer, "issue": issue['name'], "error": step.stderr})
+                if report:
+                    report(layer, issue, step, created)
+            
+            missing = num_issues - len(result["issues"])
+            if missing <= 0:
+                break
+            picks = self.catalog.sample(layers, container, missing, traits, rng, exclude=tried, applied=applied,
+                                        tag=tag)
+            if not picks:
+                break
+        
+        return result
+    
+    def issue_record(self, container, layer, issue_id, name, command, verify, fix=None, scenario=None):
+        """Active issue entry for a fault injected into container as part of scenario"""
+        record = {
+            "id": issue_id,
+            "scenario": scenario,
+            "layer": layer,
+            "container": container,
+            "issue": name,
+            "command": self.render_command(command),
+            "verify": verify.replace("{ip}", self.containers[container]),
+            "time": datetime.now().isoformat()
+        }
+        if fix is not None:
+            record["fix"] = fix
+        return record
+    
+    @exec_caller("inject")
+    def replay_scenario(self, recording):
+        """Re-stage a ScenarioRecording on this lab, replacing the active issues.
+        
+        Each container gets its precompiled script in a single exec; nothing
+        is sampled. Returns a report shaped like generate_scenarios.
+        """
+        scripts = recording.compile()
+        
+        def stage(container):
+            result = {"container": container, "issues": [], "skipped": [], "error": None}
+            if container not in self.containers:
+                result["error"] = f"Unknown container {container}"
+                return result
+            commands, script, token = scripts[container]
+            self.exec_cache.invalidate(container)
+            if self.container_shells.get(container, "sh") == "direct":
+                steps = self.exec_batch(container, commands)
+            else:
+                steps = self.run_script(container, commands, script, token)
+            self.exec_cache.invalidate(container)
+            
+            scenario = uuid.uuid4().hex[:12]
+            for fault, step in zip(recording.containers[container], steps):
+                if step.success or "File exists" in step.stderr or "already exists" in step.stderr:
+                    result["issues"].append(self.issue_record(container, fault["layer"], fault["id"], fault["name"],
+                                                              fault["inject"], fault["verify"], fault["fix"],
+                                                              scenario))
+                    self.record_stat("issue_created", layer=fault["layer"], issue=fault["name"],
+                                     container=container, scenario=scenario)
+                else:
+                    result["skipped"].append({"layer": fault["layer"], "issue": fault["name"],
+                                              "error": step.stderr})
+            return result
+        
+        results = []
+        self.current_issues = []
+        for res in self.fan_out(stage, list(recording.containers)):
+            result = res.value or {"container": res.item, "issues": [], "skipped": [], "error": res.error}
+            if result["issues"]:
+                self.record_stat("scenario_created")
+                self.save_scenario(result["issues"])
+                self.current_issues.extend(result["issues"])
+            results.append(result)
+        self.issues_changed()
+        return {"seed": recording.seed, "layers": recording.layers, "scenarios": results}
+    
+    def save_recording(self, recording, path=None):
+        """Write recording to path, or to the recordings directory keeping only the newest KEEP there.
+        
+        Returns the path, or None if it could not be written.
+        """
+        try:
+            if path is not None:
+                return recording.save(path)
+            stamp = datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+            path = recording.save(self.recordings_dir / f"{stamp}-{recording.seed}.json")
+            for old in sorted(self.recordings_dir.glob("*.json"), reverse=True)[ScenarioRecording.KEEP:]:
+                old.unlink()
+            return path
+        except OSError as e:
+            print(f"  Warning: could not save recording ({e})", file=sys.stderr)
+            return None
+    
+    def generate_scenarios(self, layers, containers, num_issues=3, seed=None, max_rounds=3):
+        """Build one scenario per container concurrently, without prompts.
+        
+        Each container gets its own generator seeded from seed and its name,
+        so a run is reproducible regardless of scheduling order.
+        """
+        if seed is None:
+            seed = random.randrange(2**31)
+        
+        results = []
+        self.current_issues = []
+        for res in self.fan_out(lambda c: self.build_scenario(
+                layers, c, num_issues, f"{seed}:{c}", max_rounds), containers):
+            result = res.value or {"container": res.item, "issues": [], "skipped": [], "error": res.error}
+            if result["issues"]:
+                self.record_stat("scenario_created")
+                self.save_scenario(result["issues"])
+                self.current_issues.extend(result["issues"])
+            results.append(result)
+        self.issues_changed()
+        return {"seed": seed, "layers": sorted(set(layers)), "scenarios": results}
+    
     def get_layer_name(self, layer):
         """Get OSI layer name"""
         names = {
@@ -230,6 +2873,34 @@ class AdvancedOsiTrainer:
         }
         return names.get(layer, "Unknown")
     
+    def replay_menu(self):
+        """Replay a saved scenario recording"""
+        print("\n" + "="*70)
+        print("Replay a recorded scenario")
+        print("="*70)
+        
+        recordings = sorted(self.recordings_dir.glob("*.json"), reverse=True)[:9]
+        for i, path in enumerate(recordings, 1):
+            print(f"{i}. {path.stem}")
+        print(f"{len(recordings)+1}. Enter a file path")
+        
+        choice = input(f"\nChoice (1-{len(recordings)+1}): ").strip()
+        if choice.isdigit() and 1 <= int(choice) <= len(recordings):
+            path = recordings[int(choice)-1]
+        elif choice == str(len(recordings) + 1):
+            path = Path(input("Recording file: ").strip()).expanduser()
+        else:
+            return
+        
+        try:
+            recording = ScenarioRecording.load(path)
+        except RecordingError as e:
+            print(f"\nCannot replay: {e}")
+            return
+        
+        print_scenarios(self.replay_scenario(recording)["scenarios"])
+        print(f"\nReplayed {len(self.current_issues)} issues from seed {recording.seed}.")
+    
     def real_world_simulations(self):
         """Real-world simulation scenarios"""
         print("\n" + "="*70)
@@ -237,14 +2908,14 @@ class AdvancedOsiTrainer:
         print("="*70)
         
         simulations = [
-            ("Broken web server", [4, 7], "Simulate web server failure"),
-            ("Network outage", [1, 3], "Complete network connectivity loss"),
-            ("Security breach", [2, 4, 7], "Security incident simulation"),
-            ("Slow network", [1, 3, 4], "Performance degradation"),
-            ("DNS/DHCP failure", [3, 7], "Name resolution issues")
+            ("Broken web server", [4, 7], "Simulate web server failure", None),
+            ("Network outage", [1, 3], "Complete network connectivity loss", None),
+            ("Security breach", [2, 4, 7], "Security incident simulation", None),
+            ("Slow network", [1], "Performance degradation", "performance"),
+            ("DNS/DHCP failure", [3, 7], "Name resolution issues", None)
         ]
         
-        for i, (name, layers, desc) in enumerate(simulations, 1):
+        for i, (name, layers, desc, _) in enumerate(simulations, 1):
             print(f"{i}. {name}")
             print(f"   {desc}")
         
@@ -253,12 +2924,20 @@ class AdvancedOsiTrainer:
         try:
             choice = int(input(f"\nSelect simulation (1-{len(simulations)+1}): "))
             if 1 <= choice <= len(simulations):
-                name, layers, desc = simulations[choice-1]
+                name, layers, desc, tag = simulations[choice-1]
                 container = self.select_container()
                 if container:
                     print(f"\nSimulating: {name}")
                     print(f"Description: {desc}")
-                    self.create_scenario(layers, container, name, num_issues=3)
+                    if tag != "performance":
+                        self.create_scenario(layers, container, name, num_issues=3)
+                        return
+                    paths = self.perf_paths(container)
+                    print("\nMeasuring baseline performance...")
+                    before = self.measure_performance(paths=paths)
+                    self.create_scenario(layers, container, name, num_issues=1, tag=tag)
+                    print("\nMeasuring degraded performance...")
+                    self.show_performance(self.measure_performance(paths=paths), before)
         except:
             pass
     
@@ -271,27 +2950,39 @@ class AdvancedOsiTrainer:
         print("\nRunning diagnostics...")
         print("-" * 40)
         
-        print("\nConnectivity matrix:")
-        print("Source -> Target       Status")
-        print("-" * 40)
+        results = self.run_diagnostics()
         
-        sources = ["client", "server", "osi-server"]
-        targets = ["server:80", "osi-server:8080", "router"]
+        print("\nConnectivity matrix:")
+        print("Source     Target             Status   Latency")
+        print("-" * 50)
         
-        for src in sources:
-            for target in targets:
-                if ":" in target:
-                    host, port = target.split(":")
-                    status = self.test_http(src, host, int(port))
-                else:
-                    status = self.test_ping(src, self.containers[target])
-                
-                arrow = "->"
-                print(f"{src:8} {arrow:2} {target:15} {status}")
+        for r in results:
+            if r.test.startswith("->"):
+                latency = f"{r.latency * 1000:.1f} ms" if r.latency is not None else "-"
+                print(f"{r.container:10} {r.test:18} {r.status:8} {latency}")
         
         print("\nOSI layer tests:")
-        print("Layer  Test                          Status")
-        print("-" * 40)
+        print("Container   Layer  Test                      Status")
+        print("-" * 52)
+        
+        for r in results:
+            if not r.test.startswith("->"):
+                layer = f"L{r.layer}" if r.layer else "-"
+                print(f"{r.container:11} {layer:6} {r.test:25} {r.status}")
+        
+        print("\nDiagnostic complete.")
+        return results
+    
+    @exec_caller("diagnose")
+    def run_diagnostics(self, deadline=8.0):
+        """Run the connectivity matrix and every container's layer tests under one deadline.
+        
+        Each container is probed with a single exec: layer tests run as framed
+        batch steps, and its connectivity probes run concurrently in the
+        background inside that same exec. Containers are probed in parallel.
+        """
+        sources = ["client", "server", "osi-server"]
+        targets = ["server:80", "osi-server:8080", "router"]
         
         layer_tests = [
             (1, "Interface status", "ip link show eth0"),
@@ -302,25 +2993,95 @@ class AdvancedOsiTrainer:
             (7, "DNS resolution", "cat /etc/resolv.conf")
         ]
         
-        for layer, test_name, cmd in layer_tests:
-            success, out, _ = self.exec_container("client", cmd)
-            status = "OK" if success and out else "FAIL"
-            print(f"L{layer}    {test_name:25} {status}")
+        end = time.monotonic() + deadline
         
-        print("\nDiagnostic complete.")
+        def probe(container):
+            probes = []
+            if container in sources:
+                for target in targets:
+                    if ":" in target:
+                        host, port = target.split(":")
+                        probes.append((7, target, f"curl -s -o /dev/null -w '%{{time_total}}' "
+                                                  f"--connect-timeout 3 -m 3 http://{self.docker_name(host)}:{port}"))
+                    else:
+                        probes.append((3, target, f"ping -c 1 -W 1 {self.containers[target]}"))
+            
+            commands = [cmd for _, _, cmd in layer_tests]
+            if probes:
+                commands.append(self._parallel_probe_script([cmd for _, _, cmd in probes]))
+            
+            started = time.monotonic()
+            steps = self.exec_batch(container, commands, timeout=max(end - started, 0.5))
+            elapsed = time.monotonic() - started
+            
+            results = []
+            for (layer, name, _), step in zip(layer_tests, steps):
+                status = "OK" if step.success and step.stdout else self._failure_status(step)
+                results.append(DiagnosticResult(layer, name, container, status, elapsed))
+            
+            if probes:
+                step = steps[-1]
+                outcomes = {}
+                for line in step.stdout.splitlines():
+                    parts = line.split(None, 2)
+                    if len(parts) >= 2 and parts[0].isdigit():
+                        outcomes[int(parts[0])] = (parts[1], parts[2] if len(parts) > 2 else "")
+                for i, (layer, target, _) in enumerate(probes):
+                    if i not in outcomes:
+                        results.append(DiagnosticResult(layer, f"-> {target}", container,
+                                                        self._failure_status(step), None))
+                        continue
+                    code, out = outcomes[i]
+                    status = "OK" if code == "0" else ("TIMEOUT" if code == "28" else "FAIL")
+                    results.append(DiagnosticResult(layer, f"-> {target}", container, status,
+                                                    self._probe_latency(out) if status == "OK" else None))
+            return results
+        
+        results = []
+        for res in self.fan_out(probe, list(self.containers), limit=len(self.containers)):
+            if res.error:
+                results.append(DiagnosticResult(None, "exec", res.item, "ERROR", None))
+            else:
+                results.extend(res.value)
+        return results
     
-    def test_ping(self, src, target_ip):
-        """Test ping connectivity"""
-        success, _, _ = self.exec_container(src, f"ping -c 1 -W 1 {target_ip}")
-        return "OK" if success else "FAIL"
+    @staticmethod
+    def _parallel_probe_script(commands):
+        """Shell script running commands concurrently, printing '<index> <exit code> <output>' lines"""
+        token = uuid.uuid4().hex[:12]
+        d = f"/tmp/.osi_diag_{token}"
+        script = [f"mkdir -p {d}"]
+        for i, cmd in enumerate(commands):
+            script.append(f"( {cmd} >{d}/{i} 2>/dev/null; echo $? >{d}/{i}.rc ) &")
+        script.append("wait")
+        script.append(f"for i in {' '.join(str(i) for i in range(len(commands)))}; do "
+                      f"[ -f {d}/$i.rc ] && echo \"$i $(cat {d}/$i.rc) $(tr '\\n' ' ' <{d}/$i)\"; done")
+        script.append(f"rm -rf {d}")
+        return "\n".join(script)
     
-    def test_http(self, src, host, port):
-        """Test HTTP connectivity"""
-        success, _, _ = self.exec_container(src, f"curl -s -o /dev/null -w '%{{http_code}}' http://{host}:{port} --connect-timeout 3")
-        return "OK" if success else "FAIL"
+    @staticmethod
+    def _failure_status(step):
+        return "TIMEOUT" if step.code is None and "timed out" in step.stderr else "FAIL"
     
-    def auto_troubleshoot_demo(self):
-        """Automatic troubleshooting demo"""
+    @staticmethod
+    def _probe_latency(output):
+        """Latency in seconds from curl's time_total or ping's time= field"""
+        match = re.search(r"time=([\d.]+) ms", output)
+        if match:
+            return float(match.group(1)) / 1000
+        try:
+            return float(output.split()[0])
+        except (IndexError, ValueError):
+            return None
+    
+    def auto_troubleshoot_demo(self, demo=None):
+        """Automatic troubleshooting: fix every open issue and verify the repair.
+        
+        Containers are fixed in parallel; within a container fixes run bottom
+        layer first, followed by the verify predicates, all in one exec. Only
+        verified repairs count as fixed. demo (default: the trainer's demo
+        setting) walks through the issues one at a time with presentation pauses.
+        """
         print("\n" + "="*70)
         print("Auto-troubleshoot demo")
         print("="*70)
@@ -329,66 +3090,198 @@ class AdvancedOsiTrainer:
             print("No active issues to troubleshoot.")
             return
         
+        demo = self.demo if demo is None else demo
         print("\nStarting auto-diagnosis...")
-        time.sleep(1)
+        if demo:
+            time.sleep(1)
+            outcomes = self._troubleshoot_paced()
+        else:
+            outcomes = self._troubleshoot_parallel()
         
-        for i, issue in enumerate(self.current_issues, 1):
-            print(f"\nStep {i}: Analyzing layer {issue['layer']} issue...")
-            print(f"   Problem: {issue['issue']}")
-            time.sleep(0.5)
-            
-            fix = self.get_fix_command(issue)
-            if fix:
-                print(f"   Solution: {fix if isinstance(fix, str) else ' '.join(fix)}")
+        verified = sum(1 for _, status, _ in outcomes if status == "verified")
+        print(f"\n{verified} of {len(outcomes)} fixes verified.")
+        self.current_issues = []
+        print("\nAuto-troubleshoot complete.")
+    
+    def _fix_plan(self):
+        """Open issues grouped by container, each group ordered bottom layer first"""
+        plan = defaultdict(list)
+        for issue in sorted(self.open_issues(), key=lambda issue: issue["layer"]):
+            plan[issue["container"]].append(issue)
+        return plan
+    
+    def _settle_fix(self, issue, fix_step, verify_step):
+        """Status of one repair attempt; stats are only recorded for verified repairs"""
+        if not fix_step.success:
+            return "failed", fix_step.stderr
+        if verify_step is not None and verify_step.success:
+            self.mark_fixed(issue)
+            return "verified", ""
+        return "unverified", verify_step.stderr if verify_step is not None else "no verify predicate"
+    
+    @exec_caller("fix")
+    def _troubleshoot_parallel(self):
+        """Fix all containers concurrently, one exec per container; returns (issue, status, note) tuples"""
+        plan = self._fix_plan()
+        
+        def repair(container):
+            issues = [issue for issue in plan[container] if self.get_fix_command(issue)]
+            verifiable = [issue for issue in issues if issue.get("verify")]
+            steps = self.exec_batch(container, [self.get_fix_command(issue) for issue in issues]
+                                    + [issue["verify"] for issue in verifiable])
+            verify_steps = dict(zip((id(issue) for issue in verifiable), steps[len(issues):]))
+            return [(issue,) + self._settle_fix(issue, step, verify_steps.get(id(issue)))
+                    for issue, step in zip(issues, steps)]
+        
+        outcomes = []
+        for res in self.fan_out(repair, list(plan)):
+            print(f"\n{res.item}:")
+            if res.error:
+                print(f"   Error: {res.error[:60]}")
+                continue
+            attempted = {id(issue) for issue, _, _ in res.value}
+            for issue in plan[res.item]:
+                if id(issue) not in attempted:
+                    print(f"   L{issue['layer']} {issue['issue']}: no automated fix available.")
+            for issue, status, note in res.value:
+                print(f"   L{issue['layer']} {issue['issue']}: {status}." + (f" {note[:60]}" if note else ""))
+            outcomes.extend(res.value)
+        return outcomes
+    
+    def _troubleshoot_paced(self):
+        """Walk through the issues one by one with pauses; returns (issue, status, note) tuples"""
+        outcomes = []
+        step_number = 0
+        for container, issues in self._fix_plan().items():
+            for issue in issues:
+                step_number += 1
+                print(f"\nStep {step_number}: Analyzing layer {issue['layer']} issue on {container}...")
+                print(f"   Problem: {issue['issue']}")
                 time.sleep(0.5)
                 
-                print("   Applying fix...", end="", flush=True)
-                success, _, err = self.exec_container(issue['container'], 
-                    fix if isinstance(fix, str) else " ".join(fix))
+                fix = self.get_fix_command(issue)
+                if not fix:
+                    print("   No automated fix available.")
+                    time.sleep(0.5)
+                    continue
                 
-                if success:
-                    print(" done.")
-                    self.stats["issues_fixed"] += 1
-                    self.stats["by_layer"][issue["layer"]]["fixed"] += 1
-                else:
-                    print(" warning.")
-                    print(f"   Note: {err[:60]}")
+                print(f"   Solution: {fix}")
+                time.sleep(0.5)
+                
+                print("   Applying fix...", end="", flush=True)
+                with exec_caller("fix"):
+                    fix_step = self.exec_batch(container, [fix])[0]
+                verify_step = None
+                if issue.get("verify"):
+                    with exec_caller("verify"):
+                        verify_step = self.exec_batch(container, [issue["verify"]], cache=False)[0]
+                status, note = self._settle_fix(issue, fix_step, verify_step)
+                print(f" {status}.")
+                if note:
+                    print(f"   Note: {note[:60]}")
+                outcomes.append((issue, status, note))
+                time.sleep(0.5)
+        return outcomes
+    
+    def open_issues(self):
+        """Active issues that have not been fixed yet"""
+        return [issue for issue in list(self.current_issues) if not issue.get("fixed_at")]
+    
+    def issues_changed(self):
+        """Tell the fix watcher that the set of active issues changed"""
+        if self.watcher is not None:
+            self.watcher.wake()
+    
+    def close_issues(self):
+        """Drop the active issues without counting them as fixed, e.g. before a reset"""
+        with self.issues_lock:
+            now = datetime.now().isoformat()
+            for issue in self.current_issues:
+                issue.setdefault("closed_at", now)
+            self.current_issues = []
+        self.issues_changed()
+    
+    def mark_fixed(self, issue):
+        """Record an issue as fixed exactly once; returns False if it already was or was closed"""
+        with self.issues_lock:
+            if issue.get("fixed_at") or issue.get("closed_at"):
+                return False
+            now = datetime.now()
+            issue["fixed_at"] = now.isoformat()
+            issue["time_to_fix"] = (now - datetime.fromisoformat(issue["time"])).total_seconds()
+        self.record_stat("issue_fixed", layer=issue["layer"], issue=issue["issue"],
+                         container=issue["container"], seconds=issue["time_to_fix"],
+                         scenario=issue.get("scenario"))
+        return True
+    
+    @exec_caller("verify")
+    def check_fixes(self, containers=None):
+        """Evaluate verify predicates of open issues, one exec per container; returns newly fixed issues"""
+        by_container = defaultdict(list)
+        for issue in self.open_issues():
+            if issue.get("verify") and (containers is None or issue["container"] in containers):
+                by_container[issue["container"]].append(issue)
+        
+        fixed = []
+        results = self.fan_out(
+            lambda c: self.exec_batch(c, [issue["verify"] for issue in by_container[c]], cache=False),
+            list(by_container))
+        for res in results:
+            if res.error:
+                continue
+            for issue, step in zip(by_container[res.item], res.value):
+                if step.success and self.mark_fixed(issue):
+                    fixed.append(issue)
+        return fixed
+    
+    def fix_progress(self):
+        """Check and show which active issues have been fixed"""
+        print("\n" + "="*70)
+        print("Fix progress")
+        print("="*70)
+        
+        if not self.current_issues:
+            print("No active issues.")
+            return
+        
+        self.check_fixes()
+        for issue in self.current_issues:
+            if issue.get("fixed_at"):
+                status = f"fixed in {issue['time_to_fix']:.0f}s"
             else:
-                print("   No automated fix available.")
-            
-            time.sleep(0.5)
+                status = "open"
+            print(f"   L{issue['layer']} {issue['issue']:25} {issue['container']:11} {status}")
+    
+    def start_watcher(self):
+        """Watch for issues fixed by hand in the background"""
+        def announce(issue):
+            print(f"\n  Fixed: layer {issue['layer']} {issue['issue']} on {issue['container']}"
+                  f" after {issue['time_to_fix']:.0f}s.")
         
-        self.current_issues = []
-        self.save_stats()
-        print("\nAuto-troubleshoot complete.")
+        self.watcher = FixWatcher(self, on_fixed=announce,
+                                  max_interval=60.0 if self.events is not None else 15.0)
+        self.watcher.start()
+    
+    def start_events(self):
+        """Follow docker and netlink events instead of relying on polling alone"""
+        self.events = EventMonitor({c: self.docker_name(c) for c in self.containers}, self.handle_event)
+        self.events.start()
+    
+    def handle_event(self, event):
+        """React to a TrainerEvent: drop cached results and re-verify the affected container's issues"""
+        self.exec_cache.invalidate(event.container)
+        if self.watcher is not None and event.kind != "container_die":
+            self.watcher.wake(event.container)
     
     def get_fix_command(self, issue):
         """Get fix command for an issue"""
-        fixes = {
-            "Interface Down": "ip link set eth0 up",
-            "Wrong MTU (500)": "ip link set eth0 mtu 1500",
-            "Interface Promiscuous": "ip link set eth0 promisc off",
-            "MAC Address Changed": "ip link set eth0 address 02:42:ac:13:00:03",
-            "VLAN Created": "ip link delete eth0.10",
-            "Wrong Route": "ip route del 10.0.0.0/24 via 172.19.0.99",
-            "IP Conflict": lambda issue: f"ip addr flush dev eth0 2>/dev/null || true && ip addr add {self.containers[issue['container']]}/24 dev eth0",
-            "Route Loop": "ip route del 172.19.0.0/24 via 172.19.0.3",
-            "Subnet Flushed": lambda issue: f"ip addr add {self.containers[issue['container']]}/24 dev eth0",
-            "HTTP Port Blocked": "iptables -D INPUT -p tcp --dport 80 -j REJECT",
-            "ICMP Blocked": "iptables -D INPUT -p icmp -j DROP",
-            "SYN Flood Protection": "iptables -D INPUT -p tcp --syn -m limit --limit 1/s -j ACCEPT",
-            "TCP Keepalive Disabled": "sh -c 'echo 7200 > /proc/sys/net/ipv4/tcp_keepalive_time 2>/dev/null || true'",
-            "Bad Certs Folder": "rm -rf /tmp/badcerts",
-            "Wrong Encoding": "sh -c \"grep -v 'export LANG=C' /etc/profile > /tmp/profile && mv /tmp/profile /etc/profile\"",
-            "Web Server Killed": "sh -c 'cd /tmp && python3 -m http.server 80 >/dev/null 2>&1 &'",
-            "DNS Broken": "sh -c \"echo 'nameserver 8.8.8.8' > /etc/resolv.conf\"",
-            "App Firewall": "iptables -D INPUT -p tcp --dport 80 -m string --string 'GET /malicious' --algo bm -j DROP"
-        }
-        
-        fix = fixes.get(issue["issue"])
-        if callable(fix):
-            return fix(issue)
-        return fix
+        fix = issue.get("fix")
+        if fix is None:
+            entry = self.catalog.get(issue.get("id"))
+            if entry is None:
+                return None
+            fix = entry[1]["fix"]
+        return fix.replace("{ip}", self.containers[issue["container"]])
     
     def settings_and_tools(self):
         """Settings and tools menu"""
@@ -401,9 +3294,12 @@ class AdvancedOsiTrainer:
             print("2. Check container capabilities")
             print("3. Install missing tools")
             print("4. Test network connectivity")
-            print("5. Back to main menu")
+            print(f"5. Persistent shell sessions ({'on' if self.session_mode else 'off'})")
+            print("6. Capture current state as clean baseline")
+            print("7. Measure network performance")
+            print("8. Back to main menu")
             
-            choice = input("\nSelect option (1-5): ").strip()
+            choice = input("\nSelect option (1-8): ").strip()
             
             if choice == "1":
                 self.reset_all_containers()
@@ -414,65 +3310,218 @@ class AdvancedOsiTrainer:
             elif choice == "4":
                 self.test_network()
             elif choice == "5":
+                self.session_mode = not self.session_mode
+                if not self.session_mode:
+                    self.close_sessions()
+                print(f"Persistent shell sessions {'enabled' if self.session_mode else 'disabled'}.")
+            elif choice == "6":
+                for res in self.capture_baseline():
+                    print(f"{res.item}: {'error: ' + res.error[:60] if res.error else 'captured.'}")
+            elif choice == "7":
+                print("\nMeasuring latency and throughput...")
+                self.show_performance(self.measure_performance())
+            elif choice == "8":
                 break
     
+    @exec_caller("reset")
     def reset_all_containers(self):
-        """Reset all containers to clean state"""
+        """Reset all containers to clean state; open issues are closed, not counted as fixed"""
         print("\nResetting all containers...")
         
-        for container in self.containers:
-            print(f"\nCleaning {container}...")
-            
-            self.exec_container(container, "iptables -F")
-            self.exec_container(container, "iptables -X")
-            
-            self.exec_container(container, "ip link set eth0 up 2>/dev/null || true")
-            self.exec_container(container, "ip link set eth0 promisc off 2>/dev/null || true")
-            self.exec_container(container, "ip link set eth0 mtu 1500 2>/dev/null || true")
-            self.exec_container(container, "ip link delete eth0.10 2>/dev/null || true")
+        self.close_issues()
+        for res in self.fan_out(self.reset_container):
+            if res.error:
+                print(f"\nCleaning {res.item}... error: {res.error[:60]}")
+                continue
+            failed = [step for step in res.value if not step.success]
+            print(f"\nCleaning {res.item}... {len(res.value)} changes applied, {len(failed)} failed.")
+        
+        print("\nAll containers reset.")
+    
+    @exec_caller("reset")
+    def reset_container(self, container):
+        """Reset one container to clean state"""
+        if container in self.baselines:
+            return self.restore_baseline(container)
+        
+        commands = [
+            "iptables -F",
+            "iptables -X",
             
-            self.exec_container(container, "ip route del 10.0.0.0/24 via 172.19.0.99 2>/dev/null || true")
-            self.exec_container(container, "ip route del 172.19.0.0/24 via 172.19.0.3 2>/dev/null || true")
+            "ip link set eth0 up 2>/dev/null || true",
+            "ip link set eth0 promisc off 2>/dev/null || true",
+            "ip link set eth0 mtu 1500 2>/dev/null || true",
+            "ip link delete eth0.10 2>/dev/null || true",
             
-            if container in ["server", "osi-server"]:
-                port = 80 if container == "server" else 8080
-                self.exec_container(container, f"pkill -f 'python.*http' 2>/dev/null || true")
-                self.exec_container(container, f"cd /tmp && python3 -m http.server {port} >/dev/null 2>&1 &")
+            "ip route del 10.0.0.0/24 via 172.19.0.99 2>/dev/null || true",
+            "ip route del 172.19.0.0/24 via 172.19.0.3 2>/dev/null || true",
+            "tc qdisc del dev eth0 root 2>/dev/null || true",
+        ]
         
-        print("\nAll containers reset.")
+        if container in ["server", "osi-server"]:
+            port = 80 if container == "server" else 8080
+            commands.append("pkill -f 'python.*http' 2>/dev/null || true")
+            commands.append(f"cd /tmp && python3 -m http.server {port} >/dev/null 2>&1 &")
+        
+        return self.exec_batch(container, commands)
+    
+    def snapshot(self, container):
+        """Capture the current network state of a container in one exec"""
+        steps = self.exec_batch(container, NetworkSnapshot.capture_commands(), cache=False)
+        if not any(step.success for step in steps):
+            raise RuntimeError(steps[0].stderr or f"Could not read state of {container}")
+        return NetworkSnapshot.from_steps(steps)
+    
+    @exec_caller("baseline")
+    def capture_baseline(self, containers=None, check=False):
+        """Record the current state of containers as their clean baseline.
+        
+        With check, a container where any catalog fault still looks active
+        gets no baseline; resets use the generic cleanup until the next start.
+        """
+        def capture(container):
+            snapshot = self.snapshot(container)
+            if check:
+                active = self.active_faults(container, snapshot)
+                if active:
+                    raise RuntimeError(f"not clean, looks like {', '.join(active)}")
+            return snapshot
+        
+        results = self.fan_out(capture, containers)
+        for res in results:
+            if res.error is None:
+                self.baselines[res.item] = res.value
+                self.baseline_identities[res.item] = self.identities.get(res.item)
+        self.save_baselines()
+        return results
+    
+    def active_faults(self, container, snapshot):
+        """Names of catalog faults whose verify predicate fails in container, in one exec.
+        
+        Only layers this trainer has created issues from are checked, so a
+        start without history loads no fault pack and runs no exec.
+        """
+        layers = [layer for layer in self.catalog.packs.layers()
+                  if self.stats["by_layer"].get(layer, {}).get("created")]
+        if not layers:
+            return []
+        traits = self.container_traits(container)
+        if snapshot.state.get("services") is not None:
+            traits["web_server"] = bool(snapshot.state["services"])
+        issues = [issue for layer in layers
+                  for issue in self.catalog.compatible(container, traits, layer) if issue.get("verify")]
+        steps = self.exec_batch(container, [issue["verify"].replace("{ip}", self.containers[container])
+                                            for issue in issues], cache=False)
+        return [issue["name"] for issue, step in zip(issues, steps) if not step.success]
+    
+    def capture_missing_baselines(self):
+        """Capture a checked baseline for containers without one, or whose container was recreated or restarted"""
+        stale = [c for c in self.containers if c in self.baselines and self.identities.get(c)
+                 and self.baseline_identities.get(c) != self.identities[c]]
+        for container in stale:
+            del self.baselines[container]
+        missing = [c for c in self.containers if c not in self.baselines]
+        if missing:
+            for res in self.capture_baseline(missing, check=True):
+                if res.error:
+                    print(f"  Warning: no baseline for {res.item} ({res.error[:80]})", file=sys.stderr)
     
-    def check_capabilities(self):
+    def restore_baseline(self, container):
+        """Apply the minimal diff between live state and the baseline in one exec"""
+        commands = self.baselines[container].restore_commands(self.snapshot(container))
+        return self.exec_batch(container, commands)
+    
+    def save_baselines(self):
+        """Save network baselines to file"""
+        try:
+            with open(self.baseline_file, 'w') as f:
+                json.dump({c: {"identity": self.baseline_identities.get(c), "state": snap.state}
+                           for c, snap in self.baselines.items()}, f)
+        except OSError:
+            pass
+    
+    def load_baselines(self):
+        """Load network baselines from file"""
+        try:
+            if self.baseline_file.exists():
+                with open(self.baseline_file, 'r') as f:
+                    entries = json.load(f)
+                # Baselines from before identities were kept have no "state" key and count as stale
+                self.baselines = {c: NetworkSnapshot(e.get("state", e)) for c, e in entries.items()}
+                self.baseline_identities = {c: e.get("identity") if "state" in e else None
+                                            for c, e in entries.items()}
+        except (OSError, ValueError, AttributeError):
+            self.baselines = {}
+            self.baseline_identities = {}
+    
+    @exec_caller("probe")
+    def container_capabilities(self, refresh=False, containers=None):
+        """NET_ADMIN and tool availability per container, served from the probe cache when valid.
+        
+        All probes of a container run in one exec; if that exec fails nothing is cached.
+        """
+        tools = ["ip", "iptables", "curl", "python3", "ping", "tc"]
+        
+        def probe(container):
+            identity = self.identities.get(container)
+            cached = None if refresh else self.probe_cache.get(self.docker_name(container), identity, "capabilities")
+            if cached:
+                return cached
+            # Toggles the link but leaves it as it was, so cached results stay valid
+            commands = ["ip link set eth0 down 2>/dev/null; ip link set eth0 up"] + [f"which {t}" for t in tools]
+            steps = self.exec_batch(container, commands, cache=False)
+            if any(step.code is None for step in steps):
+                raise RuntimeError(steps[-1].stderr or "capability probe failed")
+            caps = {"NET_ADMIN": steps[0].success}
+            caps.update((tool, step.success) for tool, step in zip(tools, steps[1:]))
+            self.probe_cache.put(self.docker_name(container), identity, "capabilities", caps)
+            return caps
+        
+        results = self.fan_out(probe, containers)
+        self.probe_cache.save()
+        return results
+    
+    def check_capabilities(self, refresh=False):
         """Check container capabilities"""
         print("\nContainer capabilities:")
         print("-" * 40)
         
-        for container in self.containers:
-            print(f"\n{container}:")
-            
-            success, _, _ = self.exec_container(container, "ip link set eth0 down 2>/dev/null; ip link set eth0 up")
-            print(f"  NET_ADMIN: {'yes' if success else 'no'}")
-            
-            tools = ["ip", "iptables", "curl", "python3", "ping"]
-            for tool in tools:
-                success, _, _ = self.exec_container(container, f"which {tool}")
-                print(f"  {tool}: {'yes' if success else 'no'}")
+        self.identities = self.container_identities()
+        
+        for res in self.container_capabilities(refresh=refresh):
+            print(f"\n{res.item}:")
+            if res.error:
+                print(f"  error: {res.error[:60]}")
+                continue
+            for name, ok in res.value.items():
+                print(f"  {name}: {'yes' if ok else 'no'}")
     
+    @exec_caller("probe")
     def install_tools(self):
         """Install missing tools"""
         print("\nInstalling tools...")
         
         packages = "iproute2 iptables curl python3 iputils"
         
-        for container in self.containers:
-            print(f"\n{container}:", end="", flush=True)
-            success, _, err = self.exec_container(container, f"apk add --no-cache {packages} 2>&1")
+        def install(container):
+            self.probe_cache.invalidate(self.docker_name(container), "capabilities")
+            return self.exec_container(container, f"apk add --no-cache {packages} 2>&1")
+        
+        for res in self.fan_out(install):
+            print(f"\n{res.item}:", end="")
+            if res.error:
+                print(f" error ({res.error[:40]})")
+                continue
+            success, _, err = res.value
             if success:
                 print(" done.")
             else:
                 print(f" warning ({err[:40]})")
         
+        self.probe_cache.save()
         print("\nTools installation attempted.")
     
+    @exec_caller("diagnose")
     def test_network(self):
         """Test network connectivity"""
         print("\nNetwork connectivity test:")
@@ -485,13 +3534,71 @@ class AdvancedOsiTrainer:
             ("Router -> Client", "router", "172.19.0.3", 0)
         ]
         
-        for name, src, target, port in tests:
+        def run_test(test):
+            name, src, target, port = test
             if port > 0:
                 success, _, _ = self.exec_container(src, f"curl -s -o /dev/null -w '%{{http_code}}' http://{target}:{port} --connect-timeout 3")
             else:
                 success, _, _ = self.exec_container(src, f"ping -c 1 -W 1 {target}")
-            
-            print(f"{name:20} {'ok' if success else 'fail'}")
+            return success
+        
+        for res in self.fan_out(run_test, tests):
+            print(f"{res.item[0]:20} {'ok' if res.value else 'fail'}")
+    
+    def perf_paths(self, container=None):
+        """(source, target, port) paths whose traffic crosses container's eth0, where tc faults go.
+        
+        Without a container, the default pair from the client to both web servers.
+        """
+        if container is None:
+            return [("client", "server", 80), ("client", "osi-server", 8080)]
+        if container == "osi-server":
+            return [("client", "osi-server", 8080)]
+        if container == "server":
+            return [("client", "server", 80)]
+        return [(container, "server", 80)]
+    
+    @exec_caller("diagnose")
+    def measure_performance(self, requests=20, seconds=2.0, paths=None):
+        """Probe RTT and throughput on paths; returns {(source, target, port): summary or None}"""
+        paths = paths or self.perf_paths()
+        targets = sorted({target for _, target, _ in paths})
+        life = len(paths) * (2 * seconds + requests * 0.5 + 10)
+        self.fan_out(lambda target: self.exec_container(target, PerfProbe.sink_command(life)), targets)
+        time.sleep(0.5)
+        
+        def probe(source):
+            results = {}
+            for path in [path for path in paths if path[0] == source]:
+                _, target, port = path
+                _, out, _ = self.exec_container(source, PerfProbe.probe_command(
+                    self.containers[target], port, requests, seconds), timeout=requests * 3 + 4 * seconds + 30)
+                results[path] = PerfProbe.summarize(out)
+            return results
+        
+        measurements = {}
+        for res in self.fan_out(probe, sorted({source for source, _, _ in paths})):
+            measurements.update(res.value or {})
+        return {path: measurements.get(path) for path in paths}
+    
+    def show_performance(self, after, before=None):
+        """Print a measurement, side by side with an earlier one if given"""
+        def fmt(m):
+            if m is None:
+                return "unreachable"
+            rate = lambda bps: f"{bps / 1e6:.1f}MB/s" if bps else "-"
+            p50 = f"{m['rtt_p50_ms']:.1f}" if m["rtt_p50_ms"] is not None else "-"
+            p99 = f"{m['rtt_p99_ms']:.1f}" if m["rtt_p99_ms"] is not None else "-"
+            return f"rtt p50 {p50}ms p99 {p99}ms, down {rate(m['download_bps'])}, up {rate(m['upload_bps'])}"
+        
+        for (source, target, port), m in after.items():
+            print(f"\n{source} -> {target}:{port}")
+            if before is not None:
+                print(f"   before: {fmt(before.get((source, target, port)))}")
+                print(f"   after:  {fmt(m)}"
+                      + ("  (degraded)" if PerfProbe.degraded(before.get((source, target, port)), m) else ""))
+            else:
+                print(f"   {fmt(m)}")
     
     def statistics_and_history(self):
         """Show statistics and history"""
@@ -500,24 +3607,60 @@ class AdvancedOsiTrainer:
         print("Statistics and history")
         print("="*70)
 
+        self.load_stats()
+
         print(f"\nOverall statistics:")
         print(f"   Scenarios created: {self.stats['scenarios_created']}")
         print(f"   Issues fixed: {self.stats['issues_fixed']}")
 
-        print("\nBy OSI layer:")
-        print("   Layer  Created  Fixed  Success rate")
-        print("   " + "-" * 35)
-
-        for layer in range(1, 8):
-            created = self.stats["by_layer"][layer]["created"]
-            fixed = self.stats["by_layer"][layer]["fixed"]
+        summary = self.stats_store.summary()
+        
+        def duration(seconds):
+            if seconds is None:
+                return "-"
+            return f"{seconds / 60:.1f}m" if seconds >= 60 else f"{seconds:.0f}s"
+        
+        def percent(value, signed=False):
+            if value is None:
+                return "-"
+            return f"{value:+.1f}" if signed else f"{value:.1f}%"
+        
+        def row(label, entry, created=None, fixed=None):
+            created = entry["created"] if created is None else created
+            fixed = entry["fixed"] if fixed is None else fixed
             rate = (fixed / created * 100) if created > 0 else 0
-            print(f"   L{layer}     {created:6}  {fixed:5}  {rate:5.1f}%")
+            print(f"   {label:<20} {created:7}  {fixed:5}  {rate:6.1f}%  {duration(entry['median_ttf']):>7}"
+                  f"  {duration(entry['p90_ttf']):>7}  {percent(entry['recent_success_rate']):>7}"
+                  f"  {percent(entry['trend'], signed=True):>6}")
+        
+        header = (f"   {'':<20} {'Created':>7}  {'Fixed':>5}  {'Success':>7}  {'Median':>7}  {'p90':>7}"
+                  f"  {'Recent':>7}  {'Trend':>6}")
+        print(f"\nBy OSI layer (time to fix; recent = last {HistoryAnalytics.WINDOW} scenarios):")
+        print(header)
+        print("   " + "-" * (len(header) - 3))
+        for layer in range(1, 8):
+            entry = summary["layers"].get(str(layer), HistoryAnalytics.describe(HistoryAnalytics.new_aggregate()))
+            row(f"L{layer} {self.get_layer_name(layer)}", entry,
+                self.stats["by_layer"][layer]["created"], self.stats["by_layer"][layer]["fixed"])
+        
+        if summary["containers"]:
+            print("\nBy container:")
+            print(header)
+            for container, entry in summary["containers"].items():
+                row(container, entry)
+        
+        issues = [(name, entry) for name, entry in summary["issues"].items() if entry["created"]]
+        if issues:
+            print("\nHardest issues:")
+            print(header)
+            for name, entry in sorted(issues, key=lambda item: (item[1]["success_rate"], -item[1]["created"]))[:5]:
+                row(name[:20], entry)
 
         if self.stats["history"]:
             print(f"\nRecent history ({len(self.stats['history'])} items):")
             for i, item in enumerate(self.stats["history"][-5:], 1):
-                print(f"   {i}. {item}")
+                names = ", ".join(item.get("names", [])) or f"{item['issues']} issues"
+                print(f"   {i}. {item['timestamp'][:16]}  {item['container']}: {names}")
     
     def help_and_tutorials(self):
         """Help and tutorials"""
@@ -646,35 +3789,40 @@ class AdvancedOsiTrainer:
         
         print(textwrap.dedent(about_text))
     
-    def save_scenario(self):
+    def save_scenario(self, issues=None):
         """Save current scenario to history"""
-        if self.current_issues:
+        issues = self.current_issues if issues is None else issues
+        if issues:
             scenario = {
                 "timestamp": datetime.now().isoformat(),
-                "issues": len(self.current_issues),
-                "layers": list(set(issue["layer"] for issue in self.current_issues)),
-                "container": self.current_issues[0]["container"]
+                "scenario": issues[0].get("scenario"),
+                "issues": len(issues),
+                "names": [issue["issue"] for issue in issues],
+                "layers": list(set(issue["layer"] for issue in issues)),
+                "container": issues[0]["container"]
             }
-            self.stats["history"].append(scenario)
-            self.save_stats()
+            self.record_stat("history", entry=scenario)
+    
+    def record_stat(self, kind, **fields):
+        """Record a statistics event"""
+        try:
+            self.stats_store.record(kind, **fields)
+        except OSError as e:
+            print(f"  Warning: could not record statistics ({e})", file=sys.stderr)
     
     def save_stats(self):
-        """Save statistics to file"""
+        """Compact the statistics journal into the stats file"""
         try:
-            with open(self.stats_file, 'w') as f:
-                json.dump(self.stats, f, indent=2)
-        except:
-            pass
+            self.stats_store.compact()
+        except OSError as e:
+            print(f"  Warning: could not save statistics ({e})", file=sys.stderr)
     
     def load_stats(self):
         """Load statistics from file"""
         try:
-            if self.stats_file.exists():
-                with open(self.stats_file, 'r') as f:
-                    loaded = json.load(f)
-                    self.stats.update(loaded)
-        except:
-            pass
+            self.stats_store.refresh()
+        except OSError as e:
+            print(f"  Warning: could not load statistics ({e})", file=sys.stderr)
     
     def main_menu(self):
         """Main menu"""
@@ -687,8 +3835,10 @@ class AdvancedOsiTrainer:
                 ("Practice by difficulty level", self.practice_by_difficulty),
                 ("Generate targeted layer scenario", self.targeted_layer_scenario),
                 ("Real-world simulations", self.real_world_simulations),
+                ("Replay a recorded scenario", self.replay_menu),
                 ("Comprehensive diagnostics", self.comprehensive_diagnostics),
                 ("Auto-troubleshoot demo", self.auto_troubleshoot_demo),
+                ("Check fix progress", self.fix_progress),
                 ("Settings and tools", self.settings_and_tools),
                 ("Statistics and history", self.statistics_and_history),
                 ("Help and tutorials", self.help_and_tutorials),
@@ -715,30 +3865,648 @@ class AdvancedOsiTrainer:
             except:
                 print("Invalid input.")
 
-def main():
+class HTTPError(Exception):
+    """An error answered with an HTTP status code"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class TrainerService:
+    """Local HTTP/JSON API serving many labs from one process.
+    
+    Requests are parsed on an asyncio loop. Trainer work runs in a thread
+    pool, with one AdvancedOsiTrainer per lab created on first use and then
+    reused, so detect_shells runs once per lab. A per-lab asyncio.Lock
+    serializes requests against the same lab while other labs proceed in
+    parallel. Statistics go to the shared journal of StatsStore.
+    """
+
+    REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+               413: "Payload Too Large", 500: "Internal Server Error"}
+    MAX_BODY = 1 << 20
+
+    def __init__(self, manager, trainer_options, workers=16):
+        self.manager = manager
+        self.trainer_options = trainer_options
+        self.trainers = {}
+        self.locks = {}
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.stats = StatsStore(Path.home() / ".osi_trainer_stats.json")
+        self.routes = [
+            ("GET", re.compile(r"/health"), self.health),
+            ("GET", re.compile(r"/labs"), self.list_labs),
+            ("GET", re.compile(r"/stats"), self.get_stats),
+            ("GET", re.compile(r"/stats/summary"), self.get_summary),
+            ("GET", re.compile(r"/labs/([\w-]+)/issues"), self.get_issues),
+            ("POST", re.compile(r"/labs/([\w-]+)/scenarios"), self.create_scenarios),
+            ("POST", re.compile(r"/labs/([\w-]+)/replay"), self.replay),
+            ("GET", re.compile(r"/labs/([\w-]+)/diagnostics"), self.diagnostics),
+            ("POST", re.compile(r"/labs/([\w-]+)/check"), self.check_fixes),
+            ("POST", re.compile(r"/labs/([\w-]+)/reset"), self.reset),
+        ]
+
+    async def run(self, func, *args):
+        """Run blocking trainer code in the worker pool"""
+        return await asyncio.get_event_loop().run_in_executor(self.executor, func, *args)
+
+    async def trainer(self, name, work):
+        """Run work(trainer) for a lab while holding that lab's lock"""
+        try:
+            lab = self.manager.get(name)
+        except KeyError as e:
+            raise HTTPError(404, e.args[0])
+        lock = self.locks.setdefault(lab.name, asyncio.Lock())
+        async with lock:
+            if lab.name not in self.trainers:
+                self.trainers[lab.name] = await self.run(
+                    lambda: AdvancedOsiTrainer(lab=lab, **self.trainer_options))
+            return await self.run(work, self.trainers[lab.name])
+
+    async def health(self, body):
+        health = {"status": "ok", "labs": sorted(self.trainers)}
+        metrics = self.trainer_options.get("metrics")
+        if metrics is not None and metrics.limiter is not None:
+            health["execs"] = metrics.limiter.snapshot()
+        return health
+
+    async def list_labs(self, body):
+        labs = [{"name": "default", "state": "ready"}]
+        labs += [{"name": lab.name, "state": lab.state}
+                 for lab in sorted(self.manager.labs.values(), key=lambda lab: lab.index)]
+        return {"labs": labs}
+
+    async def get_stats(self, body):
+        def read():
+            self.stats.refresh()
+            with self.stats.lock:
+                return json.loads(json.dumps(self.stats.stats))
+        return await self.run(read)
+
+    async def get_summary(self, body):
+        def read():
+            self.stats.refresh()
+            return self.stats.summary()
+        return await self.run(read)
+
+    async def get_issues(self, body, lab):
+        return await self.trainer(lab, lambda t: {"issues": list(t.current_issues)})
+
+    async def create_scenarios(self, body, lab):
+        try:
+            layers = parse_layers(str(body.get("layers", "all")))
+            num_issues = int(body.get("issues", 3))
+            max_rounds = int(body.get("max_rounds", 3))
+            seed = body.get("seed")
+            seed = int(seed) if seed is not None else None
+        except (ValueError, argparse.ArgumentTypeError) as e:
+            raise HTTPError(400, str(e))
+        containers = body.get("containers", "all")
+        
+        def create(trainer):
+            chosen = list(trainer.containers) if containers == "all" else list(containers)
+            unknown = [c for c in chosen if c not in trainer.containers]
+            if unknown:
+                raise HTTPError(400, f"Unknown containers: {', '.join(map(str, unknown))}")
+            return trainer.generate_scenarios(layers, chosen, num_issues, seed, max_rounds)
+        
+        return await self.trainer(lab, create)
+
+    async def replay(self, body, lab):
+        try:
+            recording = ScenarioRecording.from_dict(body)
+        except RecordingError as e:
+            raise HTTPError(400, str(e))
+        return await self.trainer(lab, lambda t: t.replay_scenario(recording))
+
+    async def diagnostics(self, body, lab):
+        return await self.trainer(lab, lambda t: {"results": [r._asdict() for r in t.run_diagnostics()]})
+
+    async def check_fixes(self, body, lab):
+        def check(trainer):
+            fixed = trainer.check_fixes()
+            return {"fixed": fixed, "open": trainer.open_issues()}
+        return await self.trainer(lab, check)
+
+    async def reset(self, body, lab):
+        def reset(trainer):
+            trainer.close_issues()
+            report = {}
+            for res in trainer.fan_out(trainer.reset_container):
+                if res.error:
+                    report[res.item] = {"error": res.error}
+                else:
+                    report[res.item] = {"applied": len(res.value),
+                                        "failed": sum(1 for step in res.value if not step.success)}
+            return {"containers": report}
+        return await self.trainer(lab, reset)
+
+    async def handle(self, reader, writer):
+        """Serve one HTTP request on a connection"""
+        status, payload = 200, None
+        try:
+            request = (await reader.readline()).decode("latin-1").split()
+            if len(request) != 3:
+                raise HTTPError(400, "Malformed request line")
+            method, path = request[0], request[1].split("?", 1)[0].rstrip("/") or "/"
+            length = 0
+            while True:
+                line = (await reader.readline()).decode("latin-1").strip()
+                if not line:
+                    break
+                name, _, value = line.partition(":")
+                if name.strip().lower() == "content-length":
+                    length = int(value.strip())
+            if length > self.MAX_BODY:
+                raise HTTPError(413, "Request body too large")
+            raw = await reader.readexactly(length) if length else b""
+            try:
+                body = json.loads(raw) if raw else {}
+            except ValueError:
+                raise HTTPError(400, "Body is not valid JSON")
+            if not isinstance(body, dict):
+                raise HTTPError(400, "Body must be a JSON object")
+            
+            allowed = False
+            for route_method, pattern, handler in self.routes:
+                match = pattern.fullmatch(path)
+                if match:
+                    allowed = True
+                    if route_method == method:
+                        payload = await handler(body, *match.groups())
+                        break
+            else:
+                raise HTTPError(405 if allowed else 404, f"{method} {path} is not supported")
+        except HTTPError as e:
+            status, payload = e.status, {"error": str(e)}
+        except (ValueError, asyncio.IncompleteReadError) as e:
+            status, payload = 400, {"error": str(e) or "Malformed request"}
+        except Exception as e:
+            status, payload = 500, {"error": str(e) or type(e).__name__}
+        
+        data = json.dumps(payload).encode()
+        writer.write(f"HTTP/1.1 {status} {self.REASONS.get(status, '')}\r\n"
+                     f"Content-Type: application/json\r\nContent-Length: {len(data)}\r\n"
+                     f"Connection: close\r\n\r\n".encode() + data)
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+        writer.close()
+
+    async def serve(self, host, port):
+        """Accept connections until cancelled"""
+        server = await asyncio.start_server(self.handle, host, port)
+        print(f"Serving on http://{host}:{port}", flush=True)
+        async with server:
+            await server.serve_forever()
+
+    def close(self):
+        """Release every lab's trainer"""
+        for trainer in self.trainers.values():
+            trainer.close_sessions()
+            trainer.save_stats()
+        self.executor.shutdown(wait=False)
+
+
+def check_docker(backend):
+    """Return an error message if Docker cannot be reached, else None"""
+    if backend == "api":
+        try:
+            DockerAPIClient().ping()
+        except (OSError, DockerAPIError):
+            return "Docker is not running or the socket is not accessible."
+        return None
+    try:
+        result = subprocess.run(["docker", "ps"], capture_output=True, text=True)
+        if result.returncode != 0:
+            return "Docker is not running or not installed."
+    except FileNotFoundError:
+        return "Docker is not installed."
+    return None
+
+
+def parse_layers(spec):
+    """Parse a layer list such as "1-3", "2,4,7" or "all" """
+    if spec == "all":
+        return list(range(1, 8))
+    layers = set()
+    for part in spec.split(","):
+        if "-" in part:
+            low, high = part.split("-", 1)
+            layers.update(range(int(low), int(high) + 1))
+        else:
+            layers.add(int(part))
+    if not layers or not all(1 <= layer <= 7 for layer in layers):
+        raise argparse.ArgumentTypeError(f"invalid layer list: {spec}")
+    return sorted(layers)
+
+
+def parse_args(argv=None):
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description="OSI troubleshooting trainer")
+    parser.add_argument("--backend", choices=["cli", "api"],
+                        default=os.environ.get("OSI_TRAINER_BACKEND", "cli"),
+                        help="how to reach Docker (default: cli)")
+    parser.add_argument("--sessions", action="store_true",
+                        default=os.environ.get("OSI_TRAINER_SESSIONS") == "1",
+                        help="keep a persistent shell per container")
+    parser.add_argument("--parallel", type=int,
+                        default=int(os.environ.get("OSI_TRAINER_PARALLEL", "4")),
+                        help="maximum concurrent container operations (default: 4)")
+    parser.add_argument("--events", action="store_true",
+                        default=os.environ.get("OSI_TRAINER_EVENTS") == "1",
+                        help="follow docker and netlink events to detect fixes as they happen")
+    parser.add_argument("--demo", action="store_true",
+                        default=os.environ.get("OSI_TRAINER_DEMO") == "1",
+                        help="pace the auto-troubleshoot demo for presentations")
+    parser.add_argument("--cache-ttl", type=float,
+                        default=float(os.environ.get("OSI_TRAINER_CACHE_TTL", "5")),
+                        help="seconds to reuse read-only command results, 0 disables (default: 5)")
+    parser.add_argument("--max-execs", type=int,
+                        default=int(os.environ.get("OSI_TRAINER_MAX_EXECS", "16")),
+                        help="maximum execs in flight against dockerd across all labs (default: 16)")
+    parser.add_argument("--exec-rate", type=float,
+                        default=float(os.environ.get("OSI_TRAINER_EXEC_RATE", "0")),
+                        help="maximum execs started per second, 0 for no limit (default: 0)")
+    parser.add_argument("--metrics", default=os.environ.get("OSI_TRAINER_METRICS"),
+                        help="on exit, write exec metrics here (.prom for Prometheus text, otherwise JSON)")
+    parser.add_argument("--trace", default=os.environ.get("OSI_TRAINER_TRACE"),
+                        help="append every exec to this file as a JSON line")
+    parser.add_argument("--lab", default=os.environ.get("OSI_TRAINER_LAB", "default"),
+                        help="lab to drive, see the lab command (default: the setup.sh lab)")
+    
+    commands = parser.add_subparsers(dest="command")
+    generate = commands.add_parser("generate", help="create scenarios without prompts")
+    generate.add_argument("--layers", type=parse_layers, default=list(range(1, 8)),
+                          help='layers to draw issues from, e.g. "1-3" or "2,4" (default: all)')
+    generate.add_argument("--containers", default="all",
+                          help='comma-separated containers or "all" (default: all)')
+    generate.add_argument("--labs", help='comma-separated labs or "all" ready labs (default: --lab)')
+    generate.add_argument("--issues", type=int, default=3, help="issues per container (default: 3)")
+    generate.add_argument("--seed", type=int, help="seed for reproducible scenarios")
+    generate.add_argument("--max-rounds", type=int, default=3, help="injection rounds per container (default: 3)")
+    generate.add_argument("--format", choices=["json", "text"], default="text")
+    generate.add_argument("--record", help="also write a replayable recording of the scenario to this file")
+    
+    replay = commands.add_parser("replay", help="re-stage a recorded scenario, one exec per container")
+    replay.add_argument("recording", help="recording file from generate --record or the menu")
+    replay.add_argument("--labs", help='comma-separated labs or "all" ready labs (default: --lab)')
+    replay.add_argument("--format", choices=["json", "text"], default="text")
+    
+    lab = commands.add_parser("lab", help="provision and tear down trainee labs")
+    lab_commands = lab.add_subparsers(dest="lab_command")
+    lab_commands.required = True
+    create = lab_commands.add_parser("create", help="provision new labs in parallel")
+    create.add_argument("--count", type=int, default=1)
+    lab_commands.add_parser("list", help="show registered labs")
+    destroy = lab_commands.add_parser("destroy", help="remove labs")
+    destroy.add_argument("names", nargs="*")
+    destroy.add_argument("--all", action="store_true", help="remove every registered lab")
+    
+    serve = commands.add_parser("serve", help="serve scenarios, diagnostics and stats over HTTP/JSON")
+    serve.add_argument("--host", default="127.0.0.1", help="address to listen on (default: 127.0.0.1)")
+    serve.add_argument("--port", type=int, default=8765, help="port to listen on (default: 8765)")
+    serve.add_argument("--workers", type=int, default=16, help="threads running trainer work (default: 16)")
+    
+    bench = commands.add_parser("bench", help="time trainer operations against a fake Docker")
+    bench.add_argument("--runs", type=int, default=10, help="runs per operation (default: 10)")
+    bench.add_argument("--latency", type=float, default=0.02, help="seconds per fake exec (default: 0.02)")
+    bench.add_argument("--jitter", type=float, default=0.01, help="extra random seconds per exec (default: 0.01)")
+    bench.add_argument("--failure-rate", type=float, default=0.0, help="share of execs that fail (default: 0)")
+    bench.add_argument("--history", type=int, default=10000,
+                       help="history entries in the stats file for save_stats (default: 10000)")
+    bench.add_argument("--seed", type=int, default=0, help="seed for scenarios and fake latencies (default: 0)")
+    bench.add_argument("--output", help="write the JSON report here instead of stdout")
+    return parser.parse_args(argv)
+
+
+def print_scenarios(scenarios):
+    """Print per-container scenario results as text"""
+    for scenario in scenarios:
+        print(f"\n{scenario['container']}:")
+        if scenario["error"]:
+            print(f"  error: {scenario['error']}")
+        for issue in scenario["issues"]:
+            print(f"  L{issue['layer']} {issue['issue']}")
+        for skipped in scenario["skipped"]:
+            print(f"  skipped L{skipped['layer']} {skipped['issue']}: {skipped['error'][:60]}")
+
+
+def run_generate(args, labs, metrics=None):
+    """Headless scenario generation across labs; returns the process exit code"""
+    unknown = [c for c in (args.containers.split(",") if args.containers != "all" else [])
+               if c not in Lab.TOPOLOGY]
+    if unknown:
+        print(f"Unknown containers: {', '.join(unknown)}", file=sys.stderr)
+        return 2
+    if args.record and len(labs) > 1:
+        print("--record needs a single lab; replay the recording on the others", file=sys.stderr)
+        return 2
+    
+    def generate(lab):
+        trainer = AdvancedOsiTrainer(session_mode=args.sessions, max_parallel=args.parallel,
+                                     backend=args.backend, lab=lab, metrics=metrics, cache_ttl=args.cache_ttl)
+        try:
+            containers = list(trainer.containers) if args.containers == "all" else args.containers.split(",")
+            report = trainer.generate_scenarios(args.layers, containers, args.issues, args.seed, args.max_rounds)
+            if args.record:
+                ScenarioRecording.capture(trainer.catalog, report["seed"], report["layers"],
+                                          trainer.current_issues).save(args.record)
+            return report
+        finally:
+            trainer.close_sessions()
+            trainer.save_stats()
+    
+    reports = []
+    for res in fan_out(generate, labs, args.parallel):
+        report = res.value or {"seed": args.seed, "layers": args.layers, "scenarios": [], "error": res.error}
+        report["lab"] = res.item.name
+        reports.append(report)
+    
+    if args.format == "json":
+        print(json.dumps(reports[0] if args.labs is None else {"labs": reports}, indent=2))
+    else:
+        for report in reports:
+            print(f"Lab: {report['lab']}  Seed: {report['seed']}")
+            if report.get("error"):
+                print(f"  error: {report['error']}")
+            print_scenarios(report["scenarios"])
+            print()
+    
+    complete = all(not report.get("error") and report["scenarios"] and
+                   all(len(s["issues"]) == args.issues for s in report["scenarios"])
+                   for report in reports)
+    return 0 if complete else 1
+
+
+def run_replay(args, labs, metrics=None):
+    """Re-stage a recorded scenario on every lab; returns the process exit code"""
+    try:
+        recording = ScenarioRecording.load(args.recording)
+    except RecordingError as e:
+        print(e, file=sys.stderr)
+        return 2
+    recording.compile()
+    
+    def replay(lab):
+        trainer = AdvancedOsiTrainer(session_mode=args.sessions, max_parallel=args.parallel,
+                                     backend=args.backend, lab=lab, metrics=metrics, cache_ttl=args.cache_ttl)
+        try:
+            return trainer.replay_scenario(recording)
+        finally:
+            trainer.close_sessions()
+            trainer.save_stats()
+    
+    reports = []
+    for res in fan_out(replay, labs, args.parallel):
+        report = res.value or {"seed": recording.seed, "layers": recording.layers, "scenarios": [], "error": res.error}
+        report["lab"] = res.item.name
+        reports.append(report)
+    
+    if args.format == "json":
+        print(json.dumps(reports[0] if args.labs is None else {"labs": reports}, indent=2))
+    else:
+        for report in reports:
+            print(f"Lab: {report['lab']}  Seed: {report['seed']}")
+            if report.get("error"):
+                print(f"  error: {report['error']}")
+            print_scenarios(report["scenarios"])
+            print()
+    
+    complete = all(not report.get("error") and all(not s["error"] and not s["skipped"] for s in report["scenarios"])
+                   for report in reports)
+    return 0 if complete else 1
+
+
+def run_lab(args, manager):
+    """Lab management commands; returns the process exit code"""
+    if args.lab_command == "list":
+        if not manager.labs:
+            print("No labs registered.")
+        for name, lab in sorted(manager.labs.items(), key=lambda item: item[1].index):
+            print(f"{name:8} {lab.state:12} {lab.subnet('main'):15} {lab.subnet('osi'):15} {lab.created or ''}")
+        return 0
+    
+    if args.lab_command == "create":
+        results = manager.create(args.count)
+    else:
+        names = list(manager.labs) if args.all else args.names
+        if not names:
+            print("Nothing to destroy.")
+            return 0
+        try:
+            results = manager.destroy(names)
+        except KeyError as e:
+            print(e.args[0], file=sys.stderr)
+            return 2
+    
+    for res in results:
+        status = f"error: {res.error}" if res.error else res.item.state
+        print(f"{res.item.name:8} {status}")
+    return 1 if any(res.error for res in results) else 0
+
+
+def run_serve(args, manager, metrics=None):
+    """Run the HTTP/JSON service until interrupted; returns the process exit code"""
+    service = TrainerService(manager, {"session_mode": args.sessions, "max_parallel": args.parallel,
+                                       "backend": args.backend, "metrics": metrics,
+                                       "cache_ttl": args.cache_ttl}, workers=args.workers)
+    try:
+        asyncio.run(service.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.close()
+    return 0
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a non-empty list"""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(pct * len(ordered) / 100) - 1)]
+
+
+def run_bench(args, metrics=None):
+    """Time the trainer's main operations against FakeDocker; returns the process exit code.
+    
+    Every operation runs args.runs times in a throwaway home directory and
+    is reported as wall-clock percentiles in milliseconds together with the
+    number of execs it needed per run.
+    """
+    home = tempfile.mkdtemp(prefix="osi_bench_")
+    old_home = os.environ.get("HOME")
+    os.environ["HOME"] = home
+    fake = FakeDocker(Lab().containers, args.latency, args.jitter, args.failure_rate, args.seed)
+    timings = defaultdict(list)
+    execs = defaultdict(list)
+    
+    def timed(name, func):
+        before = fake.execs
+        with contextlib.redirect_stdout(io.StringIO()):
+            started = time.perf_counter()
+            result = func()
+            timings[name].append(time.perf_counter() - started)
+        execs[name].append(fake.execs - before)
+        return result
+    
+    def new_trainer():
+        return AdvancedOsiTrainer(max_parallel=args.parallel, backend="fake", docker_api=fake, metrics=metrics,
+                                  cache_ttl=args.cache_ttl)
+    
+    rng = random.Random(args.seed)
+    containers = ["client", "server", "router"]
+    trainer = None
+    try:
+        for run in range(args.runs):
+            for path in Path(home).glob(".osi_trainer_*"):
+                if path.is_dir():
+                    shutil.rmtree(path)
+                else:
+                    path.unlink()
+            fake.reset()
+            if trainer is not None:
+                trainer.close_sessions()
+            trainer = timed("startup", new_trainer)
+            
+            container = rng.choice(containers)
+            timed("create_scenario", lambda: trainer.create_scenario(
+                list(range(1, 8)), container, "Benchmark scenario", 3, seed=rng.random()))
+            timed("reset_all_containers", trainer.reset_all_containers)
+            timed("comprehensive_diagnostics", trainer.comprehensive_diagnostics)
+            
+            with contextlib.redirect_stdout(io.StringIO()):
+                trainer.create_scenario(list(range(1, 8)), container, "Benchmark scenario", 3, seed=rng.random())
+            timed("auto_troubleshoot_demo", trainer.auto_troubleshoot_demo)
+        
+        entry = {"timestamp": datetime.now().isoformat(), "issues": 3, "layers": [1, 3, 4], "container": "client"}
+        trainer.stats["history"].extend(dict(entry) for _ in range(args.history))
+        trainer.save_stats()
+        for run in range(args.runs):
+            for _ in range(10):
+                trainer.record_stat("history", entry=entry)
+            timed("save_stats", trainer.save_stats)
+    finally:
+        if trainer is not None:
+            trainer.close_sessions()
+        shutil.rmtree(home, ignore_errors=True)
+        if old_home is None:
+            os.environ.pop("HOME", None)
+        else:
+            os.environ["HOME"] = old_home
+    
+    report = {
+        "config": {"runs": args.runs, "latency": args.latency, "jitter": args.jitter,
+                   "failure_rate": args.failure_rate, "parallel": args.parallel,
+                   "history": args.history, "seed": args.seed},
+        "operations": {},
+    }
+    for name, values in timings.items():
+        ms = [v * 1000 for v in values]
+        report["operations"][name] = {
+            "runs": len(ms),
+            "mean_ms": round(sum(ms) / len(ms), 3),
+            "min_ms": round(min(ms), 3),
+            "p50_ms": round(percentile(ms, 50), 3),
+            "p90_ms": round(percentile(ms, 90), 3),
+            "p99_ms": round(percentile(ms, 99), 3),
+            "max_ms": round(max(ms), 3),
+            "execs_per_run": round(sum(execs[name]) / len(execs[name]), 2),
+        }
+    if metrics is not None and metrics.limiter is not None:
+        report["limiter"] = metrics.limiter.snapshot()
+    
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+    return 0
+
+
+def main(argv=None):
     """Main function"""
+    args = parse_args(argv)
+    metrics = ExecMetrics(args.trace, ExecLimiter(args.max_execs, args.exec_rate))
+    try:
+        return run_command(args, metrics)
+    finally:
+        if args.metrics:
+            try:
+                metrics.export(args.metrics)
+            except OSError as e:
+                print(f"Could not write metrics: {e}", file=sys.stderr)
+
+
+def run_command(args, metrics):
+    """Run the selected command or the interactive trainer; returns the process exit code"""
+    if args.command == "bench":
+        return run_bench(args, metrics)
+    
+    manager = LabManager(max_parallel=args.parallel)
+    
+    if args.command in ("generate", "replay", "lab", "serve"):
+        error = check_docker(args.backend)
+        if error:
+            print(error, file=sys.stderr)
+            return 1
+        if args.command == "lab":
+            return run_lab(args, manager)
+        if args.command == "serve":
+            return run_serve(args, manager, metrics)
+        try:
+            if args.labs == "all":
+                labs = [lab for lab in manager.labs.values() if lab.state == "ready"]
+            else:
+                labs = [manager.get(name) for name in (args.labs or args.lab).split(",")]
+        except KeyError as e:
+            print(e.args[0], file=sys.stderr)
+            return 2
+        if not labs:
+            print("No ready labs.", file=sys.stderr)
+            return 1
+        if args.command == "replay":
+            return run_replay(args, labs, metrics)
+        return run_generate(args, labs, metrics)
+    
     print("\n" + "="*70)
     print("Advanced OSI Troubleshooting Trainer - Clean Version")
     print("="*70)
     print("Initializing...")
     
+    error = check_docker(args.backend)
+    if error:
+        print(error)
+        print("Please start Docker and try again.")
+        return 1
+    
     try:
-        result = subprocess.run(["docker", "ps"], capture_output=True, text=True)
-        if result.returncode != 0:
-            print("Docker is not running or not installed.")
-            print("Please start Docker and try again.")
-            return
-    except FileNotFoundError:
-        print("Docker is not installed.")
-        print("Please install Docker and try again.")
-        return
+        lab = manager.get(args.lab)
+    except KeyError as e:
+        print(e.args[0])
+        return 1
     
-    trainer = AdvancedOsiTrainer()
-    trainer.main_menu()
+    trainer = AdvancedOsiTrainer(session_mode=args.sessions, max_parallel=args.parallel,
+                                 backend=args.backend, lab=lab, metrics=metrics, demo=args.demo,
+                                 cache_ttl=args.cache_ttl)
+    if args.events:
+        trainer.start_events()
+    trainer.start_watcher()
+    try:
+        trainer.main_menu()
+    finally:
+        trainer.watcher.stop()
+        if trainer.events is not None:
+            trainer.events.stop()
+        trainer.close_sessions()
+        trainer.save_stats()
+    return 0
 
 if __name__ == "__main__":
     try:
-        main()
+        sys.exit(main())
     except KeyboardInterrupt:
         print("\n\nGoodbye!")
     except Exception as e:
@@ -0,0 +1,51 @@
+"""Shared test setup: a private HOME, the repo on sys.path, and stand-ins for Docker"""
+
+import os
+import stat
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+os.environ["HOME"] = tempfile.mkdtemp(prefix="osi_test_home_")
+
+from osi_trainer import AdvancedOsiTrainer, FakeDocker, Lab, StatsStore
+
+DOCKER_STUB = """#!/bin/sh
+# docker exec [-i] [-e K=V]... <container> <cmd>...: runs <cmd> on this host
+[ "$1" = exec ] || exit 1
+shift
+while [ $# -gt 0 ]; do
+  case "$1" in
+    -i) shift;;
+    -e) export "$2"; shift 2;;
+    *) break;;
+  esac
+done
+shift
+exec "$@"
+"""
+
+
+def fake_trainer(fake=None, **kwargs):
+    """Trainer on FakeDocker with a fresh HOME, so no state leaks between tests"""
+    os.environ["HOME"] = tempfile.mkdtemp(prefix="osi_test_home_")
+    if fake is None:
+        fake = FakeDocker(Lab().containers, latency=0, jitter=0, seed=1)
+    return AdvancedOsiTrainer(backend="fake", docker_api=fake, **kwargs)
+
+
+def created_before(layer, issue, container):
+    """Record in HOME's stats that an earlier session created issue, so startup checks its layer"""
+    StatsStore(Path.home() / ".osi_trainer_stats.json").record(
+        "issue_created", layer=layer, issue=issue, container=container, scenario="earlier")
+
+
+def local_docker_path():
+    """PATH value whose `docker exec` runs commands on this host instead of in a container"""
+    bin_dir = Path(tempfile.mkdtemp(prefix="osi_test_bin_"))
+    stub = bin_dir / "docker"
+    stub.write_text(DOCKER_STUB)
+    stub.chmod(stub.stat().st_mode | stat.S_IXUSR)
+    return f"{bin_dir}{os.pathsep}{os.environ.get('PATH', '')}"
@@ -0,0 +1,168 @@
+"""Network baselines: snapshot diffs, identity checks and clean-state predicates"""
+
+import os
+import stat
+import subprocess
+import tempfile
+import unittest
+from pathlib import Path
+
+from support import created_before, fake_trainer
+
+from osi_trainer import AdvancedOsiTrainer, FakeDocker, FaultPacks, IssueCatalog, Lab, NetworkSnapshot, \
+    default_fault_dirs
+
+IP_STUB = """#!/bin/sh
+# Just enough of ip(8) for IP Conflict: addr add/flush and addr show of eth0
+case "$*" in
+  "addr add "*) echo "    inet $3 scope global eth0" >> "$OSI_TEST_ADDRS";;
+  "addr flush dev eth0") : > "$OSI_TEST_ADDRS";;
+  "-4 addr show eth0")
+    echo "2: eth0@if7: <BROADCAST,MULTICAST,UP,LOWER_UP> mtu 1500 qdisc noqueue state UP"
+    cat "$OSI_TEST_ADDRS";;
+  *) exit 1;;
+esac
+"""
+
+
+def state(**changes):
+    """Snapshot state of a clean client, with some keys replaced"""
+    base = {
+        "iptables": "*filter\n:INPUT ACCEPT [0:0]\nCOMMIT",
+        "addr": [{"ifname": "eth0", "addr_info": [
+            {"family": "inet", "local": "172.19.0.3", "prefixlen": 16, "scope": "global"},
+            {"family": "inet6", "local": "fe80::1", "prefixlen": 64, "scope": "link"}]}],
+        "route": [{"dst": "default", "gateway": "172.19.0.1", "dev": "eth0"},
+                  {"dst": "172.19.0.0/16", "dev": "eth0", "protocol": "kernel"}],
+        "link": [{"ifname": "lo", "flags": ["LOOPBACK", "UP"], "mtu": 65536, "link_type": "loopback"},
+                 {"ifname": "eth0", "flags": ["BROADCAST", "UP"], "mtu": 1500,
+                  "address": "02:42:ac:13:00:03", "link_type": "ether"}],
+        "resolv": "nameserver 127.0.0.11",
+        "profile": "export PATH=/bin",
+        "sysctl": {"net/ipv4/tcp_keepalive_time": "7200"},
+        "services": ["python3 -m http.server 80"],
+        "qdisc": "qdisc noqueue 0: root refcnt 2",
+    }
+    base.update(changes)
+    return base
+
+
+class NetworkSnapshotTest(unittest.TestCase):
+
+    def test_clean_container_needs_nothing(self):
+        self.assertEqual(NetworkSnapshot(state()).restore_commands(NetworkSnapshot(state())), [])
+
+    def test_restore_reverts_every_kind_of_change(self):
+        clean = state()
+        eth0 = dict(clean["link"][1], flags=["BROADCAST", "PROMISC"], mtu=500, address="00:11:22:33:44:55")
+        vlan = {"ifname": "eth0.10", "flags": ["BROADCAST"], "mtu": 1500, "link_type": "ether"}
+        extra = {"family": "inet", "local": "172.19.0.2", "prefixlen": 24, "scope": "global"}
+        live = state(
+            iptables="*filter\n:INPUT ACCEPT [7:420]\n-A INPUT -p icmp -j DROP\nCOMMIT",
+            addr=[{"ifname": "eth0", "addr_info": clean["addr"][0]["addr_info"] + [extra]}],
+            route=clean["route"] + [{"dst": "10.0.0.0/24", "gateway": "172.19.0.99", "dev": "eth0"}],
+            link=[clean["link"][0], eth0, vlan],
+            resolv="nameserver 127.0.0.1",
+            sysctl={"net/ipv4/tcp_keepalive_time": "999999"},
+            services=[],
+            qdisc="qdisc netem 8001: root refcnt 2 limit 1000 delay 200ms",
+        )
+        commands = NetworkSnapshot(clean).restore_commands(NetworkSnapshot(live))
+        self.assertEqual(commands[0], "iptables-restore <<'OSI_EOF'\n" + clean["iptables"] + "\nOSI_EOF")
+        self.assertEqual(commands[1].splitlines()[1:-1], [
+            "link delete dev eth0.10",
+            "link set dev eth0 address 02:42:ac:13:00:03",
+            "link set dev eth0 mtu 1500",
+            "link set dev eth0 promisc off",
+            "link set dev eth0 up",
+            "addr del 172.19.0.2/24 dev eth0",
+            "route del 10.0.0.0/24 via 172.19.0.99 dev eth0",
+        ])
+        self.assertEqual(commands[2:], [
+            "tc qdisc del dev eth0 root",
+            "cat > /etc/resolv.conf <<'OSI_EOF'\nnameserver 127.0.0.11\nOSI_EOF",
+            "echo 7200 > /proc/sys/net/ipv4/tcp_keepalive_time",
+            "cd /tmp && python3 -m http.server 80 >/dev/null 2>&1 &",
+        ])
+
+    def test_iptables_counters_are_not_a_change(self):
+        live = NetworkSnapshot(state())
+        dump = "# Generated by iptables-save\n*filter\n:INPUT ACCEPT [9:99]\nCOMMIT"
+        live.state["iptables"] = NetworkSnapshot.normalize_iptables(dump)
+        self.assertEqual(NetworkSnapshot(state()).restore_commands(live), [])
+
+
+class IpConflictPredicateTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.fault = IssueCatalog(FaultPacks(default_fault_dirs())).get("l3-ip-conflict")[1]
+
+    def setUp(self):
+        bin_dir = Path(tempfile.mkdtemp(prefix="osi_test_bin_"))
+        stub = bin_dir / "ip"
+        stub.write_text(IP_STUB)
+        stub.chmod(stub.stat().st_mode | stat.S_IXUSR)
+        self.addrs = bin_dir / "addrs"
+        self.env = dict(os.environ, PATH=f"{bin_dir}{os.pathsep}{os.environ['PATH']}",
+                        OSI_TEST_ADDRS=str(self.addrs))
+
+    def sh(self, command, ip):
+        command = command.replace("{ip}", ip)
+        return subprocess.run(["sh", "-c", command], env=self.env, capture_output=True).returncode == 0
+
+    def test_predicate_fails_while_injected_and_passes_after_the_fix(self):
+        for ip in ("172.19.0.3", "172.19.0.2"):
+            with self.subTest(ip=ip):
+                self.addrs.write_text(f"    inet {ip}/16 brd 172.19.255.255 scope global eth0\n")
+                self.assertTrue(self.sh(self.fault["verify"], ip))
+                self.assertTrue(self.sh(self.fault["cmd"], ip))
+                self.assertFalse(self.sh(self.fault["verify"], ip))
+                self.assertTrue(self.sh(self.fault["fix"], ip))
+                self.assertTrue(self.sh(self.fault["verify"], ip))
+
+
+class DirtyDocker(FakeDocker):
+    """FakeDocker whose server still carries IP Conflict, and whose identities can change"""
+
+    generation = 0
+
+    def inspect_container(self, container):
+        info = super().inspect_container(container)
+        return dict(info, Id=f"{info['Id']}-{self.generation}")
+
+    def respond(self, container, command):
+        if container == "server" and "inet 172.19.0.2/24" in command:
+            return 1, ""
+        return super().respond(container, command)
+
+
+class BaselineCaptureTest(unittest.TestCase):
+
+    def test_dirty_container_gets_no_baseline_once_its_layer_has_history(self):
+        fake = DirtyDocker(Lab().containers, latency=0, jitter=0)
+        trainer = fake_trainer(fake)
+        self.assertIn("server", trainer.baselines)
+        self.assertEqual(trainer.catalog.by_layer, {})
+        created_before(3, "IP Conflict", "server")
+        fake.generation += 1
+        trainer = AdvancedOsiTrainer(backend="fake", docker_api=fake)
+        self.assertNotIn("server", trainer.baselines)
+        self.assertIn("client", trainer.baselines)
+        self.assertEqual(list(trainer.catalog.by_layer), [3])
+
+    def test_recreated_container_is_recaptured(self):
+        fake = DirtyDocker(Lab().containers, latency=0, jitter=0)
+        trainer = fake_trainer(fake)
+        trainer.baselines["client"].state["resolv"] = "stale"
+        trainer.save_baselines()
+        self.assertEqual(AdvancedOsiTrainer(backend="fake", docker_api=fake).baselines["client"].state["resolv"],
+                         "stale")
+        fake.generation += 1
+        fresh = AdvancedOsiTrainer(backend="fake", docker_api=fake)
+        self.assertEqual(fresh.baselines["client"].state["resolv"], "nameserver 127.0.0.11")
+        self.assertEqual(fresh.baseline_identities["client"], "fake-client-1:sha256:fake:fake")
+
+
+if __name__ == "__main__":
+    unittest.main()
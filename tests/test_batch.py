@@ -0,0 +1,48 @@
+"""Framed batch scripts and exec_batch"""
+
+import subprocess
+import unittest
+
+from support import fake_trainer
+
+from osi_trainer import FakeDocker, Lab, frame_script, parse_frames
+
+
+class FramesTest(unittest.TestCase):
+
+    def test_round_trip_through_sh(self):
+        token = "f" * 32
+        commands = ["echo one", "echo oops >&2; exit 3", "printf 'a\\nb\\n'", "true"]
+        output = subprocess.run(["sh", "-c", frame_script(commands, token)],
+                                capture_output=True, text=True, check=True).stdout
+        self.assertEqual(parse_frames(output, token),
+                         [(0, "one", ""), (3, "", "oops"), (0, "a\nb", ""), (0, "", "")])
+
+    def test_truncated_output_drops_the_open_frame(self):
+        token = "t" * 32
+        output = f"done\n{token} 0\n\n{token}\nhalf\n{token} 1\nerr"
+        self.assertEqual(parse_frames(output, token), [(0, "done", "")])
+
+
+class ExecBatchTest(unittest.TestCase):
+
+    def test_one_exec_for_the_whole_batch(self):
+        trainer = fake_trainer()
+        execs = trainer.docker_api.execs
+        steps = trainer.exec_batch("client", ["echo test", "ip link set eth0 up", "cat /etc/resolv.conf"],
+                                   cache=False)
+        self.assertEqual(trainer.docker_api.execs - execs, 1)
+        self.assertEqual([(step.command, step.code, step.stdout) for step in steps],
+                         [("echo test", 0, "test"), ("ip link set eth0 up", 0, ""),
+                          ("cat /etc/resolv.conf", 0, "nameserver 127.0.0.11")])
+
+    def test_failed_exec_fails_every_step(self):
+        trainer = fake_trainer()
+        trainer.docker_api = FakeDocker(Lab().containers, latency=0, jitter=0, failure_rate=1.0)
+        steps = trainer.exec_batch("client", ["echo test", "true"], cache=False)
+        self.assertEqual([(step.success, step.code) for step in steps], [(False, None), (False, None)])
+        self.assertIn("injected failure", steps[1].stderr)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,46 @@
+"""The bench command and its percentiles"""
+
+import contextlib
+import io
+import json
+import os
+import tempfile
+import unittest
+from pathlib import Path
+
+import support  # noqa: F401
+
+from osi_trainer import parse_args, percentile, run_bench
+
+
+class PercentileTest(unittest.TestCase):
+
+    def test_nearest_rank(self):
+        values = list(range(1, 11))
+        self.assertEqual(percentile(values, 50), 5)
+        self.assertEqual(percentile(values, 90), 9)
+        self.assertEqual(percentile(values, 95), 10)
+        self.assertEqual(percentile(values, 0), 1)
+        self.assertEqual(percentile([7], 99), 7)
+
+
+class RunBenchTest(unittest.TestCase):
+
+    def test_report_and_environment(self):
+        home = os.environ["HOME"]
+        output = Path(tempfile.mkdtemp()) / "bench.json"
+        args = parse_args(["bench", "--runs", "2", "--latency", "0", "--jitter", "0", "--history", "10",
+                           "--output", str(output)])
+        with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()) as err:
+            self.assertEqual(run_bench(args), 0)
+        self.assertEqual(os.environ["HOME"], home)
+        self.assertEqual(err.getvalue(), "")
+        operations = json.loads(output.read_text())["operations"]
+        self.assertEqual(set(operations), {"startup", "create_scenario", "reset_all_containers",
+                                           "comprehensive_diagnostics", "auto_troubleshoot_demo", "save_stats"})
+        self.assertEqual(operations["auto_troubleshoot_demo"]["execs_per_run"], 1)
+        self.assertTrue(all(op["runs"] == 2 for op in operations.values()))
+
+
+if __name__ == "__main__":
+    unittest.main()
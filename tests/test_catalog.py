@@ -0,0 +1,83 @@
+"""Issue catalog sampling and capability-aware scenario building"""
+
+import random
+import unittest
+
+from support import fake_trainer
+
+from osi_trainer import CatalogError, FakeDocker, FaultPacks, IssueCatalog, Lab, default_fault_dirs
+
+
+class IssueCatalogTest(unittest.TestCase):
+
+    def setUp(self):
+        self.catalog = IssueCatalog(FaultPacks(default_fault_dirs()))
+
+    def test_sample_draws_without_replacement(self):
+        for seed in range(20):
+            picks = self.catalog.sample([4, 6, 7], "client", 5, {}, random.Random(seed))
+            ids = [issue["id"] for _, issue in picks]
+            self.assertEqual(len(ids), len(set(ids)))
+            self.assertEqual(len(ids), 5)
+
+    def test_sample_stops_when_the_pool_runs_dry(self):
+        picks = self.catalog.sample([6], "client", 10, {}, random.Random(1))
+        self.assertEqual(sorted(issue["id"] for _, issue in picks), ["l6-bad-certs-folder", "l6-wrong-encoding"])
+        self.assertEqual(self.catalog.sample([6], "client", 3, {}, exclude={"l6-bad-certs-folder",
+                                                                           "l6-wrong-encoding"}), [])
+
+    def test_sample_respects_traits_and_difficulty(self):
+        traits = {"tc": False}
+        for seed in range(20):
+            for layer, issue in self.catalog.sample([1], "client", 3, traits, random.Random(seed), max_difficulty=2):
+                self.assertNotIn("tc", issue.get("requires", []))
+                self.assertLessEqual(issue.get("difficulty", 1), 2)
+
+    def test_impossible_request_explains_what_is_missing(self):
+        with self.assertRaises(CatalogError) as caught:
+            self.catalog.sample([3, 4], "router", 2, {"ip": False, "iptables": False, "NET_ADMIN": False})
+        message = str(caught.exception)
+        self.assertIn("no issue can be injected into router", message)
+        self.assertIn("layer 3 needs NET_ADMIN, ip", message)
+        self.assertIn("layer 4 needs NET_ADMIN, iptables", message)
+
+
+class NoTcDocker(FakeDocker):
+    """FakeDocker whose containers have no tc binary"""
+
+    def respond(self, container, command):
+        if command == "which tc":
+            return 1, ""
+        return super().respond(container, command)
+
+
+class FlakyProbeDocker(FakeDocker):
+    """FakeDocker whose first capability probe fails at the daemon"""
+
+    failed = False
+
+    def exec_run(self, container, cmd, timeout=None, env=None):
+        if not self.failed and "which tc" in cmd[-1]:
+            self.failed = True
+            return False, "", "Error response from daemon: container is restarting"
+        return super().exec_run(container, cmd, timeout, env)
+
+
+class BuildScenarioTraitsTest(unittest.TestCase):
+
+    def test_capabilities_are_probed_before_sampling(self):
+        trainer = fake_trainer(NoTcDocker(Lab().containers, latency=0, jitter=0))
+        result = trainer.build_scenario([1], "client", num_issues=7, seed=3)
+        self.assertEqual(sorted(issue["id"] for issue in result["issues"]),
+                         ["l1-interface-down", "l1-interface-promiscuous", "l1-wrong-mtu-500"])
+        self.assertIs(trainer.container_traits("client")["tc"], False)
+
+    def test_failed_probe_is_not_cached(self):
+        trainer = fake_trainer(FlakyProbeDocker(Lab().containers, latency=0, jitter=0))
+        self.assertNotIn("tc", trainer.container_traits("client", probe=True))
+        self.assertIs(trainer.container_traits("client", probe=True)["tc"], True)
+        self.assertIs(trainer.container_traits("client")["tc"], True)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,60 @@
+"""compile_command: when a command can run as plain argv"""
+
+import unittest
+
+from support import fake_trainer
+
+from osi_trainer import FakeDocker, Lab, compile_command
+
+
+class CompileCommandTest(unittest.TestCase):
+
+    def test_plain_commands_run_as_argv(self):
+        compiled = compile_command("ip -4 addr show 'eth0'")
+        self.assertFalse(compiled.needs_shell)
+        self.assertEqual(compiled.argv, ("ip", "-4", "addr", "show", "eth0"))
+        self.assertFalse(compile_command("grep -q 'a*b' /etc/hosts").needs_shell)
+
+    def test_shell_features_need_a_shell(self):
+        for command in ["ls /tmp/*.err", "cat ~/.profile", "echo {a,b}", "ls file?",
+                        "echo $HOME", "echo `id`", "ping -c1 x | grep ttl", "true && false",
+                        "cd /tmp", "FOO=1 env", "echo 'unbalanced"]:
+            with self.subTest(command=command):
+                self.assertTrue(compile_command(command).needs_shell)
+
+
+class RecordingDocker(FakeDocker):
+    """FakeDocker that keeps the argv of every exec"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.argvs = []
+
+    def exec_run(self, container, cmd, timeout=None, env=None):
+        self.argvs.append(list(cmd))
+        return super().exec_run(container, cmd, timeout=timeout, env=env)
+
+
+class ExecCompileTest(unittest.TestCase):
+
+    def setUp(self):
+        self.fake = RecordingDocker(Lab().containers, latency=0, jitter=0, seed=1)
+        self.trainer = fake_trainer(self.fake)
+        self.addCleanup(self.trainer.close_sessions)
+
+    def test_argv_and_shell_commands(self):
+        self.trainer.exec_container("client", "ip -4 addr show eth0", cache=False)
+        self.trainer.exec_container("client", "ip -4 addr show eth0 | grep inet", cache=False)
+        self.assertEqual(self.fake.argvs[-2:], [["ip", "-4", "addr", "show", "eth0"],
+                                                ["sh", "-c", "ip -4 addr show eth0 | grep inet"]])
+
+    def test_repeated_commands_are_tokenized_once(self):
+        command = "cat /etc/hostname-" + self.id()
+        self.trainer.exec_container("client", command, cache=False)
+        misses = compile_command.cache_info().misses
+        self.trainer.exec_container("client", command, cache=False)
+        self.assertEqual(compile_command.cache_info().misses, misses)
+
+
+if __name__ == "__main__":
+    unittest.main()
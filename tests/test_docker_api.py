@@ -0,0 +1,115 @@
+"""DockerAPIClient against a stand-in Engine API on a unix socket"""
+
+import json
+import os
+import socketserver
+import sys
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import osi_trainer
+
+
+def frame(stream, data):
+    """One chunk of a multiplexed attach stream"""
+    return bytes([stream, 0, 0, 0]) + len(data).to_bytes(4, "big") + data
+
+
+class FakeEngine(BaseHTTPRequestHandler):
+    """Answers the exec endpoints the trainer uses, keeping connections alive"""
+
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        self.server.connections += 1
+
+    def log_message(self, *args):
+        pass
+
+    def reply(self, status, body, content_type="application/json"):
+        data = body if isinstance(body, bytes) else json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == "/_ping":
+            self.reply(200, b"OK", "text/plain")
+        elif self.path.startswith("/exec/") and self.path.endswith("/json"):
+            exec_id = self.path.split("/")[2]
+            self.reply(200, {"ExitCode": self.server.execs[exec_id]["code"]})
+        else:
+            self.reply(404, {"message": "page not found"})
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        parts = self.path.split("/")
+        if parts[1] == "containers" and parts[3] == "exec":
+            if parts[2] != "client":
+                self.reply(404, {"message": f"No such container: {parts[2]}"})
+                return
+            exec_id = f"exec{len(self.server.execs)}"
+            cmd = body["Cmd"]
+            code = 0 if cmd[0] != "false" else 1
+            self.server.execs[exec_id] = {"cmd": cmd, "env": body.get("Env"), "code": code}
+            self.reply(201, {"Id": exec_id})
+        elif parts[1] == "exec" and parts[3] == "start":
+            cmd = self.server.execs[parts[2]]["cmd"]
+            stream = frame(1, b"out: ") + frame(2, b"err\n") + frame(1, " ".join(cmd).encode() + b"\n")
+            self.reply(200, stream, "application/vnd.docker.raw-stream")
+        else:
+            self.reply(404, {"message": "page not found"})
+
+
+class DockerAPIClientTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.socket_path = os.path.join(self.tmp, "docker.sock")
+        self.server = socketserver.ThreadingUnixStreamServer(self.socket_path, FakeEngine)
+        self.server.daemon_threads = True
+        self.server.connections = 0
+        self.server.execs = {}
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.client = osi_trainer.DockerAPIClient(self.socket_path, pool_size=2)
+
+    def tearDown(self):
+        self.client.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_exec_run_demuxes_streams_and_reads_exit_code(self):
+        success, out, err = self.client.exec_run("client", ["echo", "hi"], env=["OSI_EXEC=abc"])
+        self.assertTrue(success)
+        self.assertEqual(out, "out: echo hi")
+        self.assertEqual(err, "err")
+        self.assertEqual(self.server.execs["exec0"]["env"], ["OSI_EXEC=abc"])
+        self.assertFalse(self.client.exec_run("client", ["false"])[0])
+
+    def test_connections_are_reused(self):
+        self.assertTrue(self.client.ping())
+        for _ in range(5):
+            self.client.exec_run("client", ["true"])
+        self.assertEqual(self.server.connections, 1)
+
+    def test_error_status_raises_with_message(self):
+        with self.assertRaises(osi_trainer.DockerAPIError) as caught:
+            self.client.exec_run("missing", ["true"])
+        self.assertEqual(caught.exception.status, 404)
+        self.assertIn("No such container", str(caught.exception))
+
+    def test_demux_keeps_stream_order(self):
+        data = frame(1, b"a") + frame(2, b"x") + frame(1, b"b")
+        self.assertEqual(osi_trainer.DockerAPIClient.demux(data), (b"ab", b"x"))
+
+
+if __name__ == "__main__":
+    unittest.main()
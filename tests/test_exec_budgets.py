@@ -0,0 +1,92 @@
+"""Exec budgets and limits: command classes, the exec limiter and orphan cleanup"""
+
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from support import fake_trainer, local_docker_path
+
+from osi_trainer import ExecBudgets, ExecLimiter
+
+
+class BudgetClassifyTest(unittest.TestCase):
+
+    def test_budget_classes(self):
+        self.assertEqual(ExecBudgets.classify("echo ok"), "liveness")
+        self.assertEqual(ExecBudgets.classify("echo nameserver 1.1.1.1 > /etc/resolv.conf"), "write")
+        self.assertEqual(ExecBudgets.classify("apk add curl"), "install")
+        self.assertEqual(ExecBudgets.classify("echo ok | grep ok"), "read")
+
+
+class LocalDocker:
+    """docker_api stand-in that runs argv on this host"""
+
+    def close(self):
+        pass
+
+    def exec_run(self, container, cmd, timeout=None, env=None):
+        result = subprocess.run(cmd, capture_output=True, text=True, timeout=timeout)
+        return result.returncode == 0, result.stdout, result.stderr
+
+
+@unittest.skipUnless(sys.platform.startswith("linux"), "needs /proc")
+class KillOrphansTest(unittest.TestCase):
+
+    def alive(self, pid):
+        try:
+            return Path(f"/proc/{pid}/status").read_text().find("State:\tZ") < 0
+        except OSError:
+            return False
+
+    def test_only_the_timed_out_exec_is_killed(self):
+        marker = "test" + os.urandom(8).hex()
+        pid_dir = Path(tempfile.mkdtemp())
+        pid_file, child_file = pid_dir / "daemon.pid", pid_dir / "child.pid"
+        # A daemon an earlier step started: no marker, reparented when its step ended
+        subprocess.run(["sh", "-c", f"( unset OSI_EXEC; sleep 30 & echo $! > {pid_file} )"], check=True)
+        daemon = int(pid_file.read_text())
+        hung = subprocess.Popen(["sh", "-c", f"sleep 30 & echo $! > {child_file}; sleep 30; wait"],
+                                env=dict(os.environ, OSI_EXEC=marker))
+        try:
+            time.sleep(0.2)
+            trainer = fake_trainer(LocalDocker())
+            trainer.kill_orphans("local", marker, "sh")
+            hung.wait(timeout=5)
+            self.assertFalse(self.alive(int(child_file.read_text())))
+            self.assertTrue(self.alive(daemon))
+        finally:
+            hung.kill()
+            subprocess.run(["kill", "-9", str(daemon)], capture_output=True)
+
+
+class SessionLimiterTest(unittest.TestCase):
+
+    def test_session_commands_wait_for_a_slot(self):
+        limiter = ExecLimiter(max_concurrent=1)
+        trainer = fake_trainer(limiter=limiter)
+        self.addCleanup(trainer.close_sessions)
+        trainer.session_mode = True
+        results = []
+        with mock.patch.dict(os.environ, {"PATH": local_docker_path()}):
+            with limiter.slot():
+                worker = threading.Thread(
+                    target=lambda: results.append(trainer.exec_container("client", "echo $((6 * 7))", cache=False)))
+                worker.start()
+                deadline = time.monotonic() + 5
+                while limiter.snapshot()["queue_depth"] == 0 and time.monotonic() < deadline:
+                    time.sleep(0.01)
+                self.assertEqual(limiter.snapshot()["queue_depth"], 1)
+                self.assertEqual(results, [])
+            worker.join(10)
+        self.assertEqual(results, [(True, "42", "")])
+        self.assertIn(("client", "sh"), trainer.sessions)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,62 @@
+"""ExecCache: command classes and results shared between single execs and batches"""
+
+import unittest
+
+from support import fake_trainer
+
+from osi_trainer import ExecCache, FakeDocker
+
+
+class ClassifyTest(unittest.TestCase):
+
+    def test_exec_cache_classes(self):
+        cases = {
+            "cat /etc/resolv.conf": "read",
+            "ip -4 addr show eth0": "read",
+            "iptables -L -n": "read",
+            "ping -c 1 172.19.0.2": "probe",
+            "ip link set eth0 down": "write",
+            "iptables -A INPUT -j DROP": "write",
+            "echo nameserver 1.1.1.1 > /etc/resolv.conf": "write",
+            "cat /etc/hosts 2>/dev/null | grep server": "read",
+        }
+        for command, kind in cases.items():
+            with self.subTest(command=command):
+                self.assertEqual(ExecCache.classify(command), kind)
+
+
+class ExecCacheShapeTest(unittest.TestCase):
+
+    def setUp(self):
+        self.fake = FakeDocker({"client": "172.19.0.3"}, latency=0, jitter=0, seed=1)
+        self.trainer = fake_trainer(self.fake)
+
+    def tearDown(self):
+        self.trainer.close_sessions()
+
+    def test_batch_result_served_to_exec_container(self):
+        steps = self.trainer.exec_batch("client", ["cat /etc/resolv.conf"])
+        execs = self.fake.execs
+        self.assertEqual(self.trainer.exec_container("client", "cat /etc/resolv.conf"),
+                         (True, "nameserver 127.0.0.11", ""))
+        self.assertEqual(steps[0].stdout, "nameserver 127.0.0.11")
+        self.assertEqual(self.fake.execs, execs)
+
+    def test_exec_container_result_served_to_batch(self):
+        self.trainer.exec_container("client", "cat /etc/resolv.conf")
+        execs = self.fake.execs
+        step, = self.trainer.exec_batch("client", ["cat /etc/resolv.conf"])
+        self.assertEqual((step.success, step.code, step.stdout, step.stderr),
+                         (True, 0, "nameserver 127.0.0.11", ""))
+        self.assertEqual(self.fake.execs, execs)
+
+    def test_writes_invalidate_cached_reads(self):
+        self.trainer.exec_container("client", "cat /etc/resolv.conf")
+        self.trainer.exec_container("client", "echo nameserver 1.1.1.1 > /etc/resolv.conf")
+        execs = self.fake.execs
+        self.trainer.exec_container("client", "cat /etc/resolv.conf")
+        self.assertEqual(self.fake.execs, execs + 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
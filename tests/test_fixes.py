@@ -0,0 +1,71 @@
+"""Injection checks, fix detection and resets"""
+
+import contextlib
+import io
+import unittest
+
+from support import fake_trainer
+
+from osi_trainer import FakeDocker, Lab
+
+
+class ReadOnlyProcDocker(FakeDocker):
+    """FakeDocker where writing /proc/sys exits 0 but changes nothing"""
+
+    def respond(self, container, command):
+        if command.startswith("sh -c 'echo 999999 > /proc/sys/"):
+            return 0, ""
+        return super().respond(container, command)
+
+
+class BuildScenarioTest(unittest.TestCase):
+
+    def test_injection_without_effect_is_skipped(self):
+        trainer = fake_trainer(ReadOnlyProcDocker(Lab().containers, latency=0, jitter=0))
+        result = trainer.build_scenario([5, 6], "client", num_issues=3, seed=1)
+        self.assertEqual(sorted(issue["id"] for issue in result["issues"]),
+                         ["l6-bad-certs-folder", "l6-wrong-encoding"])
+        self.assertEqual(result["skipped"], [{"layer": 5, "issue": "TCP Keepalive Disabled",
+                                              "error": "injection had no effect"}])
+        self.assertEqual(trainer.stats["by_layer"][5]["created"], 0)
+        self.assertEqual(trainer.stats["by_layer"][6]["created"], 2)
+
+    def test_failed_picks_are_replaced(self):
+        trainer = fake_trainer(ReadOnlyProcDocker(Lab().containers, latency=0, jitter=0))
+        result = trainer.build_scenario([5, 6, 7], "client", num_issues=3, seed=1)
+        self.assertEqual(len(result["issues"]), 3)
+        self.assertNotIn("l5-tcp-keepalive-disabled", [issue["id"] for issue in result["issues"]])
+
+
+class CheckFixesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.trainer = fake_trainer()
+        self.trainer.current_issues = self.trainer.build_scenario([4, 6], "server", num_issues=3, seed=2)["issues"]
+        self.assertEqual(len(self.trainer.current_issues), 3)
+
+    def test_only_fixed_issues_are_counted(self):
+        self.assertEqual(self.trainer.check_fixes(), [])
+        issue = self.trainer.current_issues[1]
+        self.trainer.exec_batch("server", [self.trainer.get_fix_command(issue)])
+        self.assertEqual(self.trainer.check_fixes(), [issue])
+        self.assertEqual(self.trainer.check_fixes(), [])
+        self.assertFalse(self.trainer.mark_fixed(issue))
+        self.assertEqual(len(self.trainer.open_issues()), 2)
+        self.assertEqual(self.trainer.stats["issues_fixed"], 1)
+        self.assertEqual(self.trainer.stats_store.summary()["overall"]["fixed"], 1)
+
+    def test_reset_closes_issues_without_counting_fixes(self):
+        issues = list(self.trainer.current_issues)
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.trainer.reset_all_containers()
+        for issue in issues:
+            self.trainer.exec_batch("server", [self.trainer.get_fix_command(issue)])
+        self.assertEqual(self.trainer.open_issues(), [])
+        self.assertEqual(self.trainer.check_fixes(), [])
+        self.assertFalse(self.trainer.mark_fixed(issues[0]))
+        self.assertEqual(self.trainer.stats["issues_fixed"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
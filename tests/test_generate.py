@@ -0,0 +1,48 @@
+"""Headless generate output"""
+
+import contextlib
+import functools
+import io
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from support import created_before
+
+import osi_trainer
+from osi_trainer import FakeDocker, Lab, parse_args, run_generate
+
+
+class DirtyServerDocker(FakeDocker):
+    """FakeDocker whose server still carries IP Conflict, so it gets no baseline"""
+
+    def respond(self, container, command):
+        if container == "server" and "inet 172.19.0.2/24" in command:
+            return 1, ""
+        return super().respond(container, command)
+
+
+class GenerateTest(unittest.TestCase):
+
+    def test_json_output_stays_parseable_with_startup_warnings(self):
+        os.environ["HOME"] = tempfile.mkdtemp(prefix="osi_test_home_")
+        created_before(3, "IP Conflict", "server")
+        fake = DirtyServerDocker(Lab().containers, latency=0, jitter=0)
+        args = parse_args(["generate", "--format", "json", "--seed", "5", "--containers", "client,server",
+                           "--issues", "2"])
+        out, err = io.StringIO(), io.StringIO()
+        with mock.patch.object(osi_trainer, "AdvancedOsiTrainer",
+                               functools.partial(osi_trainer.AdvancedOsiTrainer, docker_api=fake)), \
+                contextlib.redirect_stdout(out), contextlib.redirect_stderr(err):
+            code = run_generate(args, [Lab()])
+        report = json.loads(out.getvalue())
+        self.assertEqual(code, 0)
+        self.assertEqual([s["container"] for s in report["scenarios"]], ["client", "server"])
+        self.assertEqual([len(s["issues"]) for s in report["scenarios"]], [2, 2])
+        self.assertIn("Warning: no baseline for server", err.getvalue())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,90 @@
+"""Lab addressing, translation and provisioning"""
+
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from support import fake_trainer
+
+from osi_trainer import FakeDocker, Lab, LabManager
+
+
+class LabTest(unittest.TestCase):
+
+    def test_default_lab_keeps_the_setup_addresses(self):
+        lab = Lab()
+        self.assertEqual((lab.name, lab.prefix), ("default", ""))
+        self.assertEqual(lab.containers["server"], "172.19.0.2")
+        self.assertEqual(lab.containers["osi-server"], "172.18.0.4")
+        self.assertEqual(lab.translate("ping 172.19.0.2"), "ping 172.19.0.2")
+
+    def test_numbered_labs_get_their_own_subnets(self):
+        lab = Lab(3)
+        self.assertEqual(lab.docker_name("client"), "lab3-client")
+        self.assertEqual((lab.subnet("main"), lab.subnet("osi")), ("10.6.0.0/16", "10.7.0.0/16"))
+        self.assertEqual(lab.containers["router"], "10.6.0.4")
+        self.assertEqual(lab.network_name("osi"), "lab3-osi-network")
+
+    def test_translate_rewrites_only_lab_addresses(self):
+        lab = Lab(1)
+        self.assertEqual(lab.translate("ip route add 172.18.0.0/16 via 172.19.0.4"),
+                         "ip route add 10.3.0.0/16 via 10.2.0.4")
+        self.assertEqual(lab.translate("ip route add 10.0.0.0/24 via 172.19.0.99"),
+                         "ip route add 10.0.0.0/24 via 10.2.0.99")
+        self.assertEqual(lab.translate("echo 1172.19.0.2"), "echo 1172.19.0.2")
+
+
+class RecordingDocker(FakeDocker):
+    """FakeDocker that remembers which container every command went to"""
+
+    def __init__(self, containers):
+        super().__init__(containers, latency=0, jitter=0)
+        self.seen = []
+
+    def respond(self, container, command):
+        self.seen.append((container, command))
+        return super().respond(container, command)
+
+
+class LabTrainerTest(unittest.TestCase):
+
+    def test_trainer_drives_the_lab_containers_with_translated_commands(self):
+        lab = Lab(2, "ready")
+        fake = RecordingDocker({lab.docker_name(role): ip for role, ip in lab.containers.items()})
+        trainer = fake_trainer(fake, lab=lab)
+        self.assertEqual(trainer.containers["server"], "10.4.0.2")
+        self.assertTrue(trainer.baseline_file.name.endswith(".lab2.json"))
+        fake.seen.clear()
+        trainer.exec_batch("client", ["ping -c 1 172.19.0.2", "curl -s http://172.18.0.4:8080"], cache=False)
+        self.assertEqual(fake.seen, [("lab2-client", "ping -c 1 10.4.0.2"),
+                                     ("lab2-client", "curl -s http://10.5.0.4:8080")])
+
+
+class LabManagerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.manager = LabManager(Path(tempfile.mkdtemp()) / "labs.json")
+
+    def test_allocate_takes_free_indices_and_persists(self):
+        first = self.manager.allocate(2)
+        self.manager.labs.pop("lab1")
+        again = self.manager.allocate(2)
+        self.assertEqual([lab.index for lab in first], [1, 2])
+        self.assertEqual([lab.index for lab in again], [1, 3])
+        self.assertEqual(sorted(LabManager(self.manager.registry_path).labs), ["lab1", "lab2", "lab3"])
+
+    def test_provision_uses_the_lab_subnets(self):
+        calls = []
+        with mock.patch.object(LabManager, "docker", side_effect=lambda *args, **kw: calls.append(args)), \
+                mock.patch.object(LabManager, "wait_ready", return_value=True):
+            lab, = self.manager.create(1)
+        self.assertEqual(lab.value.state, "ready")
+        self.assertIn(("network", "create", "--subnet=10.2.0.0/16", "lab1-main-network"), calls)
+        run_server = next(args for args in calls if args[:4] == ("run", "-d", "--name", "lab1-server"))
+        self.assertIn("--ip=10.2.0.2", run_server)
+        self.assertIn(("exec", "lab1-client", "ip", "route", "replace", "10.3.0.0/16", "via", "10.2.0.4"), calls)
+
+
+if __name__ == "__main__":
+    unittest.main()
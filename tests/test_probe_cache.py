@@ -0,0 +1,81 @@
+"""On-disk probe cache and shell detection"""
+
+import socket
+import tempfile
+import unittest
+from pathlib import Path
+
+from support import fake_trainer
+
+from osi_trainer import AdvancedOsiTrainer, FakeDocker, Lab, ProbeCache
+
+
+class ProbeCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.path = Path(tempfile.mkdtemp()) / "probes.json"
+
+    def test_entries_survive_a_reload_while_the_identity_holds(self):
+        cache = ProbeCache(self.path)
+        cache.put("client", "id1", "shell", "sh")
+        cache.put("client", "id1", "capabilities", {"ip": True})
+        cache.save()
+        reloaded = ProbeCache(self.path)
+        self.assertEqual(reloaded.get("client", "id1", "shell"), "sh")
+        self.assertIsNone(reloaded.get("client", "id2", "shell"))
+        self.assertIsNone(reloaded.get("client", None, "shell"))
+
+    def test_new_identity_drops_every_field(self):
+        cache = ProbeCache(self.path)
+        cache.put("client", "id1", "shell", "sh")
+        cache.put("client", "id2", "capabilities", {"ip": True})
+        self.assertIsNone(cache.get("client", "id2", "shell"))
+        self.assertEqual(cache.get("client", "id2", "capabilities"), {"ip": True})
+
+    def test_invalidate_one_field_or_the_container(self):
+        cache = ProbeCache(self.path)
+        cache.put("client", "id1", "shell", "sh")
+        cache.put("client", "id1", "capabilities", {"ip": True})
+        cache.invalidate("client", "capabilities")
+        self.assertIsNone(cache.get("client", "id1", "capabilities"))
+        self.assertEqual(cache.get("client", "id1", "shell"), "sh")
+        cache.invalidate("client")
+        self.assertIsNone(cache.get("client", "id1", "shell"))
+
+
+class ShellProbeDocker(FakeDocker):
+    """FakeDocker whose shell probes fail in a chosen way for some containers"""
+
+    def __init__(self, failures):
+        super().__init__(Lab().containers, latency=0, jitter=0)
+        self.failures = dict(failures)
+
+    def exec_run(self, container, cmd, timeout=None, env=None):
+        failure = self.failures.get(container)
+        if cmd == ["sh", "-c", "echo test"] and failure is not None:
+            if failure == "timeout":
+                raise socket.timeout("timed out")
+            return False, failure, ""
+        return super().exec_run(container, cmd, timeout, env)
+
+
+class DetectShellsTest(unittest.TestCase):
+
+    def test_transient_failure_is_not_remembered(self):
+        trainer = fake_trainer(ShellProbeDocker({"client": "timeout", "server": "Error response from daemon"}))
+        self.assertEqual(trainer.container_shells["client"], "sh")
+        self.assertEqual(trainer.container_shells["server"], "sh")
+        healthy = AdvancedOsiTrainer(backend="fake", docker_api=ShellProbeDocker({}))
+        self.assertEqual(healthy.container_shells["client"], "sh")
+        self.assertTrue(healthy.exec_container("client", "echo test | cat")[0])
+
+    def test_missing_shell_is_remembered(self):
+        missing = 'OCI runtime exec failed: exec: "sh": executable file not found in $PATH: unknown'
+        trainer = fake_trainer(ShellProbeDocker({"router": missing}))
+        self.assertEqual(trainer.container_shells["router"], "direct")
+        again = AdvancedOsiTrainer(backend="fake", docker_api=ShellProbeDocker({}))
+        self.assertEqual(again.container_shells["router"], "direct")
+
+
+if __name__ == "__main__":
+    unittest.main()
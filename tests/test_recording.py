@@ -0,0 +1,84 @@
+"""Scenario recordings: capture, serialization, compiled scripts and replay"""
+
+import unittest
+from unittest import mock
+
+from support import fake_trainer
+
+from osi_trainer import FakeDocker, Lab, RecordingError, ScenarioRecording
+
+
+class ScenarioRecordingTest(unittest.TestCase):
+
+    def recording(self):
+        return ScenarioRecording(7, [3, 1], {"client": [
+            {"id": "l1-interface-down", "layer": 1, "name": "Interface Down", "inject": "ip link set eth0 down",
+             "fix": "ip link set eth0 up", "verify": "ip link show eth0 | grep -q 'state UP'"},
+            {"id": "x", "layer": 3, "name": "X", "inject": "ip route del default", "fix": "true", "verify": ""},
+        ]})
+
+    def test_round_trip(self):
+        recording = self.recording()
+        copy = ScenarioRecording.from_dict(recording.to_dict())
+        self.assertEqual((copy.seed, copy.layers, copy.containers, copy.created),
+                         (7, [1, 3], recording.containers, recording.created))
+
+    def test_malformed_recordings_are_rejected(self):
+        data = self.recording().to_dict()
+        bad = [dict(data, version=2), dict(data, containers=[]), dict(data, containers={"client": {}}),
+               dict(data, containers={"client": [{"id": "x"}]}), []]
+        for case in bad:
+            with self.subTest(case=case), self.assertRaises(RecordingError):
+                ScenarioRecording.from_dict(case)
+
+    def test_scripts_are_compiled_once_in_injection_order(self):
+        recording = self.recording()
+        scripts = recording.compile()
+        commands, script, token = scripts["client"]
+        self.assertEqual(commands, ["ip link set eth0 down", "ip route del default"])
+        self.assertIn(token, script)
+        self.assertIs(recording.compile(), scripts)
+
+
+class ReplayTest(unittest.TestCase):
+
+    def setUp(self):
+        self.fake = FakeDocker(Lab().containers, latency=0, jitter=0, seed=1)
+        self.trainer = fake_trainer(self.fake)
+        self.addCleanup(self.trainer.close_sessions)
+
+    def staged(self):
+        report = self.trainer.generate_scenarios([1, 3], ["client", "server"], 2, seed=4)
+        return ScenarioRecording.capture(self.trainer.catalog, report["seed"], report["layers"],
+                                         self.trainer.current_issues)
+
+    def test_replay_restages_the_same_faults_with_one_exec_per_container(self):
+        recording = self.staged()
+        self.trainer.reset_all_containers()
+        execs = self.fake.execs
+        report = self.trainer.replay_scenario(recording)
+        self.assertEqual(self.fake.execs - execs, 2)
+        self.assertEqual(report["seed"], 4)
+        for scenario in report["scenarios"]:
+            self.assertEqual([issue["issue"] for issue in scenario["issues"]],
+                             [fault["name"] for fault in recording.containers[scenario["container"]]])
+        self.assertEqual(len(self.trainer.open_issues()), 4)
+        self.assertEqual(self.trainer.check_fixes(), [])
+
+    def test_unknown_container_is_reported(self):
+        recording = self.staged()
+        recording.containers["ghost"] = recording.containers.pop("server")
+        report = self.trainer.replay_scenario(recording)
+        ghost, = [s for s in report["scenarios"] if s["container"] == "ghost"]
+        self.assertEqual((ghost["issues"], ghost["error"]), ([], "Unknown container ghost"))
+
+    def test_recordings_directory_keeps_the_newest(self):
+        recording = self.staged()
+        with mock.patch.object(ScenarioRecording, "KEEP", 2):
+            paths = [self.trainer.save_recording(recording) for _ in range(4)]
+        self.assertEqual(sorted(self.trainer.recordings_dir.glob("*.json")), paths[2:])
+        self.assertEqual(ScenarioRecording.load(paths[-1]).containers, recording.containers)
+
+
+if __name__ == "__main__":
+    unittest.main()
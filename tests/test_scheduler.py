@@ -0,0 +1,41 @@
+"""FaultScheduler: injection order from the faults' needs, provides and breaks"""
+
+import unittest
+
+import support  # noqa: F401
+
+from osi_trainer import FaultPacks, FaultScheduler, IssueCatalog, default_fault_dirs
+
+
+class FaultSchedulerTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.catalog = IssueCatalog(FaultPacks(default_fault_dirs()))
+
+    def fault(self, issue_id):
+        return self.catalog.get(issue_id)[1]
+
+    def names(self, faults):
+        return None if faults is None else [fault["name"] for fault in faults]
+
+    def test_breaker_goes_before_the_fault_it_would_undo(self):
+        ordered = FaultScheduler.order([self.fault("l3-ip-conflict"), self.fault("l3-subnet-flushed")])
+        self.assertEqual(self.names(ordered), ["Subnet Flushed", "IP Conflict"])
+
+    def test_consumer_goes_before_what_breaks_its_needs(self):
+        ordered = FaultScheduler.order([self.fault("l1-interface-down"), self.fault("l3-ip-conflict")])
+        self.assertEqual(len(ordered), 2)
+        unordered = FaultScheduler.order([self.fault("l1-interface-down"), self.fault("l3-wrong-route")])
+        self.assertIsNone(unordered)
+
+    def test_applied_faults_constrain_new_ones(self):
+        applied = [self.fault("l3-wrong-route")]
+        self.assertIsNone(FaultScheduler.order([self.fault("l3-subnet-flushed")], applied))
+        self.assertIsNone(FaultScheduler.order([self.fault("l3-route-loop")], [self.fault("l1-interface-down")]))
+        self.assertEqual(self.names(FaultScheduler.order([self.fault("l3-ip-conflict")], applied)),
+                         ["IP Conflict"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,122 @@
+"""TrainerService endpoints over HTTP, with FakeDocker behind the default lab"""
+
+import asyncio
+import http.client
+import json
+import os
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+
+import support  # noqa: F401
+
+from osi_trainer import FakeDocker, Lab, LabManager, ScenarioRecording, TrainerService
+
+
+class TrainerServiceTest(unittest.TestCase):
+
+    def setUp(self):
+        os.environ["HOME"] = tempfile.mkdtemp(prefix="osi_test_home_")
+        self.fake = FakeDocker(Lab().containers, latency=0, jitter=0, seed=1)
+        manager = LabManager(Path(os.environ["HOME"]) / "labs.json")
+        self.service = TrainerService(manager, {"backend": "fake", "docker_api": self.fake}, workers=4)
+        self.loop = asyncio.new_event_loop()
+        ready = threading.Event()
+
+        def serve():
+            asyncio.set_event_loop(self.loop)
+            self.server = self.loop.run_until_complete(asyncio.start_server(self.service.handle, "127.0.0.1", 0))
+            ready.set()
+            self.loop.run_forever()
+
+        self.thread = threading.Thread(target=serve, daemon=True)
+        self.thread.start()
+        ready.wait(5)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    def tearDown(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(5)
+        self.server.close()
+        self.loop.run_until_complete(self.server.wait_closed())
+        self.loop.close()
+        self.service.close()
+
+    def request(self, method, path, body=None, raw=None):
+        """(status, decoded JSON) of one request"""
+        conn = http.client.HTTPConnection("127.0.0.1", self.port, timeout=10)
+        try:
+            data = raw if raw is not None else (json.dumps(body).encode() if body is not None else None)
+            conn.request(method, path, body=data, headers={"Content-Type": "application/json"})
+            response = conn.getresponse()
+            return response.status, json.loads(response.read())
+        finally:
+            conn.close()
+
+    def test_health_and_labs(self):
+        self.assertEqual(self.request("GET", "/health"), (200, {"status": "ok", "labs": []}))
+        self.assertEqual(self.request("GET", "/labs"), (200, {"labs": [{"name": "default", "state": "ready"}]}))
+        self.request("GET", "/labs/default/issues")
+        self.assertEqual(self.request("GET", "/health")[1]["labs"], ["default"])
+
+    def test_request_errors(self):
+        cases = [
+            ("GET", "/nope", None, None, 404),
+            ("GET", "/labs/nope/issues", None, None, 404),
+            ("GET", "/labs/default/reset", None, None, 405),
+            ("POST", "/labs/default/scenarios", None, b"{not json", 400),
+            ("POST", "/labs/default/scenarios", None, b"[1]", 400),
+            ("POST", "/labs/default/scenarios", {"layers": "9"}, None, 400),
+            ("POST", "/labs/default/scenarios", {"containers": ["ghost"]}, None, 400),
+            ("POST", "/labs/default/replay", {"version": 0}, None, 400),
+        ]
+        for method, path, body, raw, status in cases:
+            with self.subTest(method=method, path=path, body=body or raw):
+                code, payload = self.request(method, path, body, raw)
+                self.assertEqual(code, status)
+                self.assertIn("error", payload)
+
+    def test_scenario_check_and_reset(self):
+        status, report = self.request("POST", "/labs/default/scenarios",
+                                      {"layers": "1", "issues": 1, "containers": ["client"], "seed": 3})
+        self.assertEqual(status, 200)
+        self.assertEqual((report["seed"], report["layers"]), (3, [1]))
+        scenario, = report["scenarios"]
+        self.assertEqual((scenario["container"], len(scenario["issues"])), ("client", 1))
+
+        issues = self.request("GET", "/labs/default/issues")[1]["issues"]
+        self.assertEqual([issue["container"] for issue in issues], ["client"])
+        self.assertEqual(self.request("GET", "/stats")[1]["by_layer"]["1"]["created"], 1)
+
+        status, check = self.request("POST", "/labs/default/check")
+        self.assertEqual((status, check["fixed"], len(check["open"])), (200, [], 1))
+
+        status, reset = self.request("POST", "/labs/default/reset")
+        self.assertEqual(status, 200)
+        self.assertEqual(set(reset["containers"]), set(Lab().containers))
+        self.assertTrue(all("applied" in entry for entry in reset["containers"].values()))
+        self.assertEqual(self.request("GET", "/labs/default/issues")[1], {"issues": []})
+        self.assertEqual(self.request("GET", "/stats")[1]["issues_fixed"], 0)
+
+    def test_replay_restages_a_recording(self):
+        self.request("POST", "/labs/default/scenarios", {"layers": "3", "issues": 2, "containers": ["server"],
+                                                         "seed": 11})
+        trainer = self.service.trainers["default"]
+        recording = ScenarioRecording.capture(trainer.catalog, 11, [3], trainer.current_issues)
+        self.request("POST", "/labs/default/reset")
+
+        status, report = self.request("POST", "/labs/default/replay", recording.to_dict())
+        self.assertEqual(status, 200)
+        names = [fault["name"] for fault in recording.containers["server"]]
+        self.assertEqual([issue["issue"] for issue in report["scenarios"][0]["issues"]], names)
+        self.assertEqual(len(self.request("GET", "/labs/default/issues")[1]["issues"]), 2)
+
+    def test_diagnostics(self):
+        status, report = self.request("GET", "/labs/default/diagnostics")
+        self.assertEqual(status, 200)
+        self.assertTrue(report["results"])
+
+
+if __name__ == "__main__":
+    unittest.main()
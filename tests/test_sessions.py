@@ -0,0 +1,53 @@
+"""ShellSession framing and reconnects, with `docker exec` running a local shell"""
+
+import os
+import unittest
+from unittest import mock
+
+from support import local_docker_path
+
+from osi_trainer import ShellSession
+
+
+class ShellSessionTest(unittest.TestCase):
+
+    def setUp(self):
+        patcher = mock.patch.dict(os.environ, {"PATH": local_docker_path()})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.session = ShellSession("client")
+        self.addCleanup(self.session.close)
+
+    def test_commands_share_one_shell(self):
+        self.assertEqual(self.session.run("echo one"), (True, "one", ""))
+        pid = self.session.proc.pid
+        self.assertEqual(self.session.run("echo oops >&2; exit 3"), (False, "", "oops"))
+        self.assertEqual(self.session.run("cd /tmp; pwd"), (True, "/tmp", ""))
+        self.assertEqual(self.session.proc.pid, pid)
+
+    def test_reconnects_after_the_shell_dies(self):
+        self.session.run("true")
+        self.session.proc.kill()
+        self.session.proc.wait()
+        self.assertEqual(self.session.run("echo back"), (True, "back", ""))
+
+    def test_shell_killed_mid_command_reports_and_recovers(self):
+        success, _, err = self.session.run("kill -9 $$")
+        self.assertFalse(success)
+        self.assertIn("closed unexpectedly", err)
+        self.assertEqual(self.session.run("echo back"), (True, "back", ""))
+
+    def test_timeout_drops_the_session(self):
+        success, _, err = self.session.run("sleep 5", timeout=0.3)
+        self.assertFalse(success)
+        self.assertIn("timed out", err)
+        self.assertIsNone(self.session.proc)
+        self.assertEqual(self.session.run("echo back"), (True, "back", ""))
+
+    def test_marker_is_exported_to_the_command_only(self):
+        self.assertEqual(self.session.run("echo $OSI_EXEC", marker="m1"), (True, "m1", ""))
+        self.assertEqual(self.session.run("echo ${OSI_EXEC:-none}"), (True, "none", ""))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,63 @@
+"""Journaled statistics shared between trainer processes"""
+
+import tempfile
+import unittest
+from pathlib import Path
+
+import support  # noqa: F401
+
+from osi_trainer import StatsStore
+
+
+class StatsStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.path = Path(tempfile.mkdtemp()) / "stats.json"
+
+    def record_scenario(self, store, scenario, fixed):
+        store.record("scenario_created")
+        store.record("issue_created", layer=3, issue="l3-wrong-route", container="client", scenario=scenario)
+        if fixed:
+            store.record("issue_fixed", layer=3, issue="l3-wrong-route", container="client",
+                         scenario=scenario, seconds=12)
+
+    def test_two_stores_share_one_journal(self):
+        first, second = StatsStore(self.path), StatsStore(self.path)
+        self.record_scenario(first, "s1", fixed=True)
+        self.record_scenario(second, "s2", fixed=False)
+        first.refresh()
+        self.assertEqual(first.stats["scenarios_created"], 2)
+        self.assertEqual(first.stats["by_layer"][3], {"created": 2, "fixed": 1})
+
+    def test_compaction_keeps_counts_and_analytics(self):
+        store = StatsStore(self.path)
+        for i in range(3):
+            self.record_scenario(store, f"s{i}", fixed=i != 1)
+        before = store.summary()
+        other = StatsStore(self.path)
+        store.compact()
+        self.record_scenario(store, "s3", fixed=True)
+        other.refresh()
+        fresh = StatsStore(self.path)
+        fresh.refresh()
+        for reader in (other, fresh):
+            self.assertEqual(reader.stats["issues_fixed"], 3)
+            self.assertEqual(reader.stats["by_layer"][3]["created"], 4)
+        overall = fresh.summary()["overall"]
+        self.assertEqual(before["overall"]["success_rate"], 66.7)
+        self.assertEqual((overall["created"], overall["fixed"], overall["recent_scenarios"]), (4, 3, 4))
+        self.assertEqual(fresh.summary()["issues"]["l3-wrong-route"]["success_rate"], 75.0)
+
+    def test_torn_tail_is_skipped(self):
+        store = StatsStore(self.path)
+        store.record("scenario_created")
+        with open(store.journal_path, "ab") as f:
+            f.write(b'{"type": "scenario_cre')
+        store.record("scenario_created")
+        fresh = StatsStore(self.path)
+        fresh.refresh()
+        self.assertEqual(fresh.stats["scenarios_created"], 2)
+
+
+if __name__ == "__main__":
+    unittest.main()